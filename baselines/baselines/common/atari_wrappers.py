@@ -2,6 +2,7 @@ from toybox.envs.atari.base import ToyboxBaseEnv
 from baselines.common.vec_env.vec_frame_stack import VecFrameStack
 from baselines.common.vec_env.dummy_vec_env import DummyVecEnv
 from baselines.common.vec_env.subproc_vec_env import SubprocVecEnv
+from baselines.bench import Monitor
 import numpy as np
 import os
 os.environ.setdefault('PATH', '')
@@ -190,6 +191,19 @@ class EpisodicLifeEnv(gym.Wrapper):
         self.lives = self.env.unwrapped.ale.lives()
         return obs
 
+# Get the Toybox env under env if every wrapper in between passes step through
+# unchanged, so that the Toybox env can be stepped directly.
+def get_passthrough_turtle(env):
+    while True:
+        if isinstance(env, ToyboxBaseEnv):
+            return env
+        elif isinstance(env, NoopResetEnv):
+            env = env.env
+        elif isinstance(env, TimeLimit) and env._max_episode_steps is None and env._max_episode_seconds is None:
+            env = env.env
+        else:
+            return None
+
 class MaxAndSkipEnv(gym.Wrapper):
     def __init__(self, env, skip=4):
         """Return only every `skip`-th frame"""
@@ -197,9 +211,13 @@ class MaxAndSkipEnv(gym.Wrapper):
         # most recent raw observations (for max pooling across time steps)
         self._obs_buffer = np.zeros((2,)+env.observation_space.shape, dtype=np.uint8)
         self._skip       = skip
+        # Toybox envs repeat the action natively and only render the pooled frames.
+        self._toybox_env = get_passthrough_turtle(env)
 
     def step(self, action):
         """Repeat action, sum reward, and max over last observations."""
+        if self._toybox_env is not None:
+            return self._toybox_env.step_repeat(action, self._skip, pool_last=2)
         total_reward = 0.0
         done = None
         for i in range(self._skip):
@@ -227,6 +245,30 @@ class ClipRewardEnv(gym.RewardWrapper):
         return np.sign(reward)
 
 
+# SampleEnvs swaps the env beneath it on reset, so the wrappers above it
+# cannot resolve the innermost env once and for all.
+def swaps_envs(env):
+    while isinstance(env, gym.Wrapper):
+        if isinstance(env, SampleEnvs):
+            return True
+        env = env.env
+    return False
+
+# Get the wrappers between env and the Toybox env beneath it, ending with the
+# Toybox env itself, if none of them change the observations passing through.
+def get_obs_passthrough_chain(env):
+    chain = []
+    while True:
+        chain.append(env)
+        if isinstance(env, ToyboxBaseEnv):
+            return chain
+        elif isinstance(env, MaxAndSkipEnv) and env._toybox_env is not None:
+            env = env.env
+        elif isinstance(env, (NoopResetEnv, FireResetEnv, EpisodicLifeEnv, ClipRewardEnv, Monitor, TimeLimit)):
+            env = env.env
+        else:
+            return None
+
 class WarpFrame(gym.ObservationWrapper):
     def __init__(self, env):
         """Warp frames to 84x84 as done in the Nature paper and later work."""
@@ -235,10 +277,30 @@ class WarpFrame(gym.ObservationWrapper):
         self.height = 84
         self.observation_space = spaces.Box(low=0, high=255,
             shape=(self.height, self.width, 1), dtype=np.uint8)
+        # Toybox frames (and any single-channel frames, such as those of
+        # RemoteToyboxEnv) are already grayscale; only check for that once,
+        # unless the innermost env can change underneath us.
+        self._grayscale = None if swaps_envs(env) else (
+            isinstance(get_turtle(env), ToyboxBaseEnv) or env.observation_space.shape[-1] == 1)
+        # When nothing in between touches the frames, Toybox warps them itself.
+        # Not if the caller has set an observation buffer on it, which is
+        # shaped for the frames as rendered.
+        chain = get_obs_passthrough_chain(env)
+        self._native = chain is not None and chain[-1].obs_buffer is None
+        if self._native:
+            turtle = chain[-1]
+            turtle.set_obs_mode('deepmind')
+            # The wrappers in between now pass the warped frames up.
+            for wrapper in chain[:-1]:
+                wrapper.observation_space = turtle.observation_space
 
     def observation(self, frame):
-        env = get_turtle(self)
-        if not isinstance(env, ToyboxBaseEnv):
+        if self._native:
+            return frame
+        grayscale = self._grayscale
+        if grayscale is None:
+            grayscale = isinstance(get_turtle(self), ToyboxBaseEnv)
+        if not grayscale:
             frame = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
         frame = cv2.resize(frame, (self.width, self.height), interpolation=cv2.INTER_AREA)
         return frame[:, :, None]
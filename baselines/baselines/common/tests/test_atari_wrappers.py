@@ -0,0 +1,61 @@
+import gym
+import numpy as np
+import pytest
+from baselines.common.atari_wrappers import make_atari, wrap_deepmind, WarpFrame
+
+
+def make_toybox_env(env_id, native):
+    env = make_atari(env_id, None)
+    if not native:
+        # Wrappers that are not known to pass observations through unchanged
+        # keep the Toybox env from warping frames itself.
+        env = gym.Wrapper(env)
+    return wrap_deepmind(env, frame_stack=True)
+
+
+def get_warp_frame(env):
+    while not isinstance(env, WarpFrame):
+        env = env.env
+    return env
+
+
+@pytest.mark.parametrize('env_id', ('BreakoutToyboxNoFrameskip-v4', 'AmidarToyboxNoFrameskip-v4'))
+def test_native_warp(env_id):
+    """
+    Test that Toybox envs producing DeepMind-style frames themselves
+    match the frames produced by WarpFrame.
+    """
+    env1 = make_toybox_env(env_id, native=False)
+    env2 = make_toybox_env(env_id, native=True)
+    assert env1.observation_space.shape == env2.observation_space.shape
+
+    assert not get_warp_frame(env1)._native
+    assert get_warp_frame(env2)._native
+
+    for env in [env1, env2]:
+        env.unwrapped.seed(0)
+    obs1, obs2 = env1.reset(), env2.reset()
+    assert np.array_equal(np.asarray(obs1), np.asarray(obs2))
+    actions = np.random.RandomState(1337).randint(0, env1.action_space.n, size=200)
+    for action in actions:
+        obs1, rew1, done1, _ = env1.step(action)
+        obs2, rew2, done2, _ = env2.step(action)
+        assert rew1 == rew2
+        assert done1 == done2
+        assert np.array_equal(np.asarray(obs1), np.asarray(obs2))
+        if done1:
+            break
+
+
+def test_native_warp_keeps_obs_buffer():
+    """
+    Test that WarpFrame leaves a Toybox env with an observation buffer as
+    it is, and warps its frames itself.
+    """
+    env = make_atari('BreakoutToyboxNoFrameskip-v4', None)
+    out = np.zeros(env.observation_space.shape, dtype=np.uint8)
+    env.unwrapped.set_obs_buffer(out)
+    env = wrap_deepmind(env)
+    assert not get_warp_frame(env)._native
+    assert env.unwrapped.obs_buffer is out
+    assert env.reset().shape == (84, 84, 1)
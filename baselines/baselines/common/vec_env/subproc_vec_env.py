@@ -5,6 +5,7 @@ from . import VecEnv, CloudpickleWrapper
 def worker(remote, parent_remote, env_fn_wrapper):
     parent_remote.close()
     env = env_fn_wrapper.x()
+    timer = None
     try:
         while True:
             cmd, data = remote.recv()
@@ -21,6 +22,20 @@ def worker(remote, parent_remote, env_fn_wrapper):
             elif cmd == 'close':
                 remote.close()
                 break
+            elif cmd == 'enable_timing':
+                # Only workers that are asked to time import toybox.
+                from toybox.envs.atari import timing
+                timer = timing.instrument(env, timer)
+                remote.send(None)
+            elif cmd == 'disable_timing':
+                from toybox.envs.atari import timing
+                timing.uninstrument(env)
+                remote.send(None)
+            elif cmd == 'get_timing':
+                stats = timer.stats() if timer is not None else {}
+                if data and timer is not None:
+                    timer.reset()
+                remote.send(stats)
             elif cmd == 'get_spaces':
                 remote.send((env.observation_space, env.action_space))
             else:
@@ -96,5 +111,36 @@ class SubprocVecEnv(VecEnv):
         imgs = [pipe.recv() for pipe in self.remotes]
         return imgs
 
+    def enable_timing(self):
+        """
+        Start timing the stages of every worker's env and its wrappers; see toybox.envs.atari.timing.
+        """
+        self._send_all('enable_timing')
+
+    def disable_timing(self):
+        """
+        Stop timing in every worker. Counts gathered so far are kept until the next get_timing.
+        """
+        self._send_all('disable_timing')
+
+    def get_timing(self, aggregate=True, reset=False):
+        """
+        The per-stage counters of the workers' envs: merged across workers, or
+        a list with one dict per env if not aggregate. With reset, the workers'
+        counters restart from zero.
+        """
+        stats = self._send_all('get_timing', reset)
+        if not aggregate:
+            return stats
+        from toybox.envs.atari import timing
+        return timing.merge(stats)
+
+    def _send_all(self, cmd, data=None):
+        self._assert_not_closed()
+        assert not self.waiting, "Cannot send {} while waiting for a step".format(cmd)
+        for remote in self.remotes:
+            remote.send((cmd, data))
+        return [remote.recv() for remote in self.remotes]
+
     def _assert_not_closed(self):
         assert not self.closed, "Trying to operate on a SubprocVecEnv after calling close()"
@@ -99,3 +99,69 @@ class SimpleEnv(gym.Env):
 
     def render(self, mode=None):
         raise NotImplementedError
+
+
+def test_toybox_vec_env():
+    """
+    Test that ToyboxVecEnv produces the same transitions as a
+    DummyVecEnv over the equivalent gym environments.
+    """
+    from toybox.envs.atari import BreakoutEnv
+    from .toybox_vec_env import ToyboxVecEnv
+
+    num_envs = 3
+    num_steps = 200
+    env1 = DummyVecEnv([BreakoutEnv for _ in range(num_envs)])
+    env2 = ToyboxVecEnv('breakout', num_envs)
+    assert env1.observation_space.shape == env2.observation_space.shape
+    assert env1.action_space.n == env2.action_space.n
+
+    try:
+        obs1, obs2 = env1.reset(), env2.reset()
+        assert obs2.shape == (num_envs,) + env2.observation_space.shape
+        assert np.array_equal(obs1, obs2)
+        np.random.seed(1337)
+        for _ in range(num_steps):
+            actions = np.random.randint(0, env2.action_space.n, size=(num_envs,))
+            outs1 = env1.step(actions)
+            outs2 = env2.step(actions)
+            for out1, out2 in zip(outs1[:3], outs2[:3]):
+                assert np.array_equal(out1, out2)
+            for info1, info2 in zip(outs1[3], outs2[3]):
+                assert info1['lives'] == info2['lives']
+                assert info1['score'] == info2['score']
+    finally:
+        env1.close()
+        env2.close()
+
+
+def test_subproc_timing():
+    """
+    Test that SubprocVecEnv gathers the stage timings of wrapped Toybox envs
+    from every worker.
+    """
+    from toybox.envs.atari import BreakoutEnv
+    from baselines.common.atari_wrappers import WarpFrame
+
+    num_envs = 2
+    num_steps = 10
+    env = SubprocVecEnv([lambda: WarpFrame(BreakoutEnv()) for _ in range(num_envs)])
+    try:
+        env.reset()
+        env.step(np.zeros(num_envs, dtype=int))
+        assert env.get_timing() == {}
+        env.enable_timing()
+        for _ in range(num_steps):
+            env.step(np.zeros(num_envs, dtype=int))
+        per_env = env.get_timing(aggregate=False)
+        assert [stats['step']['count'] for stats in per_env] == [num_steps] * num_envs
+        stats = env.get_timing(reset=True)
+        assert stats['step']['count'] == num_envs * num_steps
+        assert stats['WarpFrame.step']['count'] == num_envs * num_steps
+        assert stats['apply_action']['count'] == num_envs * num_steps
+        assert env.get_timing()['step']['count'] == 0
+        env.disable_timing()
+        env.step(np.zeros(num_envs, dtype=int))
+        assert env.get_timing()['step']['count'] == 0
+    finally:
+        env.close()
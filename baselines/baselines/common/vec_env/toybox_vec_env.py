@@ -0,0 +1,97 @@
+import numpy as np
+from gym import spaces
+from ctoybox import Toybox
+from toybox.envs.atari.render import FrameRenderer
+from . import VecEnv
+
+
+class ToyboxVecEnv(VecEnv):
+    """
+    VecEnv that owns several Toybox simulators in the current process and steps
+    them in a loop. Toybox simulators are cheap in-process objects, so this
+    avoids the pipe and pickling overhead of SubprocVecEnv entirely:
+    observations are rendered straight into one preallocated
+    (num_envs, height, width, channels) uint8 buffer.
+
+    Rewards, dones and infos follow ToyboxBaseEnv: the reward is the (positive)
+    change in score, an episode is done when the ALE would report game over,
+    and finished environments are reset automatically.
+
+    The observation array returned by reset() and step_wait() is the shared
+    buffer itself and is overwritten by the next call; copy it to keep it.
+    """
+    def __init__(self, game_name, num_envs, seed=None, grayscale=True, alpha=False, actions=None):
+        """
+        Arguments:
+
+        game_name: name of the Toybox game, e.g. 'breakout' or 'amidar'
+        num_envs: number of simulators to run
+        seed: if not None, simulator i is seeded with seed + i
+        grayscale: render single-channel observations
+        alpha: keep the alpha channel when rendering in color
+        actions: ALE action set; defaults to the legal action set of the game
+        """
+        self.toyboxes = [Toybox(game_name, grayscale) for _ in range(num_envs)]
+        toybox = self.toyboxes[0]
+        if actions is None:
+            actions = toybox.get_legal_action_set()
+        self._action_set = list(actions)
+        channels = 1 if grayscale else 4 if alpha else 3
+        shape = (toybox.get_height(), toybox.get_width(), channels)
+        observation_space = spaces.Box(low=0, high=255, shape=shape, dtype=np.uint8)
+        action_space = spaces.Discrete(len(self._action_set))
+        VecEnv.__init__(self, num_envs, observation_space, action_space)
+
+        self.buf_obs = np.zeros((num_envs,) + shape, dtype=np.uint8)
+        self.buf_rews = np.zeros((num_envs,), dtype=np.float32)
+        self.buf_dones = np.zeros((num_envs,), dtype=np.bool_)
+        self.scores = np.zeros((num_envs,), dtype=np.int64)
+        self.renderers = [FrameRenderer(self.buf_obs[e]) for e in range(num_envs)]
+        self.actions = None
+        if seed is not None:
+            self.seed(seed)
+
+    def seed(self, seed):
+        for e, toybox in enumerate(self.toyboxes):
+            toybox.set_seed(seed + e)
+            toybox.new_game()
+
+    def step_async(self, actions):
+        assert len(actions) == self.num_envs, "expected {} actions, got {}".format(self.num_envs, len(actions))
+        self.actions = actions
+
+    def step_wait(self):
+        infos = []
+        action_set = self._action_set
+        for e, toybox in enumerate(self.toyboxes):
+            toybox.apply_ale_action(action_set[self.actions[e]])
+            score = toybox.get_score()
+            self.buf_rews[e] = max(score - self.scores[e], 0)
+            lives = toybox.get_lives()
+            # use "ale" semantics here, as in MockALE.game_over
+            done = lives <= 0
+            self.buf_dones[e] = done
+            infos.append({'lives': lives, 'score': 0 if done else score})
+            if done:
+                toybox.new_game()
+                score = toybox.get_score()
+            self.scores[e] = score
+            self.renderers[e].render(toybox)
+        self.actions = None
+        return self.buf_obs, np.copy(self.buf_rews), np.copy(self.buf_dones), infos
+
+    def reset(self):
+        for e, toybox in enumerate(self.toyboxes):
+            toybox.new_game()
+            self.scores[e] = toybox.get_score()
+            self.renderers[e].render(toybox)
+        return self.buf_obs
+
+    def close_extras(self):
+        for toybox in self.toyboxes:
+            toybox.__exit__(None, None, None)
+        self.toyboxes = []
+        self.renderers = []
+
+    def get_images(self):
+        return [toybox.get_rgb_frame() for toybox in self.toyboxes]
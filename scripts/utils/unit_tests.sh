@@ -9,5 +9,11 @@ python -m toybox.interventions.space_invaders
 
 # unittest will discover test.interventions.test_amidar_interventions
 # and test.interventions.test_breakout_interventions
-# so we only request toybox.interventions.space_invaders above
-python -m unittest discover test.interventions -v
+# so we only request toybox.interventions.space_invaders above;
+# this runs every test_*.py under test/, including test.envs.
+python -m unittest discover test -p 'test_*.py' -v
+
+# The wrapper and vec env tests of our baselines fork run against toybox.
+(cd baselines && PYTHONPATH="$(cd .. && pwd)${PYTHONPATH:+:$PYTHONPATH}" python -m pytest -q \
+  baselines/common/tests/test_atari_wrappers.py \
+  baselines/common/vec_env/test_vec_env.py)
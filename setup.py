@@ -4,5 +4,8 @@ setup(
   name='toybox',
   version='0.1.3',
   packages=find_packages(exclude=["test"]),
-  package_data={'interventions': ['resources/game_template.py']}
+  package_data={
+    'interventions': ['resources/game_template.py'],
+    'toybox.interventions': ['defaults/*.json']
+  }
 )
@@ -0,0 +1,265 @@
+"""Layered throughput benchmarks for Toybox.
+
+Each layer is timed on its own, per game: raw simulator steps, frame
+rendering, ToyboxBaseEnv.step, the full wrap_deepmind stack, the in-process
+vec env, and two intervention round trips: a full decode and encode, and a
+decode with one change written back as a patch. Every measurement runs warmup
+iterations first, times each iteration, and is repeated; the report gives
+the median throughput over repeats and latency percentiles over all timed
+iterations.
+
+    python -m test.bench --games breakout --json results.json
+    python -m test.bench --baseline results.json --tolerance 0.15
+
+With --baseline, the run fails (exit status 1) if the throughput of any
+layer measured in both runs drops by more than the tolerance. Layers whose
+dependencies are missing (the deepmind and vec layers need baselines on
+the path) are reported as skipped.
+"""
+import argparse
+import itertools
+import json
+import platform
+import sys
+import time
+
+import numpy as np
+from ctoybox import Toybox
+
+GAMES = ['breakout', 'amidar', 'space_invaders']
+
+ENV_IDS = {
+  'breakout': 'BreakoutToyboxNoFrameskip-v4',
+  'amidar': 'AmidarToyboxNoFrameskip-v4',
+  'space_invaders': 'SpaceInvadersToyboxNoFrameskip-v4',
+}
+
+
+class Skip(Exception):
+  """Raised by a layer that cannot run here."""
+
+
+def _cycle_actions(toybox):
+  return itertools.cycle(toybox.get_legal_action_set())
+
+
+def raw_layer(game):
+  tb = Toybox(game)
+  actions = _cycle_actions(tb)
+  def op():
+    tb.apply_ale_action(next(actions))
+    if tb.get_lives() <= 0:
+      tb.new_game()
+  return op, None, 1
+
+
+def render_layer(game):
+  tb = Toybox(game)
+  actions = _cycle_actions(tb)
+  for _ in range(50):
+    tb.apply_ale_action(next(actions))
+  return tb.get_state, None, 1
+
+
+def env_layer(game):
+  from toybox.envs.atari import BreakoutEnv, AmidarEnv, SpaceInvadersEnv
+  env = {'breakout': BreakoutEnv, 'amidar': AmidarEnv, 'space_invaders': SpaceInvadersEnv}[game]()
+  env.reset()
+  actions = itertools.cycle(range(env.action_space.n))
+  def op():
+    if env.step(next(actions))[2]:
+      env.reset()
+  return op, env.close, 1
+
+
+def deepmind_layer(game):
+  try:
+    from baselines.common.atari_wrappers import make_atari, wrap_deepmind
+  except ImportError:
+    raise Skip('baselines is not importable')
+  env = wrap_deepmind(make_atari(ENV_IDS[game], None), frame_stack=True)
+  env.reset()
+  actions = itertools.cycle(range(env.action_space.n))
+  def op():
+    if env.step(next(actions))[2]:
+      env.reset()
+  # MaxAndSkipEnv steps the game 4 times per call.
+  return op, env.close, 4
+
+
+VEC_ENVS = 8
+
+def vec_layer(game):
+  try:
+    from baselines.common.vec_env.toybox_vec_env import ToyboxVecEnv
+  except ImportError:
+    raise Skip('baselines is not importable')
+  env = ToyboxVecEnv(game, VEC_ENVS, seed=0)
+  env.reset()
+  n = env.action_space.n
+  batches = itertools.cycle([np.full(VEC_ENVS, a) for a in range(n)])
+  return lambda: env.step(next(batches)), env.close, VEC_ENVS
+
+
+def _intervention_class(game):
+  from toybox.interventions.breakout import BreakoutIntervention
+  from toybox.interventions.amidar import AmidarIntervention
+  from toybox.interventions.space_invaders import SpaceInvadersIntervention
+  return {'breakout': BreakoutIntervention, 'amidar': AmidarIntervention,
+          'space_invaders': SpaceInvadersIntervention}[game]
+
+
+def intervention_layer(game):
+  clz = _intervention_class(game)
+  tb = Toybox(game)
+  def op():
+    # A decode, and the whole game encoded and written back.
+    with clz(tb) as intervention:
+      tb.write_state_json(intervention.game.encode())
+  return op, None, 1
+
+
+def intervention_patch_layer(game):
+  clz = _intervention_class(game)
+  tb = Toybox(game)
+  def op():
+    # A decode, and one changed field written back as a patch to the state
+    # read on entry; nothing is re-encoded.
+    with clz(tb) as intervention:
+      intervention.game.lives = intervention.game.lives
+  return op, None, 1
+
+
+LAYERS = {
+  'raw': raw_layer,
+  'render': render_layer,
+  'env': env_layer,
+  'deepmind': deepmind_layer,
+  'vec': vec_layer,
+  'intervention': intervention_layer,
+  'intervention_patch': intervention_patch_layer,
+}
+
+
+def measure(op, iterations, warmup):
+  """Runs op `warmup` times untimed, then `iterations` times; returns (seconds, per-iteration ns)."""
+  for _ in range(warmup):
+    op()
+  clock = time.perf_counter_ns
+  latencies = np.empty(iterations, dtype=np.int64)
+  start = clock()
+  for i in range(iterations):
+    t = clock()
+    op()
+    latencies[i] = clock() - t
+  return (clock() - start) / 1e9, latencies
+
+
+def run_layer(layer, game, iterations, warmup, repeats):
+  op, close, frames_per_op = LAYERS[layer](game)
+  try:
+    fps, latencies = [], []
+    for _ in range(repeats):
+      seconds, lat = measure(op, iterations, warmup)
+      fps.append(iterations * frames_per_op / seconds)
+      latencies.append(lat)
+  finally:
+    if close is not None:
+      close()
+  latencies = np.concatenate(latencies) / 1e3
+  p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+  return {
+    'frames_per_sec': float(np.median(fps)),
+    'frames_per_op': frames_per_op,
+    'repeats': [float(f) for f in fps],
+    'mean_us': float(latencies.mean()),
+    'p50_us': float(p50),
+    'p90_us': float(p90),
+    'p99_us': float(p99),
+  }
+
+
+def run(games, layers, iterations=2000, warmup=200, repeats=5, log=None):
+  results = {}
+  for game in games:
+    results[game] = {}
+    for layer in layers:
+      try:
+        result = run_layer(layer, game, iterations, warmup, repeats)
+      except Skip as e:
+        result = {'skipped': str(e)}
+      results[game][layer] = result
+      if log is not None:
+        log(game, layer, result)
+  return {'meta': metadata(iterations, warmup, repeats), 'results': results}
+
+
+def metadata(iterations, warmup, repeats):
+  from toybox.interventions.schema import ctoybox_version
+  return {
+    'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    'python': platform.python_version(),
+    'platform': platform.platform(),
+    'machine': platform.machine(),
+    'ctoybox': ctoybox_version(),
+    'iterations': iterations,
+    'warmup': warmup,
+    'repeats': repeats,
+  }
+
+
+def regressions(report, baseline, tolerance, key='frames_per_sec'):
+  """The (game, layer, baseline fps, current fps) of layers that got slower by more than tolerance.
+
+  `key` names the throughput figure in each result."""
+  slower = []
+  for game, layers in report['results'].items():
+    for layer, result in layers.items():
+      before = baseline.get('results', {}).get(game, {}).get(layer, {})
+      if key not in result or key not in before:
+        continue
+      if result[key] < before[key] * (1. - tolerance):
+        slower.append((game, layer, before[key], result[key]))
+  return slower
+
+
+def print_result(game, layer, result):
+  if 'skipped' in result:
+    print('%-15s %-18s skipped: %s' % (game, layer, result['skipped']))
+  else:
+    print('%-15s %-18s %10.0f frames/s  p50 %8.1fus  p90 %8.1fus  p99 %8.1fus' % (
+      game, layer, result['frames_per_sec'], result['p50_us'], result['p90_us'], result['p99_us']))
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Layered Toybox throughput benchmarks')
+  parser.add_argument('--games', nargs='+', default=GAMES, choices=GAMES)
+  parser.add_argument('--layers', nargs='+', default=list(LAYERS), choices=list(LAYERS))
+  parser.add_argument('--iterations', type=int, default=2000)
+  parser.add_argument('--warmup', type=int, default=200)
+  parser.add_argument('--repeats', type=int, default=5)
+  parser.add_argument('--json', help='write the report to this file')
+  parser.add_argument('--baseline', help='report from an earlier run to check for regressions')
+  parser.add_argument('--tolerance', type=float, default=0.15,
+                      help='allowed fractional drop in throughput against the baseline')
+  args = parser.parse_args(argv)
+
+  report = run(args.games, args.layers, args.iterations, args.warmup, args.repeats, log=print_result)
+  if args.json:
+    with open(args.json, 'w') as f:
+      json.dump(report, f, indent=2, sort_keys=True)
+
+  if args.baseline:
+    with open(args.baseline) as f:
+      baseline = json.load(f)
+    slower = regressions(report, baseline, args.tolerance)
+    for game, layer, before, after in slower:
+      print('REGRESSION %s %s: %.0f -> %.0f frames/s (%.0f%%)' % (
+        game, layer, before, after, 100. * (after - before) / before))
+    if slower:
+      return 1
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
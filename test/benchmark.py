@@ -75,8 +75,8 @@ def ale_raw(game, Nsteps, FPS_dict):
             score = 0
         else:
             score += aleobj.act(action)
-        endTime = time.time()
-        FPS.append(Nsteps / (endTime - startTime))
+    endTime = time.time()
+    FPS.append(Nsteps / (endTime - startTime))
 
 
 # FPS estimate
@@ -0,0 +1,153 @@
+from unittest import TestCase
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import gc
+import threading
+import time
+import weakref
+import numpy as np
+from toybox.envs.atari import BreakoutEnv
+from toybox.envs.atari import aio
+from toybox.envs.atari.aio import AsyncEnv, AsyncVecEnv, Transition
+
+
+def scripted(obs):
+  # Deterministic in the observation, so equal runs take equal actions.
+  return int(obs.sum()) % 4
+
+
+class AsyncEnvTests(TestCase):
+
+  def test_step(self):
+    async def run():
+      env = AsyncEnv(BreakoutEnv())
+      obs = await env.reset()
+      self.assertEqual(obs.shape, env.observation_space.shape)
+      obs, reward, done, info = await env.step(1)
+      self.assertIn('lives', info)
+    asyncio.run(run())
+
+  def test_episode(self):
+    async def run():
+      env = AsyncEnv(BreakoutEnv())
+      return [t async for t in env.episode(scripted, max_steps=40)]
+    transitions = asyncio.run(run())
+    self.assertEqual(len(transitions), 40)
+    self.assertIsInstance(transitions[0], Transition)
+    self.assertTrue(np.array_equal(transitions[0].next_obs, transitions[1].obs))
+
+    # Same as stepping synchronously.
+    env = BreakoutEnv()
+    obs = env.reset()
+    for t in transitions:
+      self.assertTrue(np.array_equal(t.obs, obs))
+      obs, reward, done, _ = env.step(scripted(obs))
+      self.assertEqual((t.reward, t.done), (reward, done))
+
+  def test_concurrent_episodes(self):
+    executor = ThreadPoolExecutor(max_workers=2)
+    async def policy(obs):
+      await asyncio.sleep(0)
+      return scripted(obs)
+    async def total(env):
+      return sum([t.reward async for t in env.episode(policy, max_steps=300)])
+    async def run():
+      envs = [AsyncEnv(BreakoutEnv(), executor) for _ in range(20)]
+      return await asyncio.gather(*[total(env) for env in envs])
+    totals = asyncio.run(run())
+    executor.shutdown()
+    env = BreakoutEnv()
+    obs, expected = env.reset(), 0
+    for _ in range(300):
+      obs, reward, done, _ = env.step(scripted(obs))
+      expected += reward
+      if done: break
+    self.assertEqual(totals, [expected] * 20)
+
+  def test_calls_are_serialized(self):
+    async def run():
+      env = AsyncEnv(BreakoutEnv())
+      await env.reset()
+      return await asyncio.gather(*[env.step(0) for _ in range(10)])
+    steps = asyncio.run(run())
+    self.assertEqual(len(steps), 10)
+
+  def test_errors(self):
+    async def run():
+      env = AsyncEnv(BreakoutEnv())
+      await env.reset()
+      with self.assertRaises(AssertionError):
+        await env.step(100)
+      # The env is still usable afterwards.
+      return await env.step(0)
+    self.assertEqual(len(asyncio.run(run())), 4)
+
+  def test_cancelled_step(self):
+    class Slow(object):
+      # Records whether two calls ever overlap.
+      def __init__(self):
+        self.running = 0
+        self.overlapped = False
+        self.steps = 0
+        self.lock = threading.Lock()
+      def step(self, action):
+        with self.lock:
+          self.running += 1
+          self.overlapped |= self.running > 1
+        time.sleep(0.1)
+        with self.lock:
+          self.running -= 1
+          self.steps += 1
+        return self.steps
+    slow = Slow()
+    # Enough threads for the calls to overlap if they were let through.
+    executor = ThreadPoolExecutor(max_workers=2)
+    async def run():
+      env = AsyncEnv(slow, executor)
+      task = asyncio.ensure_future(env.step(0))
+      await asyncio.sleep(0.02)
+      task.cancel()
+      with self.assertRaises(asyncio.CancelledError):
+        await task
+      # Waits for the cancelled step to finish rather than running beside it.
+      return await env.step(0)
+    self.assertEqual(asyncio.run(run()), 2)
+    executor.shutdown()
+    self.assertFalse(slow.overlapped)
+
+  def test_loops_are_released(self):
+    async def run():
+      await AsyncEnv(BreakoutEnv()).reset()
+      return weakref.ref(asyncio.get_running_loop())
+    loop = asyncio.run(run())
+    gc.collect()
+    self.assertIsNone(loop())
+    self.assertEqual(len(aio._batchers), 0)
+
+  def test_shut_down_executor(self):
+    executor = ThreadPoolExecutor(max_workers=1)
+    executor.shutdown()
+    async def run():
+      await AsyncEnv(BreakoutEnv(), executor).reset()
+    with self.assertRaises(RuntimeError):
+      asyncio.run(run())
+
+  def test_vec_env(self):
+    class Vec(object):
+      num_envs = 2
+      def __init__(self):
+        self.envs = [BreakoutEnv() for _ in range(2)]
+      def reset(self):
+        return np.stack([env.reset() for env in self.envs])
+      def step_async(self, actions):
+        self.actions = actions
+      def step_wait(self):
+        obs, rewards, dones, infos = zip(*[env.step(a) for env, a in zip(self.envs, self.actions)])
+        return np.stack(obs), np.array(rewards), np.array(dones), infos
+    async def run():
+      venv = AsyncVecEnv(Vec())
+      obs = await venv.reset()
+      return obs, await venv.step([1, 2])
+    obs, (next_obs, rewards, dones, infos) = asyncio.run(run())
+    self.assertEqual(obs.shape[0], 2)
+    self.assertEqual(next_obs.shape, obs.shape)
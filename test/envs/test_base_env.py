@@ -0,0 +1,259 @@
+from unittest import TestCase
+import numpy as np
+from toybox.envs.atari import BreakoutEnv, AmidarEnv
+from toybox.envs.atari import timing
+
+class ObsBufferTests(TestCase):
+
+  def check_layout(self, env):
+    expected = env.reset().copy()
+    out = np.zeros(env.observation_space.shape, dtype=np.uint8)
+    env.reset()
+    env.set_obs_buffer(out)
+    obs = env._get_obs()
+    self.assertIs(obs, out)
+    self.assertTrue(np.array_equal(obs, expected))
+
+  def test_grayscale(self):
+    self.check_layout(BreakoutEnv(grayscale=True))
+
+  def test_rgb(self):
+    self.check_layout(AmidarEnv(grayscale=False))
+
+  def test_rgba(self):
+    self.check_layout(AmidarEnv(grayscale=False, alpha=True))
+
+  def test_step_reuses_buffer(self):
+    env = BreakoutEnv()
+    out = np.zeros(env.observation_space.shape, dtype=np.uint8)
+    env.set_obs_buffer(out)
+    self.assertIs(env.reset(), out)
+    for _ in range(10):
+      obs, _, _, _ = env.step(1)
+      self.assertIs(obs, out)
+    env.set_obs_buffer(None)
+    self.assertIsNot(env.step(0)[0], out)
+
+  def test_wrong_shape(self):
+    env = BreakoutEnv()
+    with self.assertRaises(AssertionError):
+      env.set_obs_buffer(np.zeros((84, 84, 1), dtype=np.uint8))
+
+
+class StepRepeatTests(TestCase):
+
+  def step_pooled(self, env, action, k):
+    # What MaxAndSkipEnv computes from k calls to step.
+    frames = []
+    total_reward = 0
+    for _ in range(k):
+      obs, reward, done, info = env.step(action)
+      frames.append(obs)
+      total_reward += reward
+      if done: break
+    return np.max(frames[-2:], axis=0), total_reward, done, info
+
+  def check_equivalent(self, make_env, k, nsteps=100):
+    env1, env2 = make_env(), make_env()
+    env1.reset()
+    env2.reset()
+    actions = np.random.RandomState(1337).randint(0, env1.action_space.n, size=nsteps)
+    for action in actions:
+      obs1, reward1, done1, info1 = self.step_pooled(env1, action, k)
+      obs2, reward2, done2, info2 = env2.step_repeat(action, k)
+      self.assertEqual(reward1, reward2)
+      self.assertEqual(done1, done2)
+      if done1:
+        self.assertEqual(info1.pop('cached_state').to_json(), info2.pop('cached_state').to_json())
+      self.assertEqual(info1, info2)
+      if done1: break
+      self.assertTrue(np.array_equal(obs1, obs2))
+
+  def test_breakout(self):
+    self.check_equivalent(BreakoutEnv, 4)
+
+  def test_amidar_color(self):
+    self.check_equivalent(lambda: AmidarEnv(grayscale=False), 4)
+
+  def test_single_frame(self):
+    self.check_equivalent(BreakoutEnv, 1)
+
+  def test_obs_buffer(self):
+    env = BreakoutEnv()
+    out = np.zeros(env.observation_space.shape, dtype=np.uint8)
+    env.set_obs_buffer(out)
+    env.reset()
+    obs, _, _, _ = env.step_repeat(1, 4)
+    self.assertIs(obs, out)
+
+
+class DeepmindModeTests(TestCase):
+
+  def warp(self, frame):
+    import cv2
+    return cv2.resize(frame, (84, 84), interpolation=cv2.INTER_AREA)[:, :, None]
+
+  def test_observation_space(self):
+    env = BreakoutEnv()
+    env.set_obs_mode('deepmind')
+    self.assertEqual(env.observation_space.shape, (84, 84, 1))
+    self.assertEqual(env.reset().shape, (84, 84, 1))
+    env.set_obs_mode('image')
+    self.assertEqual(env.reset().shape, env.toybox.get_state().shape)
+
+  def test_matches_warped_frames(self):
+    env1, env2 = AmidarEnv(), AmidarEnv()
+    env2.set_obs_mode('deepmind')
+    self.assertTrue(np.array_equal(self.warp(env1.reset()), env2.reset()))
+    for action in np.random.RandomState(1337).randint(0, env1.action_space.n, size=50):
+      self.assertTrue(np.array_equal(self.warp(env1.step(action)[0]), env2.step(action)[0]))
+      obs1, _, done, _ = env1.step_repeat(action, 4)
+      obs2, _, _, _ = env2.step_repeat(action, 4)
+      if done: break
+      self.assertTrue(np.array_equal(self.warp(obs1), obs2))
+
+  def test_color_env(self):
+    env = AmidarEnv(grayscale=False)
+    env.set_obs_mode('deepmind')
+    self.assertEqual(env.reset().shape, (84, 84, 1))
+
+  def test_mode_change_keeps_buffer(self):
+    env = BreakoutEnv()
+    out = np.zeros(env.observation_space.shape, dtype=np.uint8)
+    env.set_obs_buffer(out)
+    with self.assertRaises(AssertionError):
+      env.set_obs_mode('deepmind')
+    self.assertIs(env.obs_buffer, out)
+    self.assertIs(env.reset(), out)
+
+  def test_obs_buffer(self):
+    env = BreakoutEnv()
+    env.set_obs_mode('deepmind')
+    out = np.zeros((84, 84, 1), dtype=np.uint8)
+    env.set_obs_buffer(out)
+    self.assertIs(env.reset(), out)
+    self.assertIs(env.step_repeat(1, 4)[0], out)
+
+
+class SnapshotTests(TestCase):
+
+  def rollout(self, env, actions):
+    return [env.step(action) for action in actions]
+
+  def check_same(self, steps1, steps2):
+    for (obs1, rew1, done1, _), (obs2, rew2, done2, _) in zip(steps1, steps2):
+      self.assertTrue(np.array_equal(obs1, obs2))
+      self.assertEqual(rew1, rew2)
+      self.assertEqual(done1, done2)
+
+  def test_restore(self):
+    env = BreakoutEnv()
+    env.reset()
+    env.step(1)
+    snapshot = env.snapshot()
+    actions = np.random.RandomState(1337).randint(0, env.action_space.n, size=50)
+    steps1 = self.rollout(env, actions)
+    env.restore(snapshot)
+    steps2 = self.rollout(env, actions)
+    self.check_same(steps1, steps2)
+    # snapshots can be restored more than once
+    env.restore(snapshot)
+    self.check_same(steps1, self.rollout(env, actions))
+
+  def test_restore_into_other_env(self):
+    env1, env2 = AmidarEnv(), AmidarEnv()
+    env1.reset()
+    env2.reset()
+    for _ in range(20):
+      env1.step(3)
+    env2.restore(env1.snapshot())
+    self.assertEqual(env1.toybox.state_to_json(), env2.toybox.state_to_json())
+
+  def test_pickle(self):
+    import pickle
+    env = BreakoutEnv()
+    env.reset()
+    env.step(1)
+    snapshot = pickle.loads(pickle.dumps(env.snapshot()))
+    self.assertEqual(snapshot.to_json(), env.toybox.state_to_json())
+    actions = np.random.RandomState(7).randint(0, env.action_space.n, size=30)
+    steps1 = self.rollout(env, actions)
+    env.reset()
+    env.restore(snapshot)
+    self.check_same(steps1, self.rollout(env, actions))
+
+  def test_take_from_instance(self):
+    env = BreakoutEnv()
+    env.reset()
+    snapshot = env.snapshot()
+    env.step(1)
+    self.assertEqual(snapshot.take(env.toybox).to_json(), env.toybox.state_to_json())
+
+  def test_module_doc(self):
+    import toybox.snapshot
+    self.assertIn('Cheap copies', toybox.snapshot.__doc__)
+
+  def test_cached_state(self):
+    env = BreakoutEnv()
+    self.assertIsNone(env.cached_state)
+    env.reset()
+    for _ in range(10):
+      env.step(1)
+    before = env.toybox.state_to_json()
+    env.reset()
+    self.assertEqual(env.cached_state, before)
+
+
+class TimingTests(TestCase):
+
+  def test_disabled_by_default(self):
+    env = BreakoutEnv()
+    self.assertIsNone(env.timer)
+    self.assertNotIn('step', env.__dict__)
+    self.assertNotIn('apply_ale_action', env.toybox.__dict__)
+
+  def test_stages(self):
+    env = BreakoutEnv()
+    timer = env.enable_timing()
+    env.reset()
+    for _ in range(20):
+      env.step(1)
+    env.step_repeat(1, 4)
+    stats = timer.stats()
+    self.assertEqual(stats['step']['count'], 20)
+    self.assertEqual(stats['step_repeat']['count'], 1)
+    self.assertEqual(stats['reset']['count'], 1)
+    self.assertEqual(stats['get_obs']['count'], 21)
+    self.assertEqual(stats['apply_action']['count'], 24)
+    self.assertEqual(stats['new_game']['count'], 1)
+    for s in stats.values():
+      self.assertEqual(sum(s['histogram']), s['count'])
+    # stages nest inside step
+    self.assertGreater(stats['step']['total_ns'], stats['get_obs']['total_ns'])
+
+  def test_disable(self):
+    env = BreakoutEnv()
+    timer = env.enable_timing()
+    env.reset()
+    env.step(0)
+    env.disable_timing()
+    self.assertIsNone(env.timer)
+    self.assertNotIn('step', env.__dict__)
+    self.assertNotIn('apply_ale_action', env.toybox.__dict__)
+    env.step(0)
+    self.assertEqual(timer.stats()['step']['count'], 1)
+
+  def test_merge_and_summary(self):
+    timers = [BreakoutEnv().enable_timing() for _ in range(2)]
+    for timer, steps in zip(timers, [3, 5]):
+      step = timer.timed('step', lambda: None)
+      for _ in range(steps):
+        step()
+    merged = timing.merge([timer.stats() for timer in timers])
+    self.assertEqual(merged['step']['count'], 8)
+    self.assertEqual(merged['step']['total_ns'], sum(t.stats()['step']['total_ns'] for t in timers))
+    summary = timing.summary(merged)['step']
+    self.assertEqual(summary['count'], 8)
+    self.assertLessEqual(summary['p50_us'], summary['p99_us'])
+    timers[0].reset()
+    self.assertEqual(timers[0].stats()['step']['count'], 0)
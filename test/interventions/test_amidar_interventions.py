@@ -202,4 +202,65 @@ class AmidarInterventionTests(TestCase):
       with self.assertRaises(amidar.InterventionNoneError):
         intervention.game.player.intervention = None
       with self.assertRaises(amidar.MutationError):
-        intervention.game.player._in_init = True
\ No newline at end of file
+        intervention.game.player._in_init = True
+  def test_tile_grid(self):
+    with AmidarIntervention(self.tb) as intervention:
+      tiles = intervention.game.board.tiles
+      grid = intervention.tile_grid()
+      self.assertEqual(grid.tags.shape, (len(tiles.coll), len(tiles.coll[0])))
+      tp = intervention.tile_to_tilepoint(tiles[3][5])
+      self.assertEqual((tp.tx, tp.ty), (5, 3))
+      with self.assertRaises(ValueError):
+        intervention.tile_to_tilepoint(amidar.Tile(intervention, amidar.Tile.Empty))
+
+      # adjacency agrees with the neighbors' tags
+      ty, tx = [int(i) for i in next(zip(*grid.walkable.nonzero()))]
+      adjacent = intervention.get_adjacent_tiles(amidar.TilePoint(intervention, tx, ty), intervention.is_tile_walkable)
+      self.assertEqual(len(adjacent), grid.adjacency[ty, tx].sum())
+      d = intervention.get_random_dir_for_tile(tiles[ty][tx])
+      dx, dy = amidar.TileGrid.offsets[amidar.Direction.directions.index(d)]
+      self.assertTrue(intervention.is_tile_walkable(tiles[ty + dy][tx + dx]))
+
+      # set_tile_tag keeps the grid in sync; other writes rebuild it
+      intervention.set_tile_tag(tiles[ty][tx], amidar.Tile.Empty)
+      self.assertIs(intervention.tile_grid(), grid)
+      self.assertFalse(grid.walkable[ty, tx])
+      self.assertEqual(grid.adjacency[ty + dy, tx + dx, amidar.TileGrid.offsets.index((-dx, -dy))], False)
+      tiles[ty][tx].tag = amidar.Tile.Painted
+      self.assertIsNot(intervention.tile_grid(), grid)
+      self.assertTrue(intervention.tile_grid().walkable[ty, tx])
+
+  def test_player_near_unpainted(self):
+    with AmidarIntervention(self.tb) as intervention:
+      ptp = intervention.worldpoint_to_tilepoint(intervention.game.player.position)
+      for radius in [1, 3, 5, 40]:
+        near = [t for t in intervention.filter_tiles(intervention.is_tile_walkable)
+          if amidar.TilePoint.manhattan(ptp, intervention.tile_to_tilepoint(t)) < radius]
+        expected = not all(t.tag == amidar.Tile.Painted for t in near)
+        self.assertEqual(intervention.player_near_unpainted(radius), expected)
+      for tile in intervention.filter_tiles(intervention.is_tile_walkable):
+        intervention.set_tile_tag(tile, amidar.Tile.Painted)
+      self.assertFalse(intervention.player_near_unpainted(40))
+
+  def test_local_tile_transforms(self):
+    with AmidarIntervention(self.tb) as intervention:
+      wps = [[x, y] for x in [-129, -128, -64, -1, 0, 1, 63, 64, 1000] for y in [-161, -160, -80, 0, 79, 80, 2400]]
+      expected = [self.tb.query_state_json('world_to_tile', {'x': x, 'y': y}) for x, y in wps]
+      self.assertEqual(intervention.worldpoints_to_tilepoints(wps).tolist(), expected)
+      tps = [[tx, ty] for tx in [-2, 0, 5, 31] for ty in [-1, 0, 7, 30]]
+      expected = [self.tb.query_state_json('tile_to_world', {'tx': tx, 'ty': ty}) for tx, ty in tps]
+      self.assertEqual(intervention.tilepoints_to_worldpoints(tps).tolist(), expected)
+
+      wp = intervention.tilepoint_to_worldpoint(amidar.TilePoint(intervention, 3, 4))
+      self.assertIsInstance(wp.x, int)
+      tp = intervention.worldpoint_to_tilepoint(wp)
+      self.assertEqual((tp.tx, tp.ty), (3, 4))
+
+      ptp = self.tb.query_state_json('world_to_tile', intervention.game.player.position.encode())
+      expected = []
+      for e in intervention.game.enemies:
+        etp = self.tb.query_state_json('world_to_tile', e.position.encode())
+        expected.append(abs(etp[0] - ptp[0]) + abs(etp[1] - ptp[1]))
+      self.assertEqual(intervention.player_enemy_distances(), expected)
+      self.assertEqual(intervention.player_enemy_distances(amidar.TilePoint.manhattan), expected)
+      self.assertEqual(intervention.player_enemy_distances(lambda a, b: amidar.TilePoint.manhattan(a, b)), expected)
@@ -144,3 +144,31 @@ class BreakoutInterventionTests(TestCase):
       pos_post = intervention.get_paddle_position()
       self.assertAlmostEqual(pos.x, pos_post.x)
 
+
+  def test_brick_arrays(self):
+    with BreakoutIntervention(self.tb) as intervention:
+      bricks = intervention.game.bricks
+      view = intervention.brick_arrays()
+      self.assertEqual(len(view), len(bricks))
+      self.assertEqual(view.col[7], bricks[7].col)
+      self.assertEqual(view.position[7, 0], bricks[7].position.x)
+      self.assertEqual(view.color[7, 3], bricks[7].color.a)
+      with self.assertRaises(ValueError):
+        view.alive[0] = False
+
+      # writes through the view reach the bricks and the change log
+      view.set('points', view.row == 0, 9)
+      view.set('color', 3, [1, 2, 3, 400])
+      self.assertEqual(bricks[3].color.a, 255)
+      self.assertEqual(view.color[3, 3], 255)
+      self.assertIs(intervention.brick_arrays(), view)
+
+      # writes to the bricks themselves invalidate the view
+      bricks[0].alive = False
+      self.assertIsNot(intervention.brick_arrays(), view)
+      self.assertFalse(intervention.brick_arrays().alive[0])
+
+    with BreakoutIntervention(self.tb) as intervention:
+      for brick in intervention.game.bricks:
+        if brick.row == 0: self.assertEqual(brick.points, 9)
+      self.assertEqual(intervention.game.bricks[3].color.r, 1)
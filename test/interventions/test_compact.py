@@ -0,0 +1,50 @@
+from unittest import TestCase
+import copy
+from ctoybox import Toybox
+from toybox.interventions.base import MutationError, InterventionNoneError
+from toybox.interventions.breakout import *
+
+class CompactMixinTests(TestCase):
+
+  def test_no_dict(self):
+    with Toybox('breakout') as tb:
+      with BreakoutIntervention(tb) as intervention:
+        brick = intervention.game.bricks[0]
+        self.assertFalse(hasattr(brick, '__dict__'))
+        self.assertFalse(hasattr(brick.color, '__dict__'))
+        self.assertFalse(hasattr(brick.position, '__dict__'))
+
+  def test_mutation_checks(self):
+    with Toybox('breakout') as tb:
+      with BreakoutIntervention(tb) as intervention:
+        brick = intervention.game.bricks[0]
+        with self.assertRaises(MutationError):
+          brick.foo = 1
+        with self.assertRaises(MutationError):
+          brick._in_init = True
+        with self.assertRaises(MutationError):
+          brick.color.intervention = intervention
+        with self.assertRaises(InterventionNoneError):
+          brick.color.intervention = None
+        with self.assertRaises(MutationError):
+          brick.color.intervention = intervention
+        self.assertFalse(intervention.dirty_state)
+
+        brick.color.r = 300
+        self.assertEqual(brick.color.r, 255)
+        brick.alive = 0.
+        self.assertIs(brick.alive, False)
+        self.assertTrue(intervention.dirty_state)
+      state = tb.state_to_json()
+      self.assertEqual(state['bricks'][0]['color']['r'], 255)
+      self.assertFalse(state['bricks'][0]['alive'])
+
+  def test_copy(self):
+    with Toybox('breakout') as tb:
+      with BreakoutIntervention(tb) as intervention:
+        brick = intervention.game.bricks[0]
+        other = copy.copy(brick)
+        self.assertIsNot(other, brick)
+        self.assertEqual(other.encode(), brick.encode())
+        self.assertIs(other.intervention, intervention)
+        self.assertEqual(other, brick)
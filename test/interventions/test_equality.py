@@ -1,7 +1,7 @@
 from unittest import TestCase
 from ctoybox import Toybox, Input
 from toybox.interventions.breakout import BreakoutIntervention, Breakout
-from toybox.interventions.base import ProbEq, SetEq
+from toybox.interventions.base import ProbEq, SetEq, diff
 
 class BreakoutEquality(TestCase):
 
@@ -163,3 +163,99 @@ class BreakoutEquality(TestCase):
     self.assertNotEqual(s1.bricks, s2.bricks)
     self.assertNotEqual(s1, s2)
 
+  def test_content_hash(self):
+    with Toybox('breakout') as tb:
+      with BreakoutIntervention(tb, eq_mode=SetEq) as intervention:
+        s1 = intervention.game
+      with BreakoutIntervention(tb, eq_mode=SetEq) as intervention:
+        s2 = intervention.game
+        self.assertEqual(s1.content_hash(), s2.content_hash())
+        self.assertEqual(diff(s1, s2), [])
+
+        # Mutating a brick invalidates it and everything above it, but not its siblings.
+        sibling = s2.bricks[11].content_hash()
+        s2.bricks[12].color.g = 99
+        self.assertNotEqual(s1.content_hash(), s2.content_hash())
+        self.assertNotEqual(s1.bricks.content_hash(), s2.bricks.content_hash())
+        self.assertNotEqual(s1.bricks[12].content_hash(), s2.bricks[12].content_hash())
+        self.assertEqual(sibling, s2.bricks[11].content_hash())
+
+        s2.paddle_speed += 1
+
+    self.assertEqual(sorted(diff(s1, s2)), sorted([
+      ('bricks[12].color.g', s1.bricks[12].color.g, 99),
+      ('paddle_speed', s1.paddle_speed, s1.paddle_speed + 1)]))
+    cmp = s1 == s2
+    self.assertEqual(sorted(k for k, _, _ in cmp.differs), ['bricks[12].color.g', 'paddle_speed'])
+    self.assertEqual((s1 == s1).differs, [])
+
+  def test_content_hash_after_exit(self):
+    with Toybox('breakout') as tb:
+      with BreakoutIntervention(tb, eq_mode=SetEq) as intervention:
+        s1 = intervention.game
+      with BreakoutIntervention(tb, eq_mode=SetEq) as intervention:
+        s2 = intervention.game
+
+    # Compare, then mutate outside the interventions, then compare again.
+    self.assertEqual((s1 == s2).differs, [])
+    s2.bricks[5].alive = False
+    self.assertEqual(diff(s1, s2), [('bricks[5].alive', True, False)])
+    self.assertEqual([k for k, _, _ in (s1 == s2).differs], ['bricks[5].alive'])
+
+  def test_content_hash_plain_lists(self):
+    from toybox.interventions.amidar import AmidarIntervention, Tile
+    with Toybox('amidar') as tb:
+      with AmidarIntervention(tb, eq_mode=SetEq) as intervention:
+        s1 = intervention.game
+      with AmidarIntervention(tb, eq_mode=SetEq) as intervention:
+        s2 = intervention.game
+        self.assertEqual(diff(s1, s2), [])
+        # The rows of the board are plain lists, so this write is not recorded.
+        tile = s2.board.tiles[0][0]
+        tag = Tile.Painted if tile.tag != Tile.Painted else Tile.Unpainted
+        s2.board.tiles[0][0] = Tile(intervention, tag)
+        self.assertEqual(diff(s1, s2), [('board.tiles[0][0].tag', tile.tag, tag)])
+
+  def test_set_eq_difference(self):
+    with Toybox('breakout') as tb:
+      with BreakoutIntervention(tb, eq_mode=SetEq) as intervention:
+        s1 = intervention.game
+      with BreakoutIntervention(tb, eq_mode=SetEq) as intervention:
+        intervention.game.bricks[3].alive = False
+        s2 = intervention.game
+      with BreakoutIntervention(tb, eq_mode=SetEq) as intervention:
+        intervention.game.bricks[3].alive = False
+        intervention.game.lives += 1
+        s3 = intervention.game
+
+    self.assertEqual((s1 == s3).difference(s1 == s2), [('lives', s1.lives, s1.lives + 1)])
+    self.assertEqual((s1 == s2).difference(s1 == s3), [])
+
+
+class SpaceInvadersEquality(TestCase):
+
+  def test_differing_shields(self):
+    from toybox.interventions.space_invaders import SpaceInvadersIntervention
+    from toybox.interventions.base import StandardEq
+    with Toybox('space_invaders') as tb:
+      with SpaceInvadersIntervention(tb) as intervention:
+        s1 = intervention.game
+      with SpaceInvadersIntervention(tb) as intervention:
+        s2 = intervention.game
+        s2.shields[0].data.coll[1][2].r = (s1.shields[0].data.coll[1][2].r + 1) % 256
+
+    for mode in [StandardEq, ProbEq, SetEq]:
+      for s in [s1, s2]: s.intervention.eq_mode = mode
+      self.assertTrue(s1.shields[1] == s2.shields[1], mode.__name__)
+      self.assertFalse(s1 == s2, mode.__name__)
+      self.assertFalse(s1.shields == s2.shields, mode.__name__)
+      self.assertFalse(s1.shields[0] == s2.shields[0], mode.__name__)
+      self.assertTrue(s1.shields[0].data == s1.shields[0].data, mode.__name__)
+
+    cmp = s1 == s2
+    self.assertIsInstance(cmp, SetEq)
+    self.assertEqual([k for k, _, _ in cmp.differs], ['shields[0].data.coll[1][2].r'])
+    for s in [s1, s2]: s.intervention.eq_mode = ProbEq
+    cmp = s1 == s2
+    self.assertIsInstance(cmp, ProbEq)
+    self.assertEqual(cmp.differ[0], 'shields[0].data.coll[1][2].r')
@@ -0,0 +1,60 @@
+from unittest import TestCase
+from ctoybox import Toybox, Input
+from toybox.fingerprint import state_fingerprint
+from toybox.interventions.breakout import BreakoutIntervention
+from toybox.interventions.fanout import FanOutIntervention, broadcast
+from toybox.interventions.space_invaders import SpaceInvadersIntervention
+
+
+class FanOutTests(TestCase):
+
+  def test_state_fan_out(self):
+    toyboxes = [Toybox('breakout', seed=i) for i in range(6)]
+    # Start from different states.
+    for i, tb in enumerate(toyboxes):
+      for _ in range(i): tb.apply_action(Input())
+
+    with FanOutIntervention(toyboxes, BreakoutIntervention, workers=3) as intervention:
+      intervention.game.bricks[3].alive = False
+      intervention.game.paddle.position.x = 50.
+
+    states = [tb.state_to_json() for tb in toyboxes]
+    self.assertTrue(all(not s['bricks'][3]['alive'] for s in states))
+    self.assertTrue(all(s['paddle']['position']['x'] == 50. for s in states))
+    self.assertEqual(len(set(state_fingerprint(tb) for tb in toyboxes)), 1)
+
+    # The copies are independent simulators.
+    toyboxes[1].apply_action(Input())
+    self.assertEqual(toyboxes[0].state_to_json(), states[0])
+
+  def test_no_changes(self):
+    toyboxes = [Toybox('breakout', seed=i) for i in range(3)]
+    toyboxes[1].apply_action(Input())
+    before = [state_fingerprint(tb) for tb in toyboxes]
+    with FanOutIntervention(toyboxes, BreakoutIntervention) as intervention:
+      intervention.game.paddle.position.x
+    self.assertEqual([state_fingerprint(tb) for tb in toyboxes], before)
+
+  def test_body_raises(self):
+    toyboxes = [Toybox('breakout') for _ in range(3)]
+    with self.assertRaises(KeyError):
+      with FanOutIntervention(toyboxes, BreakoutIntervention) as intervention:
+        intervention.game.bricks[3].alive = False
+        raise KeyError('bad edit')
+    self.assertTrue(all(tb.state_to_json()['bricks'][3]['alive'] for tb in toyboxes[1:]))
+
+  def test_config_fan_out(self):
+    toyboxes = [Toybox('space_invaders') for _ in range(4)]
+    with FanOutIntervention(toyboxes, SpaceInvadersIntervention) as intervention:
+      intervention.set_jitter(0.25)
+    self.assertEqual([tb.config_to_json()['jitter'] for tb in toyboxes], [0.25] * 4)
+    self.assertEqual(len(set(state_fingerprint(tb) for tb in toyboxes)), 1)
+
+  def test_broadcast(self):
+    source = Toybox('amidar')
+    targets = [Toybox('amidar') for _ in range(3)]
+    for _ in range(10): source.apply_action(Input())
+    broadcast(source, targets, workers=1)
+    self.assertEqual(set(state_fingerprint(tb) for tb in targets), {state_fingerprint(source)})
+    with self.assertRaises(AssertionError):
+      broadcast(source, [Toybox('breakout')])
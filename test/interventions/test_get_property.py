@@ -1,7 +1,7 @@
 from unittest import TestCase
 from ctoybox import Toybox
 from toybox.interventions.breakout import *
-from toybox.interventions.core import get_property, Color, parse_property_access
+from toybox.interventions.core import get_property, get_properties, set_properties, compile_property, Color, parse_property_access
 
 class BreakoutGetProperty(TestCase):
 
@@ -75,4 +75,22 @@ class BreakoutGetProperty(TestCase):
   
   def test_property_parsing(self):
     example = 'abc.def[7][8].y[5]'
-    self.assertListEqual(parse_property_access(example), ['abc', 'def', 7, 8, 'y', 5])
\ No newline at end of file
+    self.assertListEqual(parse_property_access(example), ['abc', 'def', 7, 8, 'y', 5])
+
+  def test_compiled_paths(self):
+    self.assertIs(compile_property('bricks[3].color.r'), compile_property('bricks[3].color.r'))
+    self.assertEqual(compile_property('abc.def[7][8].y[5]').steps, ('abc', 'def', 7, 8, 'y', 5))
+
+  def test_bulk_get_set(self):
+    with Toybox('breakout') as tb:
+      with BreakoutIntervention(tb) as intervention:
+        game = intervention.game
+        paths = ['bricks[3].color.r', 'bricks[3].color.g', 'paddle.position.x', 'bricks[3]', 'score']
+        self.assertEqual(get_properties(game, paths), [get_property(game, p) for p in paths])
+
+        set_properties(game, {'bricks[3].color.r': 7, 'bricks[3].alive': False, 'paddle_speed': 9.})
+        self.assertEqual(game.bricks[3].color.r, 7)
+        self.assertFalse(game.bricks[3].alive)
+        self.assertEqual(game.paddle_speed, 9.)
+      self.assertEqual(tb.state_to_json()['bricks'][3]['color']['r'], 7)
+
@@ -0,0 +1,63 @@
+from unittest import TestCase
+from ctoybox import Toybox
+from toybox.interventions.breakout import *
+from toybox.interventions.amidar import *
+
+class LazyInterventionTests(TestCase):
+
+  def test_lazy_fields_undecoded(self):
+    with Toybox('breakout') as tb:
+      with BreakoutIntervention(tb, lazy=True) as intervention:
+        game = intervention.game
+        self.assertNotIn('bricks', vars(game))
+        self.assertIn('bricks', game._lazy)
+        self.assertIsInstance(game.bricks, BrickCollection)
+        self.assertIn('bricks', vars(game))
+        self.assertNotIn('bricks', game._lazy)
+        self.assertFalse(intervention.dirty_state)
+
+  def test_lazy_matches_eager(self):
+    with Toybox('amidar') as tb:
+      with AmidarIntervention(tb) as eager:
+        with AmidarIntervention(tb, lazy=True) as lazy:
+          self.assertEqual(eager.game, lazy.game)
+          self.assertEqual(lazy.game.board.tiles, eager.game.board.tiles)
+
+  def test_lazy_write_back(self):
+    with Toybox('breakout') as tb:
+      state = tb.state_to_json()
+      with BreakoutIntervention(tb, lazy=True) as intervention:
+        intervention.game.bricks[0].alive = False
+        intervention.game.lives = 2
+      after = tb.state_to_json()
+      self.assertFalse(after['bricks'][0]['alive'])
+      self.assertEqual(after['lives'], 2)
+      self.assertEqual(after['bricks'][1:], state['bricks'][1:])
+
+  def test_lazy_unread_subtree_written_back(self):
+    with Toybox('amidar') as tb:
+      state = tb.state_to_json()
+      with AmidarIntervention(tb, lazy=True) as intervention:
+        intervention.game.jump_timer = 7
+      after = tb.state_to_json()
+      self.assertEqual(after['jump_timer'], 7)
+      self.assertEqual(after['board']['tiles'], state['board']['tiles'])
+      self.assertEqual(after['board']['boxes'], state['board']['boxes'])
+      self.assertEqual(sorted(after['board']['junctions']), sorted(state['board']['junctions']))
+      self.assertEqual(after['enemies'], state['enemies'])
+
+  def test_lazy_overwrite_undecoded(self):
+    with Toybox('amidar') as tb:
+      with AmidarIntervention(tb, lazy=True) as intervention:
+        board = Board.decode(intervention, tb.state_to_json()['board'], Board)
+        board.tiles[0][0] = Tile(intervention, Tile.Painted)
+        intervention.game.board = board
+        self.assertNotIn('board', intervention.game._lazy)
+        self.assertTrue(intervention.dirty_state)
+      self.assertEqual(tb.state_to_json()['board']['tiles'][0][0], Tile.Painted)
+
+  def test_config_fetched_on_read(self):
+    with Toybox('breakout') as tb:
+      with BreakoutIntervention(tb) as intervention:
+        self.assertIsNone(intervention._config)
+        self.assertIn('row_scores', intervention.config)
@@ -0,0 +1,70 @@
+from unittest import TestCase
+import copy
+from ctoybox import Toybox, Input
+from toybox.interventions.breakout import *
+from toybox.interventions.amidar import *
+
+class PatchWriteBackTests(TestCase):
+
+  def test_changed_paths(self):
+    with Toybox('breakout') as tb:
+      with BreakoutIntervention(tb) as intervention:
+        game = intervention.game
+        game.bricks[12].alive = False
+        game.paddle.position.x = 10.
+        game.lives = 2
+        game.bricks[3].color.r = 72
+        self.assertEqual(intervention.changed_paths(), 
+          ['bricks[12].alive', 'paddle.position.x', 'lives', 'bricks[3].color.r'])
+
+  def test_patch_matches_encode(self):
+    with Toybox('breakout') as tb:
+      with Toybox('breakout') as expected:
+        fire = Input()
+        fire.button1 = True
+        tb.apply_action(fire)
+        with BreakoutIntervention(tb) as intervention:
+          game = intervention.game
+          game.bricks[12].alive = False
+          game.paddle.velocity = Vec2D(intervention, 3., 4.)
+          game.balls[0].position.y = 100.
+          game.balls.append(Ball.decode(intervention, tb.state_to_json()['balls'][0], Ball))
+          game.score = 11
+          expected.write_state_json(game.encode())
+        self.assertEqual(tb.state_to_json(), expected.state_to_json())
+
+  def test_custom_encoding(self):
+    with Toybox('amidar') as tb:
+      with AmidarIntervention(tb) as intervention:
+        tile = intervention.game.board.tiles[0][0]
+        tile.tag = Tile.Painted if tile.tag != Tile.Painted else Tile.Unpainted
+        tag = tile.tag
+        self.assertEqual(intervention.changed_paths(), ['board.tiles[0][0]'])
+      self.assertEqual(tb.state_to_json()['board']['tiles'][0][0], tag)
+
+  def test_collection_replacement(self):
+    with Toybox('breakout') as tb:
+      with BreakoutIntervention(tb) as intervention:
+        brick = Brick.decode(intervention, tb.state_to_json()['bricks'][1], Brick)
+        brick.alive = False
+        intervention.game.bricks[0] = brick
+        intervention.game.balls.clear()
+        self.assertEqual(intervention.changed_paths(), ['bricks[0].alive', 'bricks[0]', 'balls'])
+      state = tb.state_to_json()
+      self.assertEqual(state['bricks'][0]['col'], state['bricks'][1]['col'])
+      self.assertFalse(state['bricks'][0]['alive'])
+      self.assertEqual(state['balls'], [])
+
+  def test_detached_falls_back(self):
+    with Toybox('breakout') as tb:
+      with BreakoutIntervention(tb) as intervention:
+        paddle = copy.copy(intervention.game.paddle)
+        paddle.position.x = 10.
+        intervention.game.lives = 2
+        self.assertEqual(intervention.changed_paths(), ['paddle.position.x', 'lives'])
+        old = intervention.game.paddle
+        intervention.game.paddle = Paddle.decode(intervention, old.encode(), Paddle)
+        old.position.x = 20.
+        self.assertIsNone(intervention.changed_paths()[-1])
+        self.assertIsNone(intervention.patched_state())
+      self.assertEqual(tb.state_to_json()['lives'], 2)
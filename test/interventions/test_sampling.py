@@ -0,0 +1,110 @@
+from unittest import TestCase
+from ctoybox import Toybox
+from toybox.interventions.breakout import BreakoutIntervention
+from toybox.interventions.core import inf_support, bool_support
+from toybox.interventions.sampling import Bernoulli, GaussianKDE, InverseCDF, ModelStore, Rounded, StateSampler
+
+import numpy as np
+import os
+import sys
+import tempfile
+
+
+class SamplingTests(TestCase):
+
+  def test_distributions(self):
+    data = np.random.default_rng(0).normal(100., 5., 500)
+    for model in [GaussianKDE.fit(data), InverseCDF.fit(data), GaussianKDE.fit(data).inverse_cdf(rng=0)]:
+      draws = model.sample(20000, np.random.default_rng(1))
+      self.assertEqual(draws.shape, (20000,))
+      self.assertAlmostEqual(draws.mean(), 100., delta=1.)
+      self.assertAlmostEqual(draws.std(), 5., delta=1.)
+      # Seeded draws are reproducible.
+      self.assertTrue(np.array_equal(model.sample(10, 3), model.sample(10, 3)))
+
+    draws = Bernoulli.fit([True, False, False, False]).sample(20000, 0)
+    self.assertEqual(draws.dtype, bool)
+    self.assertAlmostEqual(draws.mean(), 0.25, delta=0.02)
+
+  def test_state_sampler(self):
+    sampler = StateSampler({
+      'paddle.position.x': InverseCDF([10., 20.]),
+      'paddle_speed': GaussianKDE([4.], 0.),
+      'bricks[3].alive': Bernoulli(0.),
+    })
+    draws = sampler.sample(100, seed=0)
+    self.assertEqual({k: v.shape for k, v in draws.items()}, {k: (100,) for k in sampler.models})
+    self.assertTrue(((draws['paddle.position.x'] >= 10.) & (draws['paddle.position.x'] <= 20.)).all())
+
+    with Toybox('breakout') as tb:
+      with BreakoutIntervention(tb) as intervention:
+        game = sampler.apply(intervention.game, draws, 7)
+        self.assertEqual(game.paddle.position.x, draws['paddle.position.x'][7])
+        self.assertEqual(game.paddle_speed, 4.)
+        self.assertFalse(game.bricks[3].alive)
+      self.assertFalse(tb.state_to_json()['bricks'][3]['alive'])
+
+  def test_generated_modules(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      pkg = os.path.join(tmp, 'sampling_models')
+      os.makedirs(pkg)
+      open(os.path.join(pkg, '__init__.py'), 'w').close()
+      inf_support(os.path.join(pkg, 'speed'), [1., 2., 3.])
+      bool_support(os.path.join(pkg, 'alive'), [True, True])
+      sys.path.insert(0, tmp)
+      try:
+        sampler = StateSampler.from_modelmod('sampling_models', ['speed', 'alive'])
+        draws = sampler.sample(1000, seed=0)
+      finally:
+        sys.path.remove(tmp)
+        for name in [m for m in sys.modules if m.startswith('sampling_models')]:
+          del sys.modules[name]
+    self.assertIsInstance(sampler['speed'], GaussianKDE)
+    self.assertAlmostEqual(draws['speed'].mean(), 2., delta=0.2)
+    self.assertGreater(draws['alive'].mean(), 0.99)
+
+
+class ModelStoreTests(TestCase):
+
+  def test_fit_save_load(self):
+    games = []
+    with Toybox('breakout') as tb:
+      for seed in range(5):
+        with BreakoutIntervention(tb) as intervention:
+          intervention.game.paddle.position.x += seed
+          intervention.game.bricks[seed].alive = False
+          games.append(intervention.game)
+
+    store = ModelStore.from_games(games, processes=2)
+    self.assertIn('paddle.position.x', store)
+    self.assertIn('bricks[4].alive', store)
+    self.assertIsInstance(store['score'], Rounded)
+    self.assertNotIn('rand', store)
+
+    with tempfile.TemporaryDirectory() as tmp:
+      fname = os.path.join(tmp, 'breakout' + ModelStore.suffix)
+      store.save(fname)
+      loaded = ModelStore.load(fname)
+      self.assertEqual(loaded.paths, store.paths)
+      # Views of the mapped file, not copies.
+      self.assertFalse(loaded['paddle.position.x'].data.flags.owndata)
+      self.assertFalse(loaded['paddle.position.x'].data.flags.writeable)
+      for path in ['paddle.position.x', 'bricks[4].alive', 'score']:
+        self.assertTrue(np.array_equal(loaded[path].sample(50, 0), store[path].sample(50, 0)))
+
+      with Toybox('breakout') as tb:
+        with BreakoutIntervention(tb, modelmod=fname) as intervention:
+          draws = intervention.game.sample_batch(1000, 'bricks[4].alive', 'paddle.position.x', seed=0)
+          self.assertAlmostEqual(draws['bricks[4].alive'].mean(), 0.8, delta=0.05)
+          new = intervention.game.sample('paddle.position.x')
+          self.assertIsNotNone(new.paddle.position.x)
+
+  def test_failed_save(self):
+    store = ModelStore({'x': Bernoulli(0.5)})
+    with tempfile.TemporaryDirectory() as tmp:
+      # A directory cannot be replaced by the store, so the save fails.
+      fname = os.path.join(tmp, 'taken')
+      os.mkdir(fname)
+      with self.assertRaises(OSError):
+        store.save(fname)
+      self.assertEqual(os.listdir(tmp), ['taken'])
@@ -0,0 +1,44 @@
+from unittest import TestCase
+import os
+from ctoybox import Toybox
+import toybox.interventions.schema as schema
+from toybox.interventions.amidar import Amidar
+from toybox.interventions.breakout import Breakout
+from toybox.interventions.space_invaders import SpaceInvaders
+
+class SchemaCacheTests(TestCase):
+
+  def test_cache_matches_toybox(self):
+    self.assertTrue(os.path.isfile(schema.schema_path()))
+    for game_name in ['amidar', 'breakout', 'space_invaders']:
+      with Toybox(game_name) as tb:
+        self.assertEqual(schema.state_schema(game_name), tb.schema_for_state())
+
+  def test_class_keys(self):
+    with Toybox('breakout') as tb:
+      required = tb.schema_for_state()['required']
+    self.assertEqual(Breakout.expected_keys, required)
+    self.assertEqual(Breakout.eq_keys, [k for k in required if k != 'rand'])
+    self.assertEqual(Breakout.schema['required'], required)
+    self.assertNotIn('rand', Amidar.eq_keys)
+    self.assertIn('rand', SpaceInvaders.expected_keys)
+
+  def test_generates_missing(self):
+    saved, save = schema._schemas, schema._save
+    written = []
+    try:
+      schema._schemas = {}
+      schema._save = written.append
+      self.assertIn('required', schema.state_schema('breakout'))
+      self.assertEqual(list(written[0].keys()), ['breakout'])
+    finally:
+      schema._schemas, schema._save = saved, save
+
+  def test_save_cleans_up(self):
+    saved, dir_ = schema._load(), schema.SCHEMA_DIR
+    before = set(os.listdir(dir_))
+    # Not serializable, so the dump fails half way.
+    with self.assertRaises(TypeError):
+      schema._save({'broken': object()})
+    self.assertEqual(set(os.listdir(dir_)), before)
+    self.assertEqual(schema._load(), saved)
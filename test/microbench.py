@@ -0,0 +1,211 @@
+"""Microbenchmarks of the intervention machinery.
+
+Times the pieces every intervention goes through, per game: entering and
+exiting an Intervention (clean, lazy, and with one change written back),
+BaseMixin.decode and encode of the whole game, get_property, and comparing
+two decoded games under each equality mode. Besides latency, each operation
+is run once more under tracemalloc to report the objects it leaves alive
+(e.g. the decoded game, or cycles left for the garbage collector), its peak
+traced memory, and the memory it retains. The operations on a game share
+one simulator and one open intervention, but each equality mode compares
+its own pair of decoded games, since content hashes are cached once
+computed: the eq numbers are for comparing the same two games repeatedly.
+
+    python -m test.microbench --games breakout --json micro.json
+    python -m test.microbench --baseline micro.json --tolerance 0.15
+
+test/profile.py shows why this matters: a single call to inspect in the
+mixins once made entering an intervention 700 times slower. With
+--baseline, the run fails (exit status 1) if any operation's throughput
+drops by more than the tolerance.
+"""
+import argparse
+import gc
+import json
+import sys
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+from ctoybox import Toybox
+
+from test import bench
+from toybox.interventions.base import StandardEq, ProbEq, SetEq
+from toybox.interventions.core import get_property
+
+GAMES = ['breakout', 'amidar', 'space_invaders']
+
+PATHS = {
+  'breakout': ['paddle.position.x', 'bricks[50].alive'],
+  'amidar': ['player.position.x', 'enemies[2].position.y'],
+  'space_invaders': ['ship.x', 'enemies[10].alive'],
+}
+
+OPS = ['enter_exit', 'enter_exit_lazy', 'enter_exit_dirty', 'decode', 'encode',
+       'get_property', 'eq_standard', 'eq_prob', 'eq_set']
+
+
+def _intervention_class(game):
+  from toybox.interventions.breakout import BreakoutIntervention
+  from toybox.interventions.amidar import AmidarIntervention
+  from toybox.interventions.space_invaders import SpaceInvadersIntervention
+  return {'breakout': BreakoutIntervention, 'amidar': AmidarIntervention,
+          'space_invaders': SpaceInvadersIntervention}[game]
+
+
+@contextmanager
+def make_ops(game, warm_steps=50):
+  """The operations for `game`, as functions of no arguments, on a state `warm_steps` frames into a game.
+
+  Yields them with the simulator and the intervention they share still open;
+  both are closed when the block exits."""
+  clz = _intervention_class(game)
+  with Toybox(game) as tb:
+    actions = tb.get_legal_action_set()
+    for i in range(warm_steps):
+      tb.apply_ale_action(actions[i % len(actions)])
+
+    with clz(tb) as intervention:
+      state = intervention.state
+      game_clz = intervention.clz
+      paths = PATHS[game]
+
+      def enter_exit():
+        with clz(tb):
+          pass
+
+      def enter_exit_lazy():
+        with clz(tb, lazy=True):
+          pass
+
+      def enter_exit_dirty():
+        with clz(tb) as i:
+          i.game.lives = i.game.lives
+
+      def decode():
+        return game_clz.decode(intervention, state, game_clz)
+
+      def encode():
+        return intervention.game.encode()
+
+      def properties():
+        return [get_property(intervention.game, path) for path in paths]
+
+      def equal(mode):
+        # Content hashes are cached once computed, so each mode compares
+        # its own pair of games.
+        this, other = decode(), decode()
+        def op():
+          intervention.eq_mode = mode
+          return this == other
+        return op
+
+      yield {
+        'enter_exit': enter_exit,
+        'enter_exit_lazy': enter_exit_lazy,
+        'enter_exit_dirty': enter_exit_dirty,
+        'decode': decode,
+        'encode': encode,
+        'get_property': properties,
+        'eq_standard': equal(StandardEq),
+        'eq_prob': equal(ProbEq),
+        'eq_set': equal(SetEq),
+      }
+
+
+def allocations(op):
+  """Runs op once; returns the objects it leaves alive, and its peak and retained traced memory in bytes.
+
+  Objects are counted before the garbage collector runs, with the op's
+  result still held, so they include both what it returns and any reference
+  cycles it leaves behind. Only objects tracked by the collector count."""
+  gc.collect()
+  gc.disable()
+  try:
+    # Holding the objects from before keeps their ids from being reused.
+    before = gc.get_objects()
+    seen = set(map(id, before))
+    tracemalloc.start()
+    result = op()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    objects = len([obj for obj in gc.get_objects() if id(obj) not in seen])
+    del before, result
+  finally:
+    gc.enable()
+  return objects, peak, retained
+
+
+def run_op(op, iterations, warmup, repeats):
+  rates, latencies = [], []
+  for _ in range(repeats):
+    seconds, lat = bench.measure(op, iterations, warmup)
+    rates.append(iterations / seconds)
+    latencies.append(lat)
+  latencies = np.concatenate(latencies) / 1e3
+  p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+  objects, peak, retained = allocations(op)
+  return {
+    'ops_per_sec': float(np.median(rates)),
+    'repeats': [float(r) for r in rates],
+    'mean_us': float(latencies.mean()),
+    'p50_us': float(p50),
+    'p90_us': float(p90),
+    'p99_us': float(p99),
+    'objects': objects,
+    'peak_kb': peak / 1024.,
+    'retained_kb': retained / 1024.,
+  }
+
+
+def run(games, ops, iterations=200, warmup=20, repeats=5, log=None):
+  results = {}
+  for game in games:
+    results[game] = {}
+    with make_ops(game) as game_ops:
+      for name in ops:
+        result = run_op(game_ops[name], iterations, warmup, repeats)
+        results[game][name] = result
+        if log is not None:
+          log(game, name, result)
+  return {'meta': bench.metadata(iterations, warmup, repeats), 'results': results}
+
+
+def print_result(game, name, result):
+  print('%-15s %-17s %9.0f ops/s  p50 %9.1fus  p99 %9.1fus  %7d objects  peak %9.1fKiB  retained %9.1fKiB' % (
+    game, name, result['ops_per_sec'], result['p50_us'], result['p99_us'],
+    result['objects'], result['peak_kb'], result['retained_kb']))
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Intervention microbenchmarks')
+  parser.add_argument('--games', nargs='+', default=GAMES, choices=GAMES)
+  parser.add_argument('--ops', nargs='+', default=OPS, choices=OPS)
+  parser.add_argument('--iterations', type=int, default=200)
+  parser.add_argument('--warmup', type=int, default=20)
+  parser.add_argument('--repeats', type=int, default=5)
+  parser.add_argument('--json', help='write the report to this file')
+  parser.add_argument('--baseline', help='report from an earlier run to check for regressions')
+  parser.add_argument('--tolerance', type=float, default=0.15,
+                      help='allowed fractional drop in throughput against the baseline')
+  args = parser.parse_args(argv)
+
+  report = run(args.games, args.ops, args.iterations, args.warmup, args.repeats, log=print_result)
+  if args.json:
+    with open(args.json, 'w') as f:
+      json.dump(report, f, indent=2, sort_keys=True)
+
+  if args.baseline:
+    with open(args.baseline) as f:
+      baseline = json.load(f)
+    slower = bench.regressions(report, baseline, args.tolerance, key='ops_per_sec')
+    for game, name, before, after in slower:
+      print('REGRESSION %s %s: %.0f -> %.0f ops/s (%.0f%%)' % (
+        game, name, before, after, 100. * (after - before) / before))
+    if slower:
+      return 1
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
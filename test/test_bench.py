@@ -0,0 +1,24 @@
+from unittest import TestCase
+from test import bench
+
+
+class BenchTests(TestCase):
+
+  def test_run(self):
+    report = bench.run(['breakout'], ['raw', 'intervention', 'intervention_patch'], iterations=20, warmup=2, repeats=2)
+    self.assertEqual(report['meta']['iterations'], 20)
+    for layer in ['raw', 'intervention', 'intervention_patch']:
+      result = report['results']['breakout'][layer]
+      self.assertEqual(len(result['repeats']), 2)
+      self.assertGreater(result['frames_per_sec'], 0)
+      self.assertLessEqual(result['p50_us'], result['p99_us'])
+
+  def test_regressions(self):
+    baseline = {'results': {'breakout': {'raw': {'frames_per_sec': 1000.}, 'env': {'frames_per_sec': 100.}}}}
+    report = {'results': {'breakout': {
+      'raw': {'frames_per_sec': 800.},
+      'env': {'frames_per_sec': 95.},
+      'vec': {'frames_per_sec': 1.},
+      'deepmind': {'skipped': 'baselines is not importable'}}}}
+    self.assertEqual(bench.regressions(report, baseline, 0.1), [('breakout', 'raw', 1000., 800.)])
+    self.assertEqual(bench.regressions(report, baseline, 0.25), [])
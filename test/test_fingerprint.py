@@ -0,0 +1,49 @@
+from unittest import TestCase
+from ctoybox import Toybox, Input
+from toybox.fingerprint import state_fingerprint, TranspositionTable
+from toybox.snapshot import Snapshot
+
+
+class FingerprintTests(TestCase):
+
+  def test_same_state_same_fingerprint(self):
+    with Toybox('amidar', seed=1) as tb1, Toybox('amidar', seed=2) as tb2:
+      # Different seeds and separately built boards: only rand and the
+      # order of the junction sets differ.
+      self.assertEqual(state_fingerprint(tb1), state_fingerprint(tb2))
+      snapshot = Snapshot.take(tb1)
+      self.assertEqual(state_fingerprint(snapshot), state_fingerprint(tb1))
+      self.assertEqual(state_fingerprint(tb1.state_to_json(), 'amidar'), state_fingerprint(tb1))
+
+      tb1.apply_action(Input())
+      self.assertNotEqual(state_fingerprint(tb1), state_fingerprint(tb2))
+      snapshot.restore(tb1)
+      self.assertEqual(state_fingerprint(tb1), state_fingerprint(tb2))
+
+  def test_games_differ(self):
+    with Toybox('breakout') as tb:
+      state = tb.state_to_json()
+    self.assertNotEqual(state_fingerprint(state, 'breakout'), state_fingerprint(state, 'amidar'))
+    self.assertNotEqual(state_fingerprint(state, 'breakout'), state_fingerprint(state, 'breakout', exclude=()))
+
+
+class TranspositionTableTests(TestCase):
+
+  def test_visit(self):
+    table = TranspositionTable(capacity=2)
+    self.assertTrue(table.visit(b'a', 1))
+    self.assertFalse(table.visit(b'a', 2))
+    self.assertEqual(table[b'a'], 1)
+    self.assertEqual((table.hits, table.misses), (1, 1))
+
+    table.visit(b'b')
+    # a was used more recently than b, so b is evicted.
+    table[b'a']
+    table.visit(b'c')
+    self.assertEqual(len(table), 2)
+    self.assertIn(b'a', table)
+    self.assertNotIn(b'b', table)
+    self.assertIsNone(table.get(b'b'))
+
+    table.clear()
+    self.assertEqual(len(table), 0)
@@ -0,0 +1,34 @@
+from unittest import TestCase
+from test import bench, microbench
+
+
+class MicrobenchTests(TestCase):
+
+  def test_run(self):
+    report = microbench.run(['breakout'], ['enter_exit', 'eq_prob'], iterations=5, warmup=1, repeats=2)
+    for name in ['enter_exit', 'eq_prob']:
+      result = report['results']['breakout'][name]
+      self.assertEqual(len(result['repeats']), 2)
+      self.assertGreater(result['ops_per_sec'], 0)
+      self.assertGreater(result['peak_kb'], 0)
+
+  def test_every_op(self):
+    for game in microbench.GAMES:
+      with microbench.make_ops(game, warm_steps=5) as ops:
+        self.assertEqual(sorted(ops), sorted(microbench.OPS))
+        for name, op in ops.items():
+          op()
+
+  def test_decode_objects(self):
+    # Decoding Breakout leaves about 450 objects; many more means the mixins
+    # have started allocating per field.
+    with microbench.make_ops('breakout') as ops:
+      objects, peak, retained = microbench.allocations(ops['decode'])
+    self.assertGreater(objects, 100)
+    self.assertLess(objects, 3000)
+    self.assertGreaterEqual(peak, retained)
+
+  def test_regressions(self):
+    baseline = {'results': {'breakout': {'decode': {'ops_per_sec': 100.}}}}
+    report = {'results': {'breakout': {'decode': {'ops_per_sec': 80.}}}}
+    self.assertEqual(bench.regressions(report, baseline, 0.1, key='ops_per_sec'), [('breakout', 'decode', 100., 80.)])
@@ -0,0 +1,73 @@
+from unittest import TestCase
+from ctoybox import Toybox, Input
+from toybox.interventions.breakout import BreakoutIntervention
+from toybox.rollout import RolloutEngine, oracle
+from toybox.snapshot import Snapshot
+
+import numpy as np
+
+
+def add_channel(intervention):
+  intervention.add_channel(0)
+
+def lose_lives(intervention):
+  intervention.game.lives = 1
+
+def broken(intervention):
+  raise ValueError('no such brick')
+
+
+class RolloutTests(TestCase):
+
+  def setUp(self):
+    with Toybox('breakout') as tb:
+      fire = Input()
+      fire.button1 = True
+      tb.apply_action(fire)
+      self.base = Snapshot.take(tb)
+    self.variants = {'base': None, 'channel': add_channel, 'one_life': lose_lives}
+    self.features = {'channels': oracle(BreakoutIntervention, 'channel_count')}
+
+  def run_engine(self, processes, steps=30):
+    seen = []
+    def policy(frames):
+      seen.append(frames.copy())
+      # Always FIRE (ALE action 1), so lost balls are relaunched.
+      return [1] * len(frames)
+    engine = RolloutEngine('breakout', BreakoutIntervention, self.features, processes=processes)
+    return list(engine.run(self.base, self.variants, steps, policy)), seen
+
+  def test_records(self):
+    records, frames = self.run_engine(processes=2)
+    first = {r['variant']: r for r in records if r['step'] == 0}
+    self.assertEqual(first['base']['channels'], 0)
+    self.assertEqual(first['channel']['channels'], 1)
+    self.assertEqual(first['one_life']['lives'], 1)
+    self.assertEqual(sorted(set(r['step'] for r in records)), list(range(31)))
+    self.assertTrue(all(r['action'] == 1 for r in records if r['step'] > 0))
+
+    self.assertEqual(len(frames), 30)
+    self.assertEqual(frames[0].shape[0], 3)
+    self.assertGreater(frames[-1].sum(), 0)
+
+  def test_in_process_matches_workers(self):
+    local, local_frames = self.run_engine(processes=0)
+    for processes in [2, 3]:
+      # With two workers, the shards hold variants 0 and 2, and 1; records
+      # still come in the order of the variants.
+      remote, remote_frames = self.run_engine(processes=processes)
+      self.assertEqual(local, remote)
+      self.assertTrue(all(np.array_equal(a, b) for a, b in zip(local_frames, remote_frames)))
+    self.assertEqual([r['variant'] for r in local if r['step'] == 1], list(self.variants))
+
+  def test_stops_when_done(self):
+    engine = RolloutEngine('breakout', BreakoutIntervention, processes=0)
+    records = list(engine.run(self.base, {'one_life': lose_lives}, 2000))
+    self.assertTrue(records[-1]['done'])
+    self.assertLess(records[-1]['step'], 2000)
+
+  def test_worker_errors(self):
+    engine = RolloutEngine('breakout', BreakoutIntervention, processes=2)
+    with self.assertRaises(RuntimeError) as cm:
+      list(engine.run(self.base, {'base': None, 'broken': broken}, 5))
+    self.assertIn("ValueError: no such brick", str(cm.exception))
@@ -0,0 +1,148 @@
+from unittest import TestCase
+import numpy as np
+import os
+import shutil
+import tempfile
+import time
+from multiprocessing import AuthenticationError
+from toybox.server import SimulationServer, SimulationClient, key_path
+import toybox.server as server
+
+
+class ServerTests(TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.address = os.path.join(self.tmpdir, 'toybox.sock')
+    self.server = SimulationServer(self.address, max_idle=4).start()
+    self.client = SimulationClient(self.address)
+
+  def tearDown(self):
+    self.client.close()
+    self.server.close()
+    shutil.rmtree(self.tmpdir)
+
+  def test_matches_local_env(self):
+    from toybox.envs.atari import BreakoutEnv
+    local = BreakoutEnv()
+    remote, = self.client.make('breakout')
+    self.assertEqual(remote.observation_space.shape, local.observation_space.shape)
+    self.assertEqual(remote.action_space.n, local.action_space.n)
+    self.assertTrue(np.array_equal(remote.reset(), local.reset()))
+    actions = np.random.RandomState(1337).randint(0, local.action_space.n, size=100)
+    for action in actions:
+      obs1, reward1, done1, info1 = local.step(action)
+      obs2, reward2, done2, info2 = remote.step(action)
+      self.assertTrue(np.array_equal(obs1, obs2))
+      self.assertEqual((reward1, done1, info1['lives'], info1['score']),
+                       (reward2, done2, info2['lives'], info2['score']))
+    self.assertEqual(remote.ale.lives(), local.ale.lives())
+
+  def test_batched_step(self):
+    envs = self.client.make('amidar', 3, grayscale=False)
+    obs = self.client.reset(envs)
+    self.assertEqual(obs.shape, (3,) + envs[0].observation_space.shape)
+    self.assertEqual(obs.shape[-1], 4)
+    for _ in range(10):
+      obs, rewards, dones, infos = self.client.step(envs, [3, 4, 0])
+    self.assertEqual(len(infos), 3)
+    # The observations are copies, so they survive the next step.
+    kept = obs.copy()
+    self.client.step(envs, [3, 4, 0])
+    self.assertTrue(np.array_equal(obs, kept))
+
+  def test_snapshot_restore(self):
+    env1, env2 = self.client.make('breakout', 2)
+    self.client.reset([env1, env2])
+    for _ in range(30):
+      env1.step(1)
+    env2.restore(env1.snapshot())
+    self.assertTrue(np.array_equal(env1.render(), env2.render()))
+    self.assertEqual(env1.step(2)[1:3], env2.step(2)[1:3])
+
+  def test_pool(self):
+    other = SimulationClient(self.address)
+    envs = other.make('breakout', 2)
+    # The frame file is removed once mapped.
+    self.assertFalse(os.path.exists(envs[0]._frame.filename))
+    self.assertEqual(self.server.stats(), {'active': 2, 'idle': 0})
+    other.release(envs)
+    self.assertEqual(self.server.stats(), {'active': 0, 'idle': 2})
+    # Simulators are reused for the same game and config.
+    self.client.make('breakout', 3)
+    self.assertEqual(self.server.stats(), {'active': 3, 'idle': 0})
+    self.client.make('amidar')
+    self.assertEqual(self.server.stats(), {'active': 4, 'idle': 0})
+    other.close()
+
+  def test_pool_resets_seed(self):
+    from ctoybox import Toybox
+    with Toybox('breakout') as tb:
+      start = tb.state_to_json()
+      tb.new_game()
+      second = tb.state_to_json()
+    other = SimulationClient(self.address)
+    env, = other.make('breakout')
+    env.seed(1234)
+    for _ in range(20):
+      env.step(1)
+    other.close()
+    for _ in range(100):
+      if self.server.stats()['active'] == 0: break
+      time.sleep(0.01)
+    self.assertEqual(self.server.stats(), {'active': 0, 'idle': 1})
+    # The next client gets the default start state, not the previous seed's.
+    env, = self.client.make('breakout')
+    self.assertEqual(env.snapshot().to_json(), start)
+    env.reset()
+    self.assertEqual(env.snapshot().to_json(), second)
+
+  def test_disconnect_releases(self):
+    other = SimulationClient(self.address)
+    other.make('breakout', 2)
+    other.close()
+    for _ in range(100):
+      if self.server.stats()['active'] == 0: break
+      time.sleep(0.01)
+    self.assertEqual(self.server.stats(), {'active': 0, 'idle': 2})
+
+  def test_other_clients_simulators(self):
+    other = SimulationClient(self.address)
+    env, = other.make('breakout')
+    env.client = self.client
+    with self.assertRaises(ValueError):
+      env.step(0)
+    other.close()
+
+  def test_authkey(self):
+    self.assertEqual(os.stat(self.address).st_mode & 0o777, 0o600)
+    self.assertEqual(os.stat(key_path(self.address)).st_mode & 0o777, 0o600)
+    with self.assertRaises(AuthenticationError):
+      SimulationClient(self.address, authkey=b'wrong')
+    self.server.close()
+    self.assertFalse(os.path.exists(key_path(self.address)))
+
+  def test_given_authkey(self):
+    address = os.path.join(self.tmpdir, 'keyed.sock')
+    keyed = SimulationServer(address, authkey=b'secret').start()
+    try:
+      self.assertFalse(os.path.exists(key_path(address)))
+      client = SimulationClient(address, authkey=b'secret')
+      self.assertEqual(client.stats(), {'active': 0, 'idle': 0})
+      client.close()
+    finally:
+      keyed.close()
+
+  def test_removes_stale_frames(self):
+    # A pid that is not running: beyond the kernel's pid range.
+    stale = os.path.join(server._frames_dir(), server.FRAMES_PREFIX + '%d-test' % (2 ** 22 + 1))
+    live = os.path.join(server._frames_dir(), server.FRAMES_PREFIX + '%d-test' % os.getpid())
+    for path in [stale, live]:
+      open(path, 'w').close()
+    try:
+      SimulationServer(os.path.join(self.tmpdir, 'other.sock')).close()
+      self.assertFalse(os.path.exists(stale))
+      self.assertTrue(os.path.exists(live))
+    finally:
+      for path in [stale, live]:
+        if os.path.exists(path): os.unlink(path)
@@ -0,0 +1,50 @@
+from unittest import TestCase
+import os
+import subprocess
+import sys
+
+# Generous, to leave room for slow machines; importing toybox.interventions
+# used to take over two seconds, most of it in gym and sklearn.
+IMPORT_BUDGET_SECONDS = 1.0
+HEAVY_MODULES = ['gym', 'atari_py', 'sklearn']
+
+def subprocess_env():
+  env = dict(os.environ)
+  root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+  env['PYTHONPATH'] = os.pathsep.join([root] + [p for p in [env.get('PYTHONPATH')] if p])
+  return env
+
+def import_in_subprocess(module):
+  """Imports module in a fresh interpreter; returns its cumulative import time in seconds and the heavy modules loaded."""
+  code = 'import sys, {0}; print(" ".join(m for m in {1} if m in sys.modules))'.format(module, HEAVY_MODULES)
+  proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+    env=subprocess_env(), stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+  cumulative = None
+  for line in proc.stderr.splitlines():
+    # import time: self [us] | cumulative | imported package
+    fields = [f.strip() for f in line.split('|')]
+    if len(fields) == 3 and fields[2] == module:
+      cumulative = int(fields[1]) / 1e6
+  return cumulative, proc.stdout.split()
+
+class StartupTests(TestCase):
+
+  def test_ctoybox_only(self):
+    seconds, loaded = import_in_subprocess('toybox')
+    self.assertEqual(loaded, [])
+    self.assertLess(seconds, IMPORT_BUDGET_SECONDS)
+
+  def test_interventions_only(self):
+    seconds, loaded = import_in_subprocess('toybox.interventions')
+    self.assertEqual(loaded, [])
+    self.assertLess(seconds, IMPORT_BUDGET_SECONDS)
+
+  def test_gym_registration(self):
+    code = 'import toybox, gym; gym.spec("BreakoutToyboxNoFrameskip-v4"); gym.spec("AmidarToyboxNoFrameskip-v4")'
+    subprocess.run([sys.executable, '-c', code], env=subprocess_env(), check=True)
+
+  def test_gym_registration_after_probe(self):
+    # Looking gym up without importing it must not use up the registration.
+    code = ('import importlib.util, toybox; importlib.util.find_spec("gym"); import gym; '
+      'gym.spec("BreakoutToyboxNoFrameskip-v4"); gym.spec("SpaceInvadersToyboxNoFrameskip-v4")')
+    subprocess.run([sys.executable, '-c', code], env=subprocess_env(), check=True)
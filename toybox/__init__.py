@@ -1,7 +1,19 @@
 import ctoybox
 from ctoybox import Toybox, Simulator, State, Input
+from toybox.snapshot import Snapshot
+from toybox.fingerprint import state_fingerprint, TranspositionTable
 
-try: 
+import importlib.abc
+import importlib.util
+import sys
+
+_registered = False
+
+def register_envs():
+    """Register the Toybox environments with gym. Safe to call more than once."""
+    global _registered
+    if _registered:
+        return
     from gym.envs.registration import register
 
     # Updated to use v4 to be analogous with the    ALE versioning
@@ -22,9 +34,41 @@ try:
         entry_point='toybox.envs.atari:SpaceInvadersEnv',
         nondeterministic=False
     )
+    _registered = True
+
+
+class _RegisterWithGym(importlib.abc.MetaPathFinder):
+    """Registers the environments as soon as gym is imported.
+
+    Importing gym takes a large share of the startup time of processes that
+    only use the simulators or interventions, so we do not import it
+    ourselves; `import toybox; gym.make('BreakoutToyboxNoFrameskip-v4')`
+    still works."""
+
+    _finding = False
 
-    print("Registered Toybox environments with gym.")
+    def find_spec(self, fullname, path, target=None):
+        if fullname != 'gym' or self._finding:
+            return None
+        # Ask the other finders; a probe such as importlib.util.find_spec('gym')
+        # also ends up here, so we stay installed until gym is executed.
+        self._finding = True
+        try:
+            spec = importlib.util.find_spec(fullname)
+        finally:
+            self._finding = False
+        if spec is None or spec.loader is None:
+            return spec
+        exec_module = spec.loader.exec_module
+        def exec_and_register(module):
+            exec_module(module)
+            if self in sys.meta_path:
+                sys.meta_path.remove(self)
+            register_envs()
+        spec.loader.exec_module = exec_and_register
+        return spec
 
-except:
-    # ModuleNotFoundError only in 3.6 and above
-    print("Loaded Toybox environments.")
+if 'gym' in sys.modules:
+    register_envs()
+elif importlib.util.find_spec('gym') is not None:
+    sys.meta_path.insert(0, _RegisterWithGym())
@@ -0,0 +1,203 @@
+"""asyncio front ends for Toybox envs and vec envs.
+
+    env = AsyncEnv(BreakoutEnv())
+    obs = await env.reset()
+    obs, reward, done, info = await env.step(1)
+
+    async for t in env.episode(policy):
+        ...
+
+Every blocking call runs in an executor, by default one thread pool shared
+by all async envs with a thread per CPU, so the event loop stays free and
+hundreds of concurrent episodes share a few threads rather than needing one
+each. The simulators release the GIL while stepping, so the threads do run
+in parallel. Calls made during the same pass of the event loop are handed
+to the executor together, split into one task per thread, so a step costs
+a thread hand-off per batch rather than per env.
+"""
+import asyncio
+import inspect
+import os
+import weakref
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+# One step of an episode: the action taken on obs, and what it led to.
+Transition = namedtuple('Transition', ['obs', 'action', 'reward', 'next_obs', 'done', 'info'])
+
+_executor = None
+_executor_lock = Lock()
+
+
+def default_executor():
+    """The thread pool shared by async envs created without an executor."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix='toybox-aio')
+        return _executor
+
+
+class _Batcher(object):
+    # Runs the calls submitted during one pass of the event loop as at most
+    # `workers` executor tasks, and resolves their futures from one callback
+    # per task. The loop is held weakly, since batchers are kept per loop.
+
+    def __init__(self, loop, executor):
+        self._loop = weakref.ref(loop)
+        self.executor = executor
+        self.workers = getattr(executor, '_max_workers', None) or os.cpu_count() or 1
+        self.pending = []
+
+    def submit(self, fn, *args):
+        loop = self._loop()
+        future = loop.create_future()
+        if not self.pending:
+            loop.call_soon(self._flush)
+        self.pending.append((future, fn, args))
+        return future
+
+    def _flush(self):
+        pending, self.pending = self.pending, []
+        n = min(self.workers, len(pending))
+        for i in range(n):
+            calls = pending[i::n]
+            try:
+                self.executor.submit(self._run, calls)
+            except RuntimeError as e:
+                # The executor was shut down.
+                _resolve([(future, None, e) for future, _, _ in calls])
+
+    def _run(self, calls):
+        results = []
+        for future, fn, args in calls:
+            try:
+                results.append((future, fn(*args), None))
+            except BaseException as e:
+                results.append((future, None, e))
+        try:
+            results[0][0].get_loop().call_soon_threadsafe(_resolve, results)
+        except RuntimeError:
+            # The loop was closed while the calls ran.
+            pass
+
+
+def _resolve(results):
+    for future, result, error in results:
+        if future.cancelled():
+            continue
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+
+# event loop -> {executor: _Batcher}
+_batchers = weakref.WeakKeyDictionary()
+
+
+def _batcher(executor):
+    loop = asyncio.get_running_loop()
+    batchers = _batchers.setdefault(loop, {})
+    if executor not in batchers:
+        batchers[executor] = _Batcher(loop, executor)
+    return batchers[executor]
+
+
+class _Serialized(object):
+    # Runs blocking calls in the executor, one at a time per object.
+
+    def __init__(self, executor):
+        self.executor = executor if executor is not None else default_executor()
+        self._lock = None
+
+    async def _serialized(self, fn, *args):
+        # Created on first use, so the lock belongs to the running loop.
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        await self._lock.acquire()
+        try:
+            future = _batcher(self.executor).submit(fn, *args)
+        except BaseException:
+            self._lock.release()
+            raise
+        # fn runs on even if the caller is cancelled, so the lock is only
+        # released once it is done, and the future is shielded from the
+        # cancellation so that it still gets fn's result.
+        future.add_done_callback(lambda _: self._lock.release())
+        return await asyncio.shield(future)
+
+
+class AsyncEnv(_Serialized):
+    """Wraps a gym env (such as ToyboxBaseEnv, or a wrapper stack around one) with awaitable methods.
+
+    Calls on one AsyncEnv run one at a time, in the order they were made;
+    calls on different envs overlap."""
+
+    def __init__(self, env, executor=None):
+        super().__init__(executor)
+        self.env = env
+
+    @property
+    def action_space(self):
+        return self.env.action_space
+
+    @property
+    def observation_space(self):
+        return self.env.observation_space
+
+    async def step(self, action):
+        return await self._serialized(self.env.step, action)
+
+    async def reset(self):
+        return await self._serialized(self.env.reset)
+
+    async def seed(self, seed=None):
+        return await self._serialized(self.env.seed, seed)
+
+    async def episode(self, policy, max_steps=None):
+        """Resets the env and yields a Transition per step until the episode ends or after max_steps.
+
+        `policy(obs)` returns the action to take, or an awaitable of it (so
+        inference can be batched across episodes)."""
+        obs = await self.reset()
+        steps = 0
+        while max_steps is None or steps < max_steps:
+            action = policy(obs)
+            if inspect.isawaitable(action):
+                action = await action
+            next_obs, reward, done, info = await self.step(action)
+            yield Transition(obs, action, reward, next_obs, done, info)
+            steps += 1
+            if done:
+                return
+            obs = next_obs
+
+    async def close(self):
+        return await self._serialized(self.env.close)
+
+
+class AsyncVecEnv(_Serialized):
+    """Wraps a VecEnv (anything with step_async, step_wait and reset) with awaitable methods."""
+
+    def __init__(self, venv, executor=None):
+        super().__init__(executor)
+        self.venv = venv
+
+    @property
+    def num_envs(self):
+        return self.venv.num_envs
+
+    def _step(self, actions):
+        self.venv.step_async(actions)
+        return self.venv.step_wait()
+
+    async def step(self, actions):
+        return await self._serialized(self._step, actions)
+
+    async def reset(self):
+        return await self._serialized(self.venv.reset)
+
+    async def close(self):
+        return await self._serialized(self.venv.close)
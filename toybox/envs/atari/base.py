@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from functools import partial
 from gym import Env, error, spaces, utils
 from gym.utils import seeding
 try:
@@ -6,6 +7,9 @@ try:
 except ImportError:
     np_random = seeding.np_random
 from toybox.envs.atari.constants import ACTION_MEANING, ACTION_LOOKUP
+from toybox.envs.atari.render import FrameRenderer
+from toybox.envs.atari.timing import StageTimer, ENV_STAGES, TOYBOX_STAGES, time_methods, untime_methods
+from toybox.snapshot import Snapshot
 from gym.envs.atari import AtariEnv
 from gym import utils
 
@@ -37,15 +41,31 @@ class MockALE():
 
 class ToyboxBaseEnv(AtariEnv, ABC):
     metadata = {'render.modes': ['human']}
+    obs_modes = ['image', 'deepmind']
+    # Frame size of the deepmind observation mode, as in the Nature DQN paper.
+    warp_width = 84
+    warp_height = 84
     
     def __init__(self, toybox, game, frameskip=(2, 5), repeat_action_probability=0., grayscale=True, alpha=False, actions=None):
         assert(toybox.rstate)
         self.toybox = toybox
         # This is a workaround for issues with Gym wrappers
-        # resetting state prematurely
-        self.cached_state = None
+        # resetting state prematurely; see cached_state.
+        self._cached_snapshot = None
         self.score = self.toybox.get_score()
         self.viewer = None
+        # Set by set_obs_buffer; None means every observation is a fresh frame.
+        self._out = None
+        self._renderer = None
+        # Frames kept for max-pooling in step_repeat, and their renderers.
+        self._pool = None
+        self._pool_renderers = []
+        # Full-size grayscale frame that the deepmind mode warps from.
+        self._frame = None
+        self._frame_renderer = None
+        self._resize = None
+        # The StageTimer while timing is enabled; see enable_timing.
+        self.timer = None
 
         # Required for compatability with OpenAI Gym's Atari wrappers
         self._np_random = None
@@ -63,7 +83,11 @@ class ToyboxBaseEnv(AtariEnv, ABC):
 
         self._height = self.toybox.get_height()
         self._width = self.toybox.get_width()
-        self._dim = (self._height, self._width, self._rgba) # * len(self.toybox.get_state())) 
+        # The shape of rendered frames; _dim is the shape of observations, which
+        # only differs from this in the deepmind observation mode.
+        self._frame_dim = (self._height, self._width, self._rgba) # * len(self.toybox.get_state())) 
+        self._dim = self._frame_dim
+        self._obs_mode = 'image'
         
         self.reward_range = (0, float('inf'))
         self.action_space = spaces.Discrete(len(self._action_set))
@@ -73,6 +97,22 @@ class ToyboxBaseEnv(AtariEnv, ABC):
             shape=self._dim, 
             dtype='uint8')
 
+    @property
+    def cached_state(self):
+        """The JSON of the state discarded by the last reset; only serialized when read."""
+        if self._cached_snapshot is None:
+            return None
+        return self._cached_snapshot.to_json()
+
+    def snapshot(self):
+        """Take a Snapshot of the current game, without serializing it to JSON."""
+        return Snapshot.take(self.toybox)
+
+    def restore(self, snapshot):
+        """Return the game to a Snapshot taken from this or another env of the same game."""
+        snapshot.restore(self.toybox)
+        self.score = self.toybox.get_score()
+
     @property
     def np_random(self):
         # Following openai/gym's implementation (see e.g. space.py)
@@ -103,9 +143,100 @@ class ToyboxBaseEnv(AtariEnv, ABC):
         #return [ACTION_MEANING[i] for i in self._action_set]
         return list(ACTION_MEANING.values())
 
+    def set_obs_mode(self, mode):
+        """Choose how observations are produced.
+
+        'image' (the default) returns frames as rendered, in the grayscale, RGB or
+        RGBA layout the env was constructed with. 'deepmind' returns 84x84
+        grayscale frames, as WarpFrame does in the DeepMind Atari pipeline, without
+        a separate wrapper pass. The observation buffer, if any, has the shape of
+        the old mode, so remove it with set_obs_buffer(None) before changing modes.
+        """
+        assert mode in ToyboxBaseEnv.obs_modes, 'Unknown observation mode %s' % mode
+        assert self._out is None, 'Cannot change the observation mode while an observation buffer is set'
+        self._obs_mode = mode
+        self._renderer = None
+        self._pool = None
+        if mode == 'deepmind':
+            import cv2
+            self._resize = partial(cv2.resize,
+                dsize=(ToyboxBaseEnv.warp_width, ToyboxBaseEnv.warp_height),
+                interpolation=cv2.INTER_AREA)
+            self._frame_dim = (self._height, self._width, 1)
+            self._dim = (ToyboxBaseEnv.warp_height, ToyboxBaseEnv.warp_width, 1)
+            self._frame = np.zeros(self._frame_dim, dtype=np.uint8)
+            self._frame_renderer = FrameRenderer(self._frame)
+        else:
+            self._frame_dim = (self._height, self._width, self._rgba)
+            self._dim = self._frame_dim
+            self._frame = None
+            self._frame_renderer = None
+            self._resize = None
+        self.observation_space = spaces.Box(
+            low=0, 
+            high=self._pixel_high, 
+            shape=self._dim, 
+            dtype='uint8')
+
+    @property
+    def obs_buffer(self):
+        """The buffer set by set_obs_buffer, or None."""
+        return self._out
+
+    def set_obs_buffer(self, out=None):
+        """Write observations into out instead of allocating a new frame per step.
+
+        out must be a C-contiguous uint8 array with the shape of observation_space
+        (grayscale, RGB or RGBA, as configured). It is returned from every step and
+        reset, so copy it if you need to keep an observation. Passing None restores
+        the default of returning a fresh frame each time.
+        """
+        if out is None:
+            self._out = None
+            self._renderer = None
+            return
+        assert out.shape == self._dim, 'Expected an observation buffer of shape {}; got {}'.format(self._dim, out.shape)
+        assert out.dtype == np.uint8 and out.flags['C_CONTIGUOUS']
+        self._out = out
+        if self._obs_mode == 'image':
+            self._renderer = FrameRenderer(out)
+
+    def enable_timing(self, timer=None):
+        """Start counting calls to and time spent in each stage of step, step_repeat and reset.
+
+        The stages are the env methods themselves, get_obs (rendering), and the
+        Toybox calls apply_action, get_score, get_lives and new_game. Counts
+        accumulate in timer (a new StageTimer by default), which is returned and
+        kept as self.timer; see toybox.envs.atari.timing.
+        """
+        if self.timer is None:
+            self.timer = timer if timer is not None else StageTimer()
+            time_methods(self, ENV_STAGES, self.timer)
+            time_methods(self.toybox, TOYBOX_STAGES, self.timer)
+        return self.timer
+
+    def disable_timing(self):
+        """Stop timing; the untimed methods run again, at no extra cost."""
+        if self.timer is None:
+            return
+        untime_methods(self, ENV_STAGES)
+        if self.toybox is not None:
+            untime_methods(self.toybox, TOYBOX_STAGES)
+        self.timer = None
+
+    def _warp(self, frame):
+        # Same as WarpFrame.observation, but resizing straight into the output.
+        out = self._out if self._out is not None else np.empty(self._dim, dtype=np.uint8)
+        self._resize(frame, dst=out.reshape(self._dim[:2]))
+        return out
+
     # From OpenAI Gym Baselines
     # https://github.com/openai/baselines/blob/master/baselines/common/atari_wrappers.py
     def _get_obs(self):
+        if self._frame_renderer is not None:
+            return self._warp(self._frame_renderer.render(self.toybox))
+        if self._renderer is not None:
+            return self._renderer.render(self.toybox)
         obs =  self.toybox.get_state()
         # Fix observation for RGB image (we are still getting alpha channel)
         if self._rgba == 3:
@@ -127,7 +258,7 @@ class ToyboxBaseEnv(AtariEnv, ABC):
 
         if self.ale.game_over():
             print('GAME OVER')
-            info['cached_state'] = self.toybox.to_state_json()
+            info['cached_state'] = self.snapshot()
 
         obs = self._get_obs()
         
@@ -148,8 +279,53 @@ class ToyboxBaseEnv(AtariEnv, ABC):
     
         return obs, reward, done, info
 
+    def step_repeat(self, action_index, k, pool_last=2):
+        """Apply the action k times and max-pool over the last pool_last frames.
+
+        This is equivalent to calling step k times and taking the pixelwise max of
+        the final observations (as MaxAndSkipEnv does), except that only the frames
+        that are pooled get rendered. Rewards are summed over the k steps; the info
+        dict is the one for the final step. Stops early on game over, in which case
+        the pooled observation does not matter.
+        """
+        assert(k >= 1 and pool_last >= 1)
+        assert(action_index < len(self._action_set))
+        action = self._action_set[action_index]
+        pool_last = min(pool_last, k)
+        if self._pool is None or len(self._pool) != pool_last:
+            self._pool = np.zeros((pool_last,) + self._frame_dim, dtype=np.uint8)
+            self._pool_renderers = [FrameRenderer(frame) for frame in self._pool]
+
+        total_reward = 0.0
+        done = False
+        info = {}
+        first_pooled = k - pool_last
+        for i in range(k):
+            self.toybox.apply_ale_action(action)
+            score = self.toybox.get_score()
+            total_reward += max(score - self.score, 0)
+            self.score = score
+            if i >= first_pooled:
+                self._pool_renderers[i - first_pooled].render(self.toybox)
+            done = self.ale.game_over()
+            if done:
+                info['cached_state'] = self.snapshot()
+                break
+
+        if self._frame is not None:
+            obs = self._warp(np.max(self._pool, axis=0, out=self._frame))
+        elif self._out is not None:
+            obs = np.max(self._pool, axis=0, out=self._out)
+        else:
+            obs = self._pool.max(axis=0)
+
+        info['lives'] = self.toybox.get_lives()
+        info['score'] = 0 if done else self.score
+        return obs, total_reward, done, info
+
     def reset(self):
-        self.cached_state = self.toybox.to_state_json()
+        # new_game replaces the state object, so it can be kept without a copy.
+        self._cached_snapshot = Snapshot(self.toybox.game_name, self.toybox.rstate)
         self.toybox.new_game()
         self.score = self.toybox.get_score()
         obs = self._get_obs()
@@ -0,0 +1,86 @@
+from gym import Env, spaces
+from gym.utils import seeding
+from toybox.envs.atari.constants import ACTION_MEANING
+
+
+class _RemoteALE():
+    # MockALE for a simulator on a server; lives are as of the last reply.
+    def __init__(self, env):
+        self.env = env
+
+    def lives(self):
+        return self.env._lives
+
+    def game_over(self):
+        return self.env._lives <= 0
+
+
+class RemoteToyboxEnv(Env):
+    """An env backed by a simulator hosted by a SimulationServer (see toybox.server).
+
+    Behaves like ToyboxBaseEnv in the 'image' observation mode: the same
+    rewards, done and info from step, reset, seed, snapshot and restore, so
+    the usual wrappers apply. The info of a step that ends the game has no
+    cached_state, since that would ship a whole state per step; call
+    snapshot instead if it is needed. Each call is one request to the server; use
+    SimulationClient.step to step several envs in one request. Created by
+    SimulationClient.make. Observations are copies of the shared frame, so
+    they can be kept.
+
+    It is not a ToyboxBaseEnv, so code that checks for one treats it as a
+    plain gym env. There is no `toybox` or observation buffer to reach
+    into. MaxAndSkipEnv steps it one frame per request rather than through
+    step_repeat, and WarpFrame resizes its frames with OpenCV rather than
+    rendering them natively. Use SimulationClient.step to batch requests
+    instead.
+    """
+    metadata = {'render.modes': ['rgb_array']}
+
+    def __init__(self, client, sim_id, game_name, frame, actions):
+        self.client = client
+        self.sim_id = sim_id
+        self.game_name = game_name
+        self._frame = frame
+        self._action_set = list(actions)
+        self._lives = 1
+        self._np_random = None
+        self.ale = _RemoteALE(self)
+        self.reward_range = (0, float('inf'))
+        self.action_space = spaces.Discrete(len(self._action_set))
+        self.observation_space = spaces.Box(low=0, high=255, shape=frame.shape, dtype='uint8')
+
+    def step(self, action_index):
+        assert(action_index < len(self._action_set))
+        obs, rewards, dones, infos = self.client.step([self], [action_index])
+        return obs[0], rewards[0], dones[0], infos[0]
+
+    def reset(self):
+        return self.client.reset([self])[0]
+
+    def seed(self, seed=None):
+        """Seeds the simulator as ToyboxBaseEnv.seed does, and starts a new game."""
+        self._np_random, seed1 = seeding.np_random(seed)
+        seed2 = seeding.hash_seed(seed1 + 1) % 2**31
+        self.client.seed([self], [seed2])
+        return [seed1, seed2]
+
+    @property
+    def np_random(self):
+        if self._np_random is None:
+            self.seed()
+        return self._np_random
+
+    def snapshot(self):
+        return self.client.snapshot([self])[0]
+
+    def restore(self, snapshot):
+        self.client.restore([self], [snapshot])
+
+    def get_action_meanings(self):
+        return list(ACTION_MEANING.values())
+
+    def render(self, mode='rgb_array', close=False):
+        return self._frame.copy()
+
+    def close(self):
+        self.client.release([self])
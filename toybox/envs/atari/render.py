@@ -0,0 +1,36 @@
+from ctoybox.ffi import lib, ffi, _handle_ffi_result
+
+import numpy as np
+
+
+class FrameRenderer():
+    """Renders the current Toybox frame into a fixed, caller-owned uint8 buffer.
+
+    The buffer must be C-contiguous with shape (height, width, channels), where
+    channels is 1 (grayscale), 3 (RGB) or 4 (RGBA). Pointers into the buffer are
+    computed once, so rendering a frame allocates nothing.
+    """
+
+    def __init__(self, out):
+        assert out.dtype == np.uint8
+        assert out.ndim == 3 and out.shape[2] in (1, 3, 4), out.shape
+        assert out.flags['C_CONTIGUOUS']
+        self.out = out
+        self.grayscale = out.shape[2] == 1
+        # The simulator always renders an alpha channel in color mode, so RGB
+        # output goes through an RGBA scratch frame.
+        if out.shape[2] == 3:
+            self._target = np.zeros(out.shape[:2] + (4,), dtype=np.uint8)
+        else:
+            self._target = out
+        self._size = self._target.size
+        self._ptr = ffi.cast('uint8_t *', self._target.ctypes.data)
+
+    def render(self, toybox):
+        """Renders the current frame of toybox and returns the output buffer."""
+        _handle_ffi_result(lib.render_current_frame(
+            self._ptr, self._size, self.grayscale,
+            toybox.rsimulator.get_simulator(), toybox.rstate.get_state()))
+        if self._target is not self.out:
+            np.copyto(self.out, self._target[:, :, :3])
+        return self.out
@@ -0,0 +1,181 @@
+"""Opt-in per-stage timing for Toybox envs and the wrappers around them.
+
+Timing is switched on by replacing the timed methods of an env (and of the
+Toybox it drives) with timing versions, as instance attributes; switching it
+off deletes them again. Untimed envs run exactly the code they always did, so
+timing costs nothing until it is enabled.
+
+A StageTimer keeps, per stage, a call count, the total time and a histogram
+of latencies in power-of-two nanosecond buckets. Stages nest: the time of
+`step` includes its `apply_action` and `get_obs`, and the time of a
+wrapper's step includes everything beneath it. Calls that raise are not
+counted.
+
+    timer = instrument(env)
+    ...
+    print(summary(timer.stats()))
+"""
+import time
+
+import gym
+
+# Bucket b counts latencies of [2**(b-1), 2**b) nanoseconds; 64 buckets
+# cover anything perf_counter_ns can return.
+BUCKETS = 64
+
+# The methods of the Toybox that ToyboxBaseEnv times, and their stage names.
+TOYBOX_STAGES = {
+    'apply_ale_action': 'apply_action',
+    'get_score': 'get_score',
+    'get_lives': 'get_lives',
+    'new_game': 'new_game',
+}
+ENV_STAGES = {
+    'step': 'step',
+    'step_repeat': 'step_repeat',
+    'reset': 'reset',
+    '_get_obs': 'get_obs',
+}
+
+# The methods timed on wrappers, and on envs other than Toybox envs.
+WRAPPER_STAGES = ['step', 'reset', 'observation', 'reward']
+
+
+class _Stage(object):
+    __slots__ = ['count', 'total_ns', 'histogram']
+
+    def __init__(self):
+        self.count = 0
+        self.total_ns = 0
+        self.histogram = [0] * BUCKETS
+
+
+class StageTimer(object):
+    """Counts and latency histograms of named stages."""
+
+    def __init__(self):
+        self._stages = {}
+
+    def stage(self, name):
+        if name not in self._stages:
+            self._stages[name] = _Stage()
+        return self._stages[name]
+
+    def timed(self, name, fn):
+        """A function that calls fn and records the time it took under stage `name`."""
+        stage = self.stage(name)
+        histogram = stage.histogram
+        clock = time.perf_counter_ns
+        def timed(*args, **kwargs):
+            start = clock()
+            result = fn(*args, **kwargs)
+            ns = clock() - start
+            stage.count += 1
+            stage.total_ns += ns
+            histogram[ns.bit_length()] += 1
+            return result
+        timed.__wrapped__ = fn
+        return timed
+
+    def stats(self):
+        """The counters of every stage, as plain dicts that can be pickled and merged."""
+        return {name: {'count': s.count, 'total_ns': s.total_ns, 'histogram': list(s.histogram)}
+                for name, s in self._stages.items()}
+
+    def reset(self):
+        for stage in self._stages.values():
+            stage.count = 0
+            stage.total_ns = 0
+            stage.histogram[:] = [0] * BUCKETS
+
+
+def merge(stats_list):
+    """Sums the stats of several timers, e.g. one per vec env worker."""
+    merged = {}
+    for stats in stats_list:
+        for name, s in stats.items():
+            if name not in merged:
+                merged[name] = {'count': 0, 'total_ns': 0, 'histogram': [0] * BUCKETS}
+            m = merged[name]
+            m['count'] += s['count']
+            m['total_ns'] += s['total_ns']
+            m['histogram'] = [a + b for a, b in zip(m['histogram'], s['histogram'])]
+    return merged
+
+
+def _percentile(histogram, count, q):
+    # The upper edge of the bucket holding the q-th percentile, so within a
+    # factor of two of the true latency.
+    rank = q / 100. * count
+    seen = 0
+    for b, n in enumerate(histogram):
+        seen += n
+        if n and seen >= rank:
+            return 2 ** b / 1e3
+    return 0.
+
+
+def summary(stats):
+    """Per stage: the count, total seconds, and mean and percentile latencies in microseconds."""
+    out = {}
+    for name, s in stats.items():
+        count = s['count']
+        out[name] = {
+            'count': count,
+            'total_s': s['total_ns'] / 1e9,
+            'mean_us': s['total_ns'] / count / 1e3 if count else 0.,
+            'p50_us': _percentile(s['histogram'], count, 50),
+            'p90_us': _percentile(s['histogram'], count, 90),
+            'p99_us': _percentile(s['histogram'], count, 99),
+        }
+    return out
+
+
+def time_methods(obj, stages, timer):
+    """Replaces the methods of obj named in `stages` (a dict from method to stage name) with timed ones."""
+    for name, stage in stages.items():
+        fn = getattr(obj, name, None)
+        if fn is None or hasattr(fn, '__wrapped__'):
+            continue
+        setattr(obj, name, timer.timed(stage, fn))
+
+
+def untime_methods(obj, names):
+    """Undoes time_methods for the methods in `names`."""
+    for name in names:
+        if hasattr(obj.__dict__.get(name), '__wrapped__'):
+            delattr(obj, name)
+
+
+def _wrapper_stages(env):
+    # step and reset always; observation and reward where the class defines them.
+    clz = type(env)
+    names = [name for name in WRAPPER_STAGES if name in ('step', 'reset') or name in clz.__dict__]
+    return {name: clz.__name__ + '.' + name for name in names}
+
+
+def instrument(env, timer=None):
+    """Times env and every wrapper beneath it into `timer` (a new StageTimer by default); returns the timer.
+
+    Wrapper stages are named after the wrapper class, e.g. `WarpFrame.observation`.
+    Instrumenting an env twice keeps the timing it already has."""
+    timer = timer if timer is not None else StageTimer()
+    while isinstance(env, gym.Wrapper):
+        time_methods(env, _wrapper_stages(env), timer)
+        env = env.env
+    if hasattr(env, 'enable_timing'):
+        env.enable_timing(timer)
+    else:
+        time_methods(env, _wrapper_stages(env), timer)
+    return timer
+
+
+def uninstrument(env):
+    """Undoes instrument, restoring the untimed methods."""
+    while isinstance(env, gym.Wrapper):
+        untime_methods(env, WRAPPER_STAGES)
+        env = env.env
+    if hasattr(env, 'disable_timing'):
+        env.disable_timing()
+    else:
+        untime_methods(env, WRAPPER_STAGES)
@@ -0,0 +1,111 @@
+"""Canonical fingerprints of game states, for deduplicating states in search."""
+from collections import OrderedDict
+from ctoybox import Toybox
+from toybox.snapshot import Snapshot
+try:
+  import ujson as json
+except:
+  import json
+
+import hashlib
+
+# Fields the simulators store as sets; their JSON order is arbitrary, so two
+# copies of the same state can list them differently.
+UNORDERED_FIELDS = {
+  'amidar': [('board', 'junctions'), ('board', 'chase_junctions'), ('board', 'boxes')],
+}
+
+# The random number generator is not part of the game state for comparison
+# purposes, as in the intervention eq_keys.
+EXCLUDED_FIELDS = ('rand',)
+
+
+def _sort_key(item):
+  return json.dumps(item, sort_keys=True) if isinstance(item, (dict, list)) else item
+
+
+def canonical_state(game_name: str, state: dict, exclude=EXCLUDED_FIELDS) -> dict:
+  """A copy of the state JSON without the `exclude` fields and with set-valued fields sorted.
+
+  Only the dicts on the way to a changed field are copied; the rest of the
+  state is shared with the input."""
+  canon = {k: v for k, v in state.items() if k not in exclude}
+  for path in UNORDERED_FIELDS.get(game_name, ()):
+    node = canon
+    for step in path[:-1]:
+      if step not in node: break
+      node[step] = dict(node[step])
+      node = node[step]
+    else:
+      if path[-1] in node:
+        node[path[-1]] = sorted(node[path[-1]], key=_sort_key)
+  return canon
+
+
+def state_fingerprint(state, game_name: str = None, exclude=EXCLUDED_FIELDS) -> bytes:
+  """A 16-byte digest identifying a game state, up to the `exclude` fields.
+
+  `state` is a Toybox (its current state), a Snapshot, or state JSON, in which
+  case `game_name` is required. Equal states have equal fingerprints regardless
+  of how they were produced, so fingerprints can be used as dict or set keys."""
+  if isinstance(state, Toybox):
+    game_name, state = state.game_name, state.state_to_json()
+  elif isinstance(state, Snapshot):
+    game_name, state = state.game_name, state.to_json()
+  assert game_name is not None, 'game_name is required to fingerprint state JSON'
+  canon = canonical_state(game_name, state, exclude)
+  data = json.dumps(canon, sort_keys=True).encode()
+  return hashlib.blake2b(data, digest_size=16, person=game_name.encode()[:16]).digest()
+
+
+class TranspositionTable(object):
+  """A bounded map from state fingerprints to values, for deduplicating visited states.
+
+  When full, adding a fingerprint evicts the least recently used one. Lookups
+  and insertions are O(1)."""
+
+  def __init__(self, capacity: int = 100000):
+    assert capacity > 0, 'capacity must be positive'
+    self.capacity = capacity
+    self._table = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+
+  def __len__(self):
+    return len(self._table)
+
+  def __contains__(self, fingerprint):
+    return fingerprint in self._table
+
+  def __getitem__(self, fingerprint):
+    value = self._table[fingerprint]
+    self._table.move_to_end(fingerprint)
+    return value
+
+  def get(self, fingerprint, default=None):
+    if fingerprint in self._table:
+      return self[fingerprint]
+    return default
+
+  def __setitem__(self, fingerprint, value):
+    self._table[fingerprint] = value
+    self._table.move_to_end(fingerprint)
+    if len(self._table) > self.capacity:
+      self._table.popitem(last=False)
+
+  def visit(self, fingerprint, value=None) -> bool:
+    """Records a visit to the state; True if it was not already in the table.
+
+    A state already in the table keeps its value and counts as a hit."""
+    if fingerprint in self._table:
+      self._table.move_to_end(fingerprint)
+      self.hits += 1
+      return False
+    self.misses += 1
+    self[fingerprint] = value
+    return True
+
+  def clear(self):
+    self._table.clear()
+    self.hits = 0
+    self.misses = 0
@@ -1,9 +1,11 @@
 from toybox.interventions.base import *
 from toybox.interventions.core import *
+from toybox.interventions.schema import RequiredKeys
 try:
   import ujson as json
 except:
   import json
+import numpy as np
 import random
 from typing import Optional
 """An API for interventions on Amidar."""
@@ -13,9 +15,8 @@ from typing import Optional
 
 class Amidar(Game):
 
-  with Toybox('amidar') as tb:
-    expected_keys = tb.schema_for_state()['required']
-    eq_keys = [k for k in expected_keys if k != 'rand']
+  expected_keys = RequiredKeys('amidar')
+  eq_keys = RequiredKeys('amidar', exclude=['rand'])
   #expected_keys = Game.expected_keys + ['enemies', 'player', 'jumps', 'jump_timer', 'chase_timer', 'board']
   immutable_fields = Game.immutable_fields + ['enemies']
   
@@ -25,11 +26,11 @@ class Amidar(Game):
     assert intervention
     super().__init__(intervention, score, lives, rand, level)
     assert self.intervention
-    self.enemies = EnemyCollection.decode(intervention, enemies, EnemyCollection)
+    self.decode_lazily('enemies', enemies, EnemyCollection)
     self.jumps = jumps
     self.jump_timer = jump_timer
     self.chase_timer = chase_timer
-    self.board = Board.decode(intervention, board, Board)
+    self.decode_lazily('board', board, Board)
     self.player = Player.decode(intervention, player, Player)
     self._in_init = False
 
@@ -48,7 +49,7 @@ class EnemyCollection(Collection):
     def make_models(self, data): assert False
 
 
-class Tile(BaseMixin):
+class Tile(CompactMixin):
     # Ideally we would have this be an enum, but we'd need to set up 
     # an adaptor class to use multiple inheritence here, and....no.
 
@@ -60,6 +61,7 @@ class Tile(BaseMixin):
     
     expected_keys = []
     eq_keys = ['tag']
+    __slots__ = ['tag']
 
     def __init__(self, intervention, name):
       assert intervention
@@ -159,18 +161,19 @@ class MovementAI(BaseMixin):
     def encode(self):
       args = {}
       for k, v in self.__dict__.items():
-        if k not in self.immutable_fields and v is not None and k != 'protocol' :
+        if k not in self.immutable_fields and v is not None and k != 'protocol' and k[0] != '_':
           args[k] = v.encode() if isinstance(v, BaseMixin) else v
       return { self.protocol: args }
 
     def make_models(self, data): assert False
 
 
-class Enemy(BaseMixin):
+class Enemy(CompactMixin):
 
     expected_keys = ['history', 'step', 'position', 'caught', 'speed', 'ai']
     immutable_fields = BaseMixin.immutable_fields + ['ai']
     eq_keys = expected_keys
+    __slots__ = expected_keys
 
     def __init__(self, intervention, history, step, position, caught, speed, ai):
       super().__init__(intervention)
@@ -183,7 +186,7 @@ class Enemy(BaseMixin):
       self._in_init = False
 
     def __repr__(self):
-        return 'Enemy({})'.format(' '.join([key+str(self.__dict__[key]) for key in Enemy.expected_keys]))
+        return 'Enemy({})'.format(' '.join([key+str(getattr(self, key)) for key in Enemy.expected_keys]))
 
     def __str__(self):
         return self.__repr__()
@@ -224,8 +227,8 @@ class Board(BaseMixin):
       self.height = height
       self.chase_junctions = chase_junctions
       self.junctions = junctions
-      self.boxes = BoxCollection.decode(intervention, boxes,  BoxCollection)
-      self.tiles = TileCollection.decode(intervention, tiles, TileCollection)
+      self.decode_lazily('boxes', boxes, BoxCollection)
+      self.decode_lazily('tiles', tiles, TileCollection)
       self._in_init = False
 
     def make_models(self, data): assert False
@@ -244,8 +247,7 @@ class TileCollection(Collection):
       # not adding this right now EMT 4/17/20)
       assert intervention
       super().__init__(intervention, [], None)
-      for row in tiles:
-        self.coll.append([Tile.decode(intervention, tile, Tile) for tile in row])
+      self.coll = [[Tile.decode(intervention, tile, Tile) for tile in row] for row in tiles]
       self._in_init = False
 
     def remove(self):
@@ -264,10 +266,85 @@ class TileCollection(Collection):
       return [[t.encode() for t in row] for row in self.coll]
 
 
-class WorldPoint(BaseMixin):
+class TileGrid(object):
+  """Array views of the board tiles, for constant-time lookups by tile or coordinate.
+
+  `positions` maps each tile (by identity) to its (tx, ty); `tags` holds the
+  index in Tile.tags of each tile's tag, as a (height, width) array indexed by
+  [ty, tx]; `walkable` is true for non-empty tiles; and `adjacency` is a
+  (height, width, 4) array that is true where the neighbor in each of
+  `TileGrid.offsets` is walkable. Use `AmidarIntervention.tile_grid` to get an
+  up-to-date grid."""
+
+  # (dx, dy) of the neighbors of a tile, in the order of Direction.directions
+  offsets = [(0, -1), (0, 1), (-1, 0), (1, 0)]
+
+  def __init__(self, tiles: TileCollection):
+    self.tiles = tiles
+    # The length of the change log when the arrays were last in sync.
+    self.nchanges = len(tiles.intervention.changes)
+    self.positions = {}
+    codes = {tag: i for i, tag in enumerate(Tile.tags)}
+    rows = []
+    for ty, row in enumerate(tiles.coll):
+      rows.append([codes[t.tag] for t in row])
+      for tx, t in enumerate(row):
+        self.positions[id(t)] = (tx, ty)
+    self.tags = np.array(rows, dtype=np.int8)
+    self.height, self.width = self.tags.shape
+    self.walkable = self.tags != Tile.tags.index(Tile.Empty)
+    self.adjacency = np.zeros((self.height, self.width, len(TileGrid.offsets)), dtype=bool)
+    for k in range(len(TileGrid.offsets)):
+      self._update_adjacency(k, slice(None), slice(None))
+
+  def _update_adjacency(self, k, ys, xs):
+    # Recomputes adjacency[ys, xs, k] from the walkable mask.
+    dx, dy = TileGrid.offsets[k]
+    padded = np.zeros((self.height + 2, self.width + 2), dtype=bool)
+    padded[1:-1, 1:-1] = self.walkable
+    shifted = padded[1 + dy : 1 + dy + self.height, 1 + dx : 1 + dx + self.width]
+    self.adjacency[ys, xs, k] = shifted[ys, xs]
+
+  def position(self, tile):
+    """Returns (tx, ty) of the tile, or None if it is not on the board."""
+    pos = self.positions.get(id(tile))
+    if pos is None or self.tiles.coll[pos[1]][pos[0]] is not tile:
+      return None
+    return pos
+
+  def in_bounds(self, tx, ty):
+    return 0 <= tx < self.width and 0 <= ty < self.height
+
+  def neighbors(self, tx, ty):
+    """Returns the in-bounds (tx, ty) neighbors of a position, in row-major order."""
+    return [(tx + dx, ty + dy) for dx, dy in [(0, -1), (-1, 0), (1, 0), (0, 1)] if self.in_bounds(tx + dx, ty + dy)]
+
+  def window(self, tx, ty, radius):
+    """Returns (ys, xs, mask): the slices of the board around (tx, ty) and a mask of the positions in them strictly within manhattan distance radius."""
+    ys = slice(max(0, ty - radius + 1), min(self.height, ty + radius))
+    xs = slice(max(0, tx - radius + 1), min(self.width, tx + radius))
+    dy = np.abs(np.arange(ys.start, ys.stop) - ty)
+    dx = np.abs(np.arange(xs.start, xs.stop) - tx)
+    return ys, xs, (dy[:, None] + dx[None, :]) < radius
+
+  def update(self, tile):
+    """Brings the arrays up to date after a change to the tag of tile."""
+    tx, ty = self.positions[id(tile)]
+    self.tags[ty, tx] = Tile.tags.index(tile.tag)
+    self.walkable[ty, tx] = tile.tag != Tile.Empty
+    # Only the neighbors of the tile see a different neighbor.
+    ys = slice(max(0, ty - 1), min(self.height, ty + 2))
+    xs = slice(max(0, tx - 1), min(self.width, tx + 2))
+    for k in range(len(TileGrid.offsets)):
+      self._update_adjacency(k, ys, xs)
+    self.nchanges = len(self.tiles.intervention.changes)
+
+
+class WorldPoint(CompactMixin):
 
     expected_keys = ['x', 'y']
     eq_keys = expected_keys
+    __slots__ = expected_keys
   
     def __init__(self, intervention, x=None, y=None):
       super().__init__(intervention)
@@ -277,7 +354,7 @@ class WorldPoint(BaseMixin):
       self._in_init = False
 
     def __repr__(self):
-        return 'WorldPoint({})'.format(' '.join([key+str(self.__dict__[key]) for key in WorldPoint.expected_keys]))
+        return 'WorldPoint({})'.format(' '.join([key+str(getattr(self, key)) for key in WorldPoint.expected_keys]))
 
     def __str__(self):
         return self.__repr__()
@@ -295,10 +372,11 @@ class BoxCollection(Collection):
         return BoxCollection(intervention, boxes)
 
 
-class Box(BaseMixin):
+class Box(CompactMixin):
 
   expected_keys = ['triggers_chase', 'top_left', 'bottom_right', 'painted']
   eq_keys = expected_keys
+  __slots__ = expected_keys
 
   def __init__(self, intervention, triggers_chase, top_left, bottom_right, painted):
       super().__init__(intervention)
@@ -311,10 +389,11 @@ class Box(BaseMixin):
   def make_models(self, data): assert False
 
 
-class TilePoint(BaseMixin):
+class TilePoint(CompactMixin):
 
     expected_keys = ['tx', 'ty']
     eq_keys = expected_keys
+    __slots__ = expected_keys
 
     def __init__(self, intervention, tx, ty):
         super().__init__(intervention)
@@ -353,9 +432,22 @@ class AmidarIntervention(Intervention):
     regular = 'regular'
     modes = [jump, chase, regular]
 
-    def __init__(self, tb, game_name='amidar', eq_mode=StandardEq):
+    def __init__(self, tb, game_name='amidar', eq_mode=StandardEq, lazy=False):
       # check that the simulation in tb matches the game name.
-      Intervention.__init__(self, tb, game_name, Amidar, eq_mode=eq_mode)
+      Intervention.__init__(self, tb, game_name, Amidar, eq_mode=eq_mode, lazy=lazy)
+      self._tile_grid = None
+      self._tile_geometry = None
+
+    def tile_grid(self):
+      """Returns a TileGrid for the board.
+
+      The grid is cached, and rebuilt when the game has changed other than
+      through `set_tile_tag`."""
+      grid = self._tile_grid
+      tiles = self.game.board.tiles
+      if grid is None or grid.tiles is not tiles or grid.nchanges != len(self.changes):
+        grid = self._tile_grid = TileGrid(tiles)
+      return grid
 
     def get_random_tile(self, pred=lambda tile: True): 
       """Returns a random tile object, filtered by the input predicate.
@@ -486,7 +578,11 @@ class AmidarIntervention(Intervention):
 
     def set_tile_tag(self, tile, tag):
       assert tag in Tile.tags, 'Unrecognized tile tag: %s' % tag
+      grid = self._tile_grid
+      in_sync = grid is not None and grid.tiles is self.game.board.tiles and grid.nchanges == len(self.changes)
       tile.tag = tag
+      if in_sync and grid.position(tile) is not None:
+        grid.update(tile)
 
     def get_tile_by_pos(self, tx, ty) -> Tile:
       return self.game.board.tiles[ty][tx]
@@ -499,44 +595,65 @@ class AmidarIntervention(Intervention):
       return lst
 
     def tile_to_tilepoint(self, tile):
-      ty, tx = 0, 0
-      for y, row in enumerate(self.game.board.tiles):
-        for x, t in enumerate(row):
-          if t is tile: return TilePoint(self, tx=x, ty=y)
-      raise ValueError('Tile %s not found in tiles' % tile)
+      pos = self.tile_grid().position(tile)
+      if pos is None:
+        raise ValueError('Tile %s not found in tiles' % tile)
+      return TilePoint(self, tx=pos[0], ty=pos[1])
+
+    def tile_geometry(self):
+      """Returns the world (x, y) of tile (0, 0) and the (width, height) of a tile, as arrays.
+
+      These are queried from Toybox on first use and cached for the lifetime of
+      the intervention."""
+      if self._tile_geometry is None:
+        origin = np.array(self.toybox.query_state_json('tile_to_world', {'tx': 0, 'ty': 0}), dtype=np.int64)
+        corner = np.array(self.toybox.query_state_json('tile_to_world', {'tx': 1, 'ty': 1}), dtype=np.int64)
+        self._tile_geometry = (origin, corner - origin)
+      return self._tile_geometry
+
+    def tilepoints_to_worldpoints(self, tps):
+      """Converts an (n, 2) array of tile (tx, ty) to an (n, 2) array of world (x, y)."""
+      origin, size = self.tile_geometry()
+      return np.asarray(tps, dtype=np.int64) * size + origin
+
+    def worldpoints_to_tilepoints(self, wps):
+      """Converts an (n, 2) array of world (x, y) to an (n, 2) array of tile (tx, ty)."""
+      origin, size = self.tile_geometry()
+      d = np.asarray(wps, dtype=np.int64) - origin
+      # Toybox truncates, and subtracts one for negative coordinates.
+      return np.where(d >= 0, d // size, -(-d // size) - 1)
 
     def tilepoint_to_worldpoint(self, tp):
-      return WorldPoint(self, 
-        *self.toybox.query_state_json('tile_to_world', tp.encode()))
+      x, y = self.tilepoints_to_worldpoints([tp.tx, tp.ty]).tolist()
+      return WorldPoint(self, x, y)
 
     def tile_to_worldpoint(self, tile):
       tp = self.tile_to_tilepoint(tile)
       return self.tilepoint_to_worldpoint(tp)   
 
     def worldpoint_to_tilepoint(self, wp):
-      return TilePoint(self,
-        *self.toybox.query_state_json('world_to_tile', wp.encode()))
+      tx, ty = self.worldpoints_to_tilepoints([wp.x, wp.y]).tolist()
+      return TilePoint(self, tx, ty)
+
+    def enemy_tilepoints(self):
+      """Returns the tile (tx, ty) of each enemy, as an (n, 2) array."""
+      wps = np.array([[e.position.x, e.position.y] for e in self.game.enemies], dtype=np.int64).reshape(-1, 2)
+      return self.worldpoints_to_tilepoints(wps)
 
     def get_adjacent_tiles(self, tp: TilePoint, filter_fn = lambda t: t):
-      from resources.lookup_util import tile_to_route_id
-      tid = tile_to_route_id(self, tp.tx, tp.ty)
-      def adj(t):
-        if t.tx == tp.tx + 1 and t.ty == tp.ty:
-          return filter_fn(t)
-        if t.tx == tp.tx - 1 and t.ty == tp.ty:
-          return filter_fn(t)
-        if t.tx == tp.tx and t.ty == tp.ty + 1:
-          return filter_fn(t)
-        if t.tx == tp.tx and t.ty == tp.ty - 1:
-          return filter_fn(t)
-        return False
-      return self.filter_tiles(pred=adj)
+      """Returns the tiles next to tp that satisfy filter_fn, in row-major order."""
+      tiles = self.game.board.tiles
+      return [tiles[ty][tx] for tx, ty in self.tile_grid().neighbors(tp.tx, tp.ty) if filter_fn(tiles[ty][tx])]
 
     def enemy_distances_from_tile(self, t, dist_fn=TilePoint.manhattan):
       tp = self.tile_to_tilepoint(t)
-      etps = [self.worldpoint_to_tilepoint(e.position) for e in self.game.enemies]
-      e_dists = [dist_fn(etp, tp) for etp in etps]
-      return e_dists
+      return self._enemy_distances(tp, dist_fn)
+
+    def _enemy_distances(self, tp, dist_fn):
+      etps = self.enemy_tilepoints()
+      if dist_fn is TilePoint.manhattan:
+        return np.abs(etps - [tp.tx, tp.ty]).sum(axis=1).tolist()
+      return [dist_fn(TilePoint(self, tx, ty), tp) for tx, ty in etps.tolist()]
 
     def set_player_random_start(self, min_enemy_distance=5):
       from numpy import all
@@ -548,37 +665,17 @@ class AmidarIntervention(Intervention):
       self.game.player.position = self.tile_to_worldpoint(pos)
 
     def get_random_dir_for_tile(self, tile):
+      """Returns a random direction (one of Direction.directions) that leads from tile to a walkable tile."""
       assert tile.tag != "Empty"
-      selected = False
-      dirs = ["Up", "Down", "Left", "Right"]
-
-      d = None
-      while not selected:
-        next_tid = {}
-        next_tid['tx'] = tile.tx
-        next_tid['ty'] = tile.ty
-
-        if d is not None:
-          dirs.remove(d)
-        if not dirs:
-          d = None
-
-        d = random.choice(dirs)
-        if d == "Up":
-          next_tid['ty'] = next_tid['ty'] - 1
-        elif d == "Down":
-            next_tid['ty'] = next_tid['ty'] + 1
-        elif d == "Left":
-            next_tid['tx'] = next_tid['tx'] - 1
-        elif d == "Right":
-            next_tid['tx'] = next_tid['tx'] + 1
-
-        if d is not None:
-            selected = not selected and self.is_tile_walkable(Tile.decode(self, next_tid, Tile))
-
-        if d is None:
-          raise Exception("No valid direction from this tile:\t\tTile tx:"+str(tile.tx)+", ty"+str(tile.ty))
-      return d
+      grid = self.tile_grid()
+      pos = grid.position(tile)
+      if pos is None:
+        raise ValueError('Tile %s not found in tiles' % tile)
+      tx, ty = pos
+      dirs = [d for d, ok in zip(Direction.directions, grid.adjacency[ty, tx]) if ok]
+      if not dirs:
+        raise Exception("No valid direction from this tile:\t\tTile tx:"+str(tx)+", ty"+str(ty))
+      return random.choice(dirs)
 
     ## feature oracles
     def player_tile(self):
@@ -589,9 +686,7 @@ class AmidarIntervention(Intervention):
     # player enemy distances
     def player_enemy_distances(self, distmeas=TilePoint.manhattan):
       pt = self.worldpoint_to_tilepoint(self.game.player.position)
-      tile = self.get_tile_by_pos(pt.tx, pt.ty)
-      e_dists = self.enemy_distances_from_tile(tile, distmeas)
-      return e_dists
+      return self._enemy_distances(pt, distmeas)
 
     # player on painted segment
     def player_on_painted(self):
@@ -603,15 +698,12 @@ class AmidarIntervention(Intervention):
     def player_near_unpainted(self, radius=5):
       # get walkable tiles within radius
       ptp = self.worldpoint_to_tilepoint(self.game.player.position)
-      def tile_in_radius(t):
-        tp = self.tile_to_tilepoint(t)
-        mdist = TilePoint.manhattan(ptp, tp)
-        return mdist < radius
-      near_tiles = self.filter_tiles(pred=tile_in_radius)
-      near_tiles = [t for t in near_tiles if self.is_tile_walkable(t)]
-      total_painted = sum([t.tag == Tile.Painted for t in near_tiles])
+      grid = self.tile_grid()
+      ys, xs, near = grid.window(ptp.tx, ptp.ty, radius)
+      near = near & grid.walkable[ys, xs]
+      painted = grid.tags[ys, xs] == Tile.tags.index(Tile.Painted)
       # return if all are painted
-      return not total_painted == len(near_tiles)
+      return bool((near & ~painted).any())
 
 
 
@@ -5,9 +5,11 @@ try:
 except:
   import json
 
+import hashlib
 import importlib
 import logging
 import math
+import operator
 import os
 import random
 from typing import Union
@@ -28,18 +30,38 @@ class InterventionNoneError(AttributeError):
   def __init__(self):
     super().__init__('intervention cannot be None')
 
+
+# Field values that can never hold game objects; skips the (slow) ABC
+# isinstance check when locating decoded objects.
+_SCALARS = frozenset([bool, int, float, str, type(None)])
+
+
 class Eq(ABC): 
 
   def __init__(self, obj):
     self.obj = obj
     self.clz = obj.__class__  
 
+  def same_content(self, other, cached_only=False) -> bool:
+    """True if both objects have the same content hash; see BaseMixin.content_hash.
+
+    With `cached_only`, only hashes that are already computed are compared,
+    so the check never costs a walk of the subtrees."""
+    if type(self.obj) is not type(other.obj): return False
+    if cached_only and (self.obj.cached_hash() is None or other.obj.cached_hash() is None):
+      return False
+    return self.obj.content_hash() == other.obj.content_hash()
+
 
 class StandardEq(Eq):
 
   def __eq__(self, other) -> bool:
+    if self.same_content(other, cached_only=True): return True
+    if isinstance(self.obj, Collection):
+      # A Collection has no eq_keys; its elements are compared in order.
+      return len(self.obj) == len(other.obj) and all(a == b for a, b in zip(self.obj, other.obj))
     for key in self.clz.eq_keys:
-      if self.obj.__getattribute__(key) != other.obj.__getattribute__(key):
+      if getattr(self.obj, key) != getattr(other.obj, key):
         return False
     return True
 
@@ -56,12 +78,27 @@ class ProbEq(Eq):
 
   def __eq__(self, other) -> Eq:
     assert type(self) == type(other)
+    if self.same_content(other, cached_only=True): return self
+
+    if isinstance(self.obj, Collection):
+      if len(self.obj) != len(other.obj):
+        self.differ = ('len(COLLECTION)', len(self.obj), len(other.obj))
+        return self
+      indices = list(range(len(self.obj)))
+      random.shuffle(indices)
+      for i in indices:
+        cmp = self.obj[i] == other.obj[i]
+        if cmp.differ:
+          self.differ = ('COLLECTION[{}].{}'.format(i, cmp.differ[0]), cmp.differ[1], cmp.differ[2])
+          return self
+      return self
+
     copy = self.clz.eq_keys[:]
     random.shuffle(copy)
 
     for key in copy:
-      v1 = self.obj.__getattribute__(key) 
-      v2 = other.obj.__getattribute__(key)
+      v1 = getattr(self.obj, key)
+      v2 = getattr(other.obj, key)
       assert type(v1) == type(v2), '{} vs {} for {}'.format(type(v1), type(v2), key)
 
       eq = math.isclose if type(v1) == float else lambda a, b: a == b
@@ -133,13 +170,16 @@ class SetEq(Eq):
     return retval
 
   def __eq__(self, other) -> Eq:
+    # Identical subtrees have no differences to report.
+    if self.same_content(other): return self
+
     if isinstance(self.obj, Collection):
       self.differs.extend(SetEq._coll_eq(self.obj, other.obj).differs)
       return self
 
     for key in self.clz.eq_keys:
-      v1 = self.obj.__getattribute__(key) 
-      v2 = other.obj.__getattribute__(key)
+      v1 = getattr(self.obj, key)
+      v2 = getattr(other.obj, key)
       assert type(v1) == type(v2), '{} vs {} for {}'.format(type(v1), type(v2), key)
 
       with_prefix = lambda x : key + '.' + x 
@@ -171,18 +211,84 @@ class SetEq(Eq):
     return self.differs.__len__()
   
   def difference(self, other):
-    # tuples are weird
+    # Values may be game objects or lists, so only the paths are hashed.
+    by_path = {}
+    for k, v1, v2 in other.differs:
+      by_path.setdefault(k, []).append((v1, v2))
     differs = []
     for k, v1, v2 in self.differs:
-      # try to find k in other.differs
-      found = False
-      for k_, v1_, v2_ in other.differs:
-        if k == k_ and v1 == v1_ and v2 == v2_: 
-          found = True
-          break
-      if not found: differs.append((k, v1, v2))
+      if not any(v1 == v1_ and v2 == v2_ for v1_, v2_ in by_path.get(k, ())):
+        differs.append((k, v1, v2))
     return differs
 
+
+def _hash_value(hasher, value, guards, tracked=False):
+  # Writes into a plain list are not recorded, so a digest covering one is
+  # only valid while the list holds the same elements: each such list is
+  # added to `guards` with a copy of its elements (see _unchanged). The list
+  # of a Collection (`tracked`) is only changed through recorded methods.
+  if type(value) in _SCALARS:
+    hasher.update(repr(value).encode())
+  elif isinstance(value, BaseMixin):
+    digest, child_guards = value._content_hash()
+    hasher.update(digest)
+    guards.extend(child_guards)
+  elif isinstance(value, (list, tuple)):
+    if type(value) is list and not tracked:
+      guards.append((value, list(value)))
+    if value and type(value[0]) in _SCALARS:
+      hasher.update(repr(list(value)).encode())
+      return
+    hasher.update(b'[%d' % len(value))
+    for v in value: _hash_value(hasher, v, guards)
+    hasher.update(b']')
+  else:
+    hasher.update(repr(value).encode())
+
+
+def _unchanged(value, elements):
+  return len(value) == len(elements) and all(map(operator.is_, value, elements))
+
+
+def _fields(obj):
+  return obj.eq_keys if obj.hash_keys is None else obj.hash_keys
+
+
+def _path_join(path, step):
+  if type(step) is int: return '{}[{}]'.format(path, step)
+  return step if not path else path + '.' + step
+
+
+def diff(this, that, path=''):
+  """Lists the differences between two game objects as (path, this value, that value).
+
+  Paths are in `get_property` syntax, e.g. `bricks[12].alive`; lists (and
+  collections) of different lengths are reported as `len(path)`. Values are
+  compared exactly. Subtrees with equal content hashes are skipped, so
+  comparing two mostly-identical states only walks the parts that changed."""
+  if isinstance(this, BaseMixin) and isinstance(that, BaseMixin):
+    if type(this) is not type(that):
+      return [(path, this, that)]
+    if this.content_hash() == that.content_hash():
+      return []
+    differs = []
+    for key in _fields(this):
+      v1, v2 = getattr(this, key), getattr(that, key)
+      # Collections hold their elements directly under the collection's path.
+      differs.extend(diff(v1, v2, path if key == 'coll' else _path_join(path, key)))
+    return differs
+
+  if isinstance(this, list) and isinstance(that, list) and \
+     any(not (type(v) in _SCALARS) for v in this[:1] + that[:1]):
+    if len(this) != len(that):
+      return [('len({})'.format(path), len(this), len(that))]
+    differs = []
+    for i, (v1, v2) in enumerate(zip(this, that)):
+      differs.extend(diff(v1, v2, _path_join(path, i)))
+    return differs
+
+  return [] if this == that else [(path, this, that)]
+
 class BaseMixin(ABC):
   """Base class for game objects. Registers mutation so JSON can be pushed via context manager."""
 
@@ -198,6 +304,10 @@ class BaseMixin(ABC):
 
   immutable_fields = ['intervention']
   coersions = {}
+  # Fields covered by content_hash; None means eq_keys.
+  hash_keys = None
+  # Subclasses without __slots__ keep their fields in __dict__; see CompactMixin.
+  __slots__ = ()
 
   def __init__(self, intervention):
     self._in_init = True
@@ -220,12 +330,19 @@ class BaseMixin(ABC):
   def __setattr__(self, name, value):
     existing_attrs = self.__dict__.keys()
     adding_new = name not in existing_attrs
+    if adding_new and '_lazy' in existing_attrs and name in self._lazy:
+      # Overwriting a field that was never decoded.
+      del self._lazy[name]
+      adding_new = False
     
     # Need to force monotonicity of _in_init
     if name == '_in_init' and value is True and name in existing_attrs:
       raise MutationError(name)
-    super().__setattr__(name, self.coersions[name](value) if name in self.coersions else value)
+    value = self.coersions[name](value) if name in self.coersions else value
+    super().__setattr__(name, value)
+    self._check_mutation(name, adding_new)
 
+  def _check_mutation(self, name, adding_new):
     # Only okay to add fields during initialization.
     if self._in_init: return
     if self.intervention is None: raise InterventionNoneError()
@@ -237,9 +354,33 @@ class BaseMixin(ABC):
       raise MutationError("Cannot add new field %s to %s" % (name, self.__class__.__name__))
     if name != '_in_init':
       # Don't want to set dirty_state when we are flipping init
-      self.intervention.dirty_state = True    
+      self.intervention.record_change(self, name)
     
   
+  def decode_lazily(self, name, obj, clz):
+    """Sets field `name` to the decoded `obj`, as `clz.decode` would.
+
+    For lazy interventions the decode is deferred until the field is first read,
+    and a field that is never read is written back as the JSON it came from.
+    Call this from `__init__` for fields holding large subtrees."""
+    if self.intervention.lazy:
+      if '_lazy' not in self.__dict__:
+        self._lazy = {}
+      self._lazy[name] = (obj, clz)
+    else:
+      self.__setattr__(name, clz.decode(self.intervention, obj, clz))
+
+  def __getattr__(self, name):
+    # Only called when regular lookup fails, i.e. for fields not decoded yet.
+    lazy = self.__dict__.get('_lazy')
+    if lazy is None or name not in lazy:
+      raise AttributeError("'%s' object has no attribute '%s'" % (type(self).__name__, name))
+    obj, clz = lazy.pop(name)
+    value = clz.decode(self.intervention, obj, clz)
+    # Decoding does not change the state, so bypass the mutation checks.
+    object.__setattr__(self, name, value)
+    return value
+
   def decode(intervention, obj, clz):
     """Creates an instance of the input class from the JSON. 
     
@@ -283,7 +424,10 @@ class BaseMixin(ABC):
     dat = {}
     for name, val in vars(self).items():
       if name == 'intervention': continue
-      if name == '_in_init': continue
+      if name == '_in_init' or name == '_hash': continue
+      if name == '_lazy':
+        dat.update({k: obj for k, (obj, _) in val.items()})
+        continue
       if name not in self.expected_keys:
         logging.debug('skipping %s in %s; not in expected keys' % (name, type(self).__name__))
         continue
@@ -313,6 +457,37 @@ class BaseMixin(ABC):
       
 
 
+  def content_hash(self) -> bytes:
+    """A digest of the fields compared for equality, recursing into child objects.
+
+    The digest is cached on the object until the next change recorded by its
+    intervention (see Intervention.record_change), or until an element of a
+    plain list below it is replaced, so objects with equal hashes can be
+    treated as equal without walking them."""
+    return self._content_hash()[0]
+
+  def cached_hash(self):
+    """The content hash if it is cached and still valid, else None."""
+    h = getattr(self, '_hash', None)
+    if h is None: return None
+    epoch, digest, guards = h
+    if epoch != self.intervention._epoch: return None
+    if not all(_unchanged(value, elements) for value, elements in guards): return None
+    return digest
+
+  def _content_hash(self):
+    # (digest, the plain lists it depends on; see _hash_value)
+    digest = self.cached_hash()
+    if digest is not None: return digest, self._hash[2]
+    hasher = hashlib.blake2b(type(self).__name__.encode(), digest_size=16)
+    guards = []
+    for key in _fields(self):
+      hasher.update(key.encode())
+      _hash_value(hasher, getattr(self, key), guards, key == 'coll' and isinstance(self, Collection))
+    digest = hasher.digest()
+    object.__setattr__(self, '_hash', (self.intervention._epoch, digest, guards))
+    return digest, guards
+
   def __eq__(self, other) -> Union[bool, Eq]:
     return self.eq_mode(self) == other.eq_mode(other)
 
@@ -321,10 +496,66 @@ class BaseMixin(ABC):
     return self.intervention.eq_mode
 
 
+class CompactMixin(BaseMixin):
+  """Base class for small, numerous game objects (colors, points, bricks, tiles).
+
+  Fields are stored in `__slots__` rather than a per-instance dict, which
+  makes these objects several times smaller and cheaper to build. Subclasses
+  must list all of their fields in `__slots__` and set every one of them in
+  `__init__`; the mutation checks are the same as for BaseMixin."""
+
+  __slots__ = ('intervention', '_in_init', '_hash')
+
+  def __init_subclass__(clz, **kwargs):
+    super().__init_subclass__(**kwargs)
+    clz._slot_names = frozenset(name for c in clz.__mro__ for name in c.__dict__.get('__slots__', ()))
+
+  def __init__(self, intervention):
+    # These objects are built by the thousand, so the bookkeeping fields are
+    # stored directly rather than through __setattr__.
+    object.__setattr__(self, '_in_init', True)
+    object.__setattr__(self, 'intervention', intervention)
+
+  def __setattr__(self, name, value):
+    # Every slot is set in __init__, so any slot is an existing field once we
+    # are out of it; other names cannot be stored at all.
+    if name not in self._slot_names:
+      raise MutationError("Cannot add new field %s to %s" % (name, self.__class__.__name__))
+    if name == '_in_init':
+      # Need to force monotonicity of _in_init; flipping it is not a change.
+      if value is True: raise MutationError(name)
+      object.__setattr__(self, name, value)
+      return
+    value = self.coersions[name](value) if name in self.coersions else value
+    object.__setattr__(self, name, value)
+    if not self._in_init:
+      self._check_mutation(name, False)
+
+  def __getattr__(self, name):
+    # No lazy fields here; see BaseMixin.__getattr__.
+    raise AttributeError("'%s' object has no attribute '%s'" % (type(self).__name__, name))
+
+  def __getstate__(self):
+    # _hash is only set once computed.
+    return {name: getattr(self, name) for name in self._slot_names if hasattr(self, name)}
+
+  def __setstate__(self, state):
+    for name, val in state.items():
+      object.__setattr__(self, name, val)
+
+  def encode(self):
+    dat = {}
+    for name in self.expected_keys:
+      val = getattr(self, name)
+      dat[name] = val.encode() if isinstance(val, BaseMixin) else val
+    return dat
+
+
 class Collection(BaseMixin):
 
   expected_keys = []
   eq_keys = []
+  hash_keys = ['coll']
   immutable_fields = BaseMixin.immutable_fields + ['coll']
 
   def __init__(self, intervention, coll, elt_clz):
@@ -342,36 +573,40 @@ class Collection(BaseMixin):
 
   def __setitem__(self, key, value): 
     self.coll.__setitem__(key, value)
-    self.intervention.dirty_state = True
+    if isinstance(key, int) and isinstance(value, BaseMixin):
+      # Only the replaced element needs to be written back.
+      self.intervention.record_change(value)
+    else:
+      self.intervention.record_change(self)
     
   def __len__(self): return self.coll.__len__()
 
   def append(self, obj):
     assert isinstance(obj, self.elt_clz), '%s must be of type %s' % (obj, self.elt_clz)
     self.coll.append(obj)
-    # Since this doesn't trigger the superclass' __setattr__, we need to     sdirty_state manuall
-    self.intervention.dirty_state = True
+    # Since this doesn't trigger the superclass' __setattr__, we need to record the change manually
+    self.intervention.record_change(self)
 
   def extend(self, obj):
     self.coll.extend(obj)
-    self.intervention.dirty_state = True
+    self.intervention.record_change(self)
 
   def insert(self, i, x):
     self.coll.insert(i, x)
-    self.intervention.dirty_state = True
+    self.intervention.record_change(self)
 
   def remove(self, obj):
     self.coll.remove(obj)
-    # Since this doesn't trigger the superclass' __setattr__, we need to setdirty_state manuall
-    self.intervention.dirty_state = True
+    # Since this doesn't trigger the superclass' __setattr__, we need to record the change manually
+    self.intervention.record_change(self)
 
   def pop(self, i=-1):
-    self.intervention.dirty_state = True
+    self.intervention.record_change(self)
     return self.coll.pop(i)
 
   def clear(self):
     self.coll.clear()
-    self.intervention.dirty_state = True
+    self.intervention.record_change(self)
 
   def index(self, x, *args):
     return self.coll.index(x, *args)
@@ -380,11 +615,11 @@ class Collection(BaseMixin):
     return self.coll.count(x)
 
   def sort(self, key=None, reverse=False):
-    self.intervention.dirty_state = True
+    self.intervention.record_change(self)
     self.coll.sort(key=key, reverse=reverse)
 
   def reverse(self):
-    self.intervention.dirty_state = True
+    self.intervention.record_change(self)
     self.coll.reverse()
 
   def copy(self):
@@ -423,26 +658,172 @@ class Collection(BaseMixin):
 
         
 class Intervention(ABC):
+  """Context manager that decodes a Toybox state into game objects and writes changes back on exit.
+
+  With `lazy=True`, large subtrees of the state (those set with
+  `BaseMixin.decode_lazily`) are only decoded when first read, and subtrees that
+  were never read are written back without being re-encoded. The config is only
+  fetched from Toybox when `config` is first read, in either mode.
+
+  `modelmod` is either a package of generated model modules or the path of a
+  `.models` file (see sampling.ModelStore) that is fitted to `data` and
+  loaded on entry.
+
+  Mutations are kept in a change log of (object, field) pairs. On exit, only
+  the changed fields are encoded and patched into the state JSON read on
+  entry; see `changed_paths` for the log in `get_property` syntax."""
 
-  def __init__(self, tb: Toybox, game_name: str, clz: type, modelmod=None, data=None, eq_mode=StandardEq):
+  def __init__(self, tb: Toybox, game_name: str, clz: type, modelmod=None, data=None, eq_mode=StandardEq, lazy=False):
     assert tb.game_name == game_name
     self.game_name = game_name
     self.toybox = tb
-    self.config = None
+    self._config = None
     self.dirty_config = False
     self.dirty_state = False
     self.clz = clz
     self.game = None
+    self.state = None
+    self.changes = []
+    # Bumped by every recorded change; cached content hashes from an earlier
+    # epoch are ignored.
+    self._epoch = 0
+    # id of each object in the game -> (parent object, (field, index, ...));
+    # built by _locate_all when first needed after a change.
+    self._locations = None
 
     self.modelmod = modelmod 
     self.data = data
+    # Loaded from modelmod when it names a ModelStore file rather than a package.
+    self.models = None
     self.eq_mode = eq_mode
+    self.lazy = lazy
+
+  @property
+  def config(self):
+    if self._config is None:
+      self._config = self.toybox.config_to_json()
+    return self._config
+
+  @config.setter
+  def config(self, config):
+    self._config = config
+
+  def _locate_all(self):
+    # Walks the game once to find where every object is held. Only writing
+    # changes back needs this, so decoding does not pay for it. Only encoded
+    # fields are followed (collections encode as their elements), since the
+    # paths are into the state JSON.
+    locations = {}
+    # type -> (is a game object, is a CompactMixin); the ABC checks are slow.
+    kinds = {}
+    def kind(clz):
+      if clz not in kinds:
+        kinds[clz] = (issubclass(clz, BaseMixin), issubclass(clz, CompactMixin))
+      return kinds[clz]
+
+    parents = [self.game]
+    while parents:
+      parent = parents.pop()
+      if kind(type(parent))[1]:
+        values = [(name, getattr(parent, name)) for name in parent.expected_keys]
+      else:
+        fields = parent.__dict__
+        names = parent.expected_keys if 'coll' not in fields else ['coll']
+        # Fields still waiting to be decoded lazily are not in __dict__.
+        values = [(name, fields[name]) for name in names if name in fields]
+      for name, value in values:
+        if type(value) in _SCALARS: continue
+        held = [(value, (name,))]
+        while held:
+          value, key = held.pop()
+          if kind(type(value))[0]:
+            locations[id(value)] = (parent, key)
+            parents.append(value)
+          elif type(value) is list and value and type(value[0]) not in _SCALARS:
+            held.extend((v, key + (i,)) for i, v in enumerate(value))
+    self._locations = locations
+
+  def record_change(self, obj, name=None):
+    """Logs a mutation of field `name` of `obj`, or of all of `obj` if name is None."""
+    self.dirty_state = True
+    self.changes.append((obj, name))
+    # Every content hash cached before this change is now stale, including
+    # those of objects decoded from this intervention but no longer (or never)
+    # part of its game.
+    self._epoch += 1
+    # The change may have moved objects.
+    self._locations = None
+
+  def _path(self, obj):
+    # The path from the game to obj, as JSON keys and indices; None if obj is
+    # no longer (or was never) part of the game.
+    steps = []
+    while obj is not self.game:
+      if self._locations is None: self._locate_all()
+      loc = self._locations.get(id(obj))
+      if loc is None: return None
+      parent, key = loc
+      held = getattr(parent, key[0], None)
+      try:
+        for i in key[1:]: held = held[i]
+      except (IndexError, TypeError):
+        return None
+      if held is not obj: return None
+      steps.extend(reversed(key[1:]))
+      # Collections encode as their elements.
+      if key[0] != 'coll': steps.append(key[0])
+      obj = parent
+    steps.reverse()
+    return steps
+
+  def _patch(self, obj, name):
+    # The JSON path to overwrite for a change, and the value to encode there.
+    path = self._path(obj)
+    if path is None: return None, None
+    if name is None or name not in obj.expected_keys or type(obj).encode not in (BaseMixin.encode, CompactMixin.encode):
+      # Custom encodings have to be redone for the whole object.
+      return tuple(path), obj
+    return tuple(path) + (name,), getattr(obj, name)
+
+  def changed_paths(self):
+    """The paths changed since entering, e.g. `bricks[12].alive`; None for changes that cannot be located."""
+    paths = []
+    for obj, name in self.changes:
+      path, _ = self._patch(obj, name)
+      if path is not None:
+        path = ''.join('[%d]' % s if type(s) is int else '.' + s for s in path).lstrip('.')
+      paths.append(path)
+    return paths
+
+  def patched_state(self):
+    """The state read on entry with the logged changes applied, or None if they cannot be located."""
+    if not self.changes: return None
+    patches = {}
+    for obj, name in self.changes:
+      path, val = self._patch(obj, name)
+      # An empty path is the whole game.
+      if not path: return None
+      patches[path] = val
+
+    state = self.state
+    done = set()
+    for path in sorted(patches, key=len):
+      if any(path[:i] in done for i in range(1, len(path))):
+        # Already written back with an enclosing object.
+        continue
+      done.add(path)
+      val = patches[path]
+      node = state
+      for step in path[:-1]: node = node[step]
+      node[path[-1]] = val.encode() if isinstance(val, BaseMixin) else val
+    return state
 
   def __enter__(self):
     # grab the JSON to be manipulated
-    #self.state = self.toybox.to_state_json()
-    self.config = self.toybox.config_to_json()
-    self.game = self.clz.decode(self, self.toybox.to_state_json(), self.clz)
+    self.state = self.toybox.to_state_json()
+    self.changes = []
+    self._locations = None
+    self.game = self.clz.decode(self, self.state, self.clz)
     if self.modelmod:
       if self.data: self.make_models()
       self.load_models()
@@ -457,9 +838,13 @@ class Intervention(ABC):
       self.toybox.new_game()
 
     elif self.dirty_state:
-      self.toybox.write_state_json(self.game.encode())
+      state = self.patched_state()
+      self.toybox.write_state_json(state if state is not None else self.game.encode())
 
     self.config = None
+    self.state = None
+    self.changes = []
+    self._locations = None
 
 
   def set_partial_config(self, fname): 
@@ -474,10 +859,24 @@ class Intervention(ABC):
             self.dirty_config = True
 
 
+  def uses_model_store(self):
+    return self.modelmod is not None and self.modelmod.endswith('.models')
+
   def load_models(self):
+    if self.uses_model_store():
+      from toybox.interventions.sampling import ModelStore
+      # The store is memory-mapped, so one load serves every entry.
+      if self.models is None:
+        self.models = ModelStore.load(self.modelmod)
+      return self.models
     return importlib.import_module(self.modelmod, package=__package__)
 
   def make_models(self): 
+    if self.uses_model_store():
+      from toybox.interventions.sampling import ModelStore
+      self.models = ModelStore.from_games(self.data)
+      self.models.save(self.modelmod)
+      return
     self.clz.make_models(self.modelmod, self.data)
 
 if __name__ == "__main__":
@@ -1,7 +1,11 @@
 from toybox.interventions.base import *
 from toybox.interventions.core import * 
+from toybox.interventions.sampling import StateSampler
+from toybox.interventions.schema import StateSchema, RequiredKeys
 
 import copy
+import functools
+import numpy as np
 try:
   import ujson as json
 except:
@@ -12,6 +16,7 @@ import sys
 from enum import Enum
 """An API for interventions on Breakout."""
 
+@functools.lru_cache(maxsize=4096)
 def query_hack(query):
   # need replace all coll[i] with coll.collitem%04d.format(i)
   # can iterate over these, but will need to figure out string
@@ -35,10 +40,9 @@ def query_hack(query):
 
 class Breakout(Game):
 
-  with Toybox('breakout') as tb:
-    schema = tb.schema_for_state()
-    expected_keys = schema['required']
-    eq_keys = [k for k in expected_keys if k != 'rand']
+  schema = StateSchema('breakout')
+  expected_keys = RequiredKeys('breakout')
+  eq_keys = RequiredKeys('breakout', exclude=['rand'])
   immutable_fields = Game.immutable_fields + ['balls', 'bricks', 'reset']
 
   coersions = { **Game.coersions, 
@@ -60,7 +64,7 @@ class Breakout(Game):
       self.reset        = Breakout.coersions['reset'](reset)
       self.paddle       = Paddle.decode(intervention, paddle, Paddle)
       self.ball_radius  = ball_radius
-      self.bricks       = BrickCollection.decode(intervention, bricks, BrickCollection)
+      self.decode_lazily('bricks', bricks, BrickCollection)
       self.balls        = BallCollection.decode(intervention, balls, BallCollection)
       self.paddle_speed = paddle_speed
       self.paddle_width = paddle_width
@@ -88,6 +92,11 @@ class Breakout(Game):
     if not self.intervention.modelmod: 
       log.warn('WARNING: no models for sampling')
       return 
+    models = self.intervention.models
+    if models is not None:
+      sampler = models.sampler(queries or None)
+      return sampler.apply(copy.copy(self), sampler.sample(1), 0)
+
     modelmod = self.intervention.modelmod
     mod = importlib.import_module(modelmod)
     if len(queries) == 0:
@@ -112,6 +121,20 @@ class Breakout(Game):
         logging.info('reset', query)
     return new
 
+  def sample_batch(self, n, *queries, seed=None):
+    """Draws n values for each query at once, as a dict from query to array.
+
+    Use a StateSampler's `apply` to write one set of draws into a game."""
+    if not self.intervention.modelmod:
+      logging.warn('WARNING: no models for sampling')
+      return
+    models = self.intervention.models
+    if models is not None:
+      sampler = models.sampler(queries or None)
+    else:
+      sampler = StateSampler.from_modelmod(self.intervention.modelmod, queries, module_name=query_hack)
+    return sampler.sample(n, seed)
+
   def make_models(modelmod, data):
     Game.make_models(modelmod, data, 'breakout', 'BreakoutIntervention')
     outdir = modelmod.replace('.', os.sep) + os.sep
@@ -193,10 +216,11 @@ class BrickCollection(Collection):
       Brick.make_models(modelmod + '.' + collname, i, [d[i] for d in data if len(d) > i])
 
 
-class Brick(BaseMixin):
+class Brick(CompactMixin):
 
   expected_keys = ['destructible', 'depth', 'color', 'alive', 'points', 'size', 'position', 'row', 'col']
   eq_keys = expected_keys
+  __slots__ = expected_keys
   coersions = {
     'alive'        : lambda x : x > 0.5,
     'destructible' : lambda x : x > 0.5,
@@ -222,7 +246,7 @@ class Brick(BaseMixin):
     self._in_init = False
 
   def __repr__(self):
-    return 'Brick({})'.format(' '.join([str(self.__dict__[key]) for key in Brick.expected_keys]))
+    return 'Brick({})'.format(' '.join([str(getattr(self, key)) for key in Brick.expected_keys]))
 
   def __str__(self):
     return self.__repr__()
@@ -242,6 +266,88 @@ class Brick(BaseMixin):
     distr(outdir + os.sep + 'row', [d.row for d in data], 'num')
     distr(outdir + os.sep + 'col', [d.col for d in data], 'num')
 
+class BrickArrays(object):
+  """A columnar view of a BrickCollection, with one NumPy array per brick field.
+
+  `alive`, `destructible`, `depth`, `points`, `row` and `col` hold one entry
+  per brick; `position` and `size` are (n, 2) arrays of (x, y) and `color` is
+  an (n, 4) array of (r, g, b, a). The arrays are read-only: write through
+  `set`, which updates both the arrays and the bricks (and so the change log
+  of the intervention). Use `BreakoutIntervention.brick_arrays` to get an
+  up-to-date view."""
+
+  fields = ['alive', 'destructible', 'depth', 'points', 'row', 'col']
+  vector_fields = {
+    'position' : ['x', 'y'],
+    'size'     : ['x', 'y'],
+    'color'    : ['r', 'g', 'b', 'a']
+  }
+  dtypes = {
+    'alive'        : np.bool_,
+    'destructible' : np.bool_,
+    'position'     : np.float64,
+    'size'         : np.float64
+  }
+
+  def __init__(self, bricks: BrickCollection):
+    self.bricks = bricks
+    # The length of the change log when the arrays were last in sync.
+    self.nchanges = len(bricks.intervention.changes)
+    for name in BrickArrays.fields:
+      arr = np.array([getattr(b, name) for b in bricks], dtype=BrickArrays.dtypes.get(name, np.int64))
+      arr.setflags(write=False)
+      setattr(self, name, arr)
+    for name, keys in BrickArrays.vector_fields.items():
+      vecs = [getattr(b, name) for b in bricks]
+      arr = np.array([[getattr(v, k) for k in keys] for v in vecs], dtype=BrickArrays.dtypes.get(name, np.int64))
+      arr = arr.reshape(len(vecs), len(keys))
+      arr.setflags(write=False)
+      setattr(self, name, arr)
+
+  def __len__(self): return len(self.bricks)
+
+  def set(self, name, index, value):
+    """Sets field `name` of the bricks selected by `index` to `value`.
+
+    `index` is anything that selects bricks from a 1-D array: a brick index, a
+    slice, a boolean mask or an array of indices. Only bricks whose value
+    actually changes are written to."""
+    arr = getattr(self, name)
+    idx = np.atleast_1d(np.arange(len(arr))[index])
+    old = arr[idx]
+    arr.setflags(write=True)
+    try:
+      arr[idx] = value
+      new = arr[idx]
+      differs = old != new
+      if arr.ndim > 1: differs = differs.reshape(len(idx), -1).any(axis=1)
+      for i in idx[differs]:
+        brick = self.bricks[i]
+        if name in BrickArrays.vector_fields:
+          vec = getattr(brick, name)
+          for j, k in enumerate(BrickArrays.vector_fields[name]):
+            setattr(vec, k, arr[i, j].item())
+            # Keep the arrays in sync with any coersions.
+            arr[i, j] = getattr(vec, k)
+        else:
+          setattr(brick, name, arr[i].item())
+          arr[i] = getattr(brick, name)
+    finally:
+      arr.setflags(write=False)
+    self.nchanges = len(self.bricks.intervention.changes)
+
+  def column_counts(self, ncols):
+    """Returns the number of bricks, and of live bricks, in each of the first ncols columns."""
+    total = np.bincount(self.col, minlength=ncols)[:ncols]
+    alive = np.bincount(self.col, weights=self.alive, minlength=ncols)[:ncols]
+    return total, alive.astype(np.int64)
+
+  def channels(self, ncols):
+    """Returns a boolean mask over the first ncols columns, true where the column is a channel."""
+    total, alive = self.column_counts(ncols)
+    return (total > 0) & (alive == 0)
+
+
 class BallCollection(Collection):
 
   def __init__(self, intervention, balls):
@@ -296,12 +402,23 @@ class Ball(BaseMixin):
 
 class BreakoutIntervention(Intervention):
 
-    def __init__(self, tb: Toybox, modelmod=None, data=None, eq_mode=StandardEq):
+    def __init__(self, tb: Toybox, modelmod=None, data=None, eq_mode=StandardEq, lazy=False):
         # check that the simulation in tb matches the game name.
-        Intervention.__init__(self, tb, 'breakout', Breakout, modelmod=modelmod, data=data, eq_mode=eq_mode)
+        Intervention.__init__(self, tb, 'breakout', Breakout, modelmod=modelmod, data=data, eq_mode=eq_mode, lazy=lazy)
+        self._brick_arrays = None
+
+    def brick_arrays(self):
+        """Returns a BrickArrays view of the bricks.
+
+        The view is cached, and rebuilt when the game has changed other than
+        through the view's `set`."""
+        view = self._brick_arrays
+        if view is None or view.bricks is not self.game.bricks or view.nchanges != len(self.changes):
+            view = self._brick_arrays = BrickArrays(self.game.bricks)
+        return view
 
     def num_bricks_remaining(self):
-        return sum([int(brick.alive) for brick in self.game.bricks])
+        return int(self.brick_arrays().alive.sum())
 
     def num_bricks(self):
         return len(self.game.bricks)
@@ -359,22 +476,15 @@ class BreakoutIntervention(Intervention):
 
     def get_column(self, i):
         """Returns the ith column of bricks."""
-        bricks = []
-        for brick in self.game.bricks:
-            if brick.col == i:
-                bricks.append(brick)
-        return bricks
+        bricks = self.game.bricks
+        return [bricks[j] for j in np.flatnonzero(self.brick_arrays().col == i)]
 
     def get_row(self, i):
       """Returns the ith column of bricks."""
       return [b for b in self.game.bricks if b.row == 1]
     
     def channel_count(self):
-        count = 0
-        for i in range(self.num_columns()):
-            channel = self.get_column(i)
-            if self.is_channel(channel): count += 1
-        return count
+        return int(self.brick_arrays().channels(self.num_columns()).sum())
 
     def get_ball_position(self):
         """Returns a list of positions, if there is more than one ball, and a single Vec2D object otherwise.:"""
@@ -405,25 +515,22 @@ class BreakoutIntervention(Intervention):
 
     def add_channel(self, i):
         """Turns the ith column into a channel"""
-        for brick in self.game.bricks:
-            if brick.col == i and brick.alive:
-                brick.alive = False
+        view = self.brick_arrays()
+        view.set('alive', view.col == i, False)
 
     def fill_column(self, i): 
         """Fills the ith column, so that all bricks are now alive."""
-        for brick in self.game.bricks:
-            if brick.col == i and not brick.alive:
-                brick.alive = True
+        view = self.brick_arrays()
+        view.set('alive', view.col == i, True)
 
     def find_channel(self):
         """Returns the first channel found."""
-        for i in range(self.num_columns()):
-            col = self.get_column(i)
-            if self.is_channel(col):
-                return i, col
-        return -1, None
+        channels = np.flatnonzero(self.brick_arrays().channels(self.num_columns()))
+        if len(channels) == 0:
+            return -1, None
+        i = int(channels[0])
+        return i, self.get_column(i)
 
     def clear_board(self):
         """Clears the board of all bricks"""
-        for brick in self.game.bricks:
-            brick.alive = False
+        self.brick_arrays().set('alive', slice(None), False)
@@ -2,9 +2,9 @@ from toybox.interventions.base import *
 
 from contextlib import AbstractContextManager
 from numpy import array
-from sklearn.neighbors import KernelDensity
 from typing import List, Any, Union
 
+import functools
 import math
 import random
 import re
@@ -42,12 +42,21 @@ def bool_support(fname, data):
   p = min(1.0, p + (0.001 * random.random()))
   p = max(0.0, p - (0.001 * random.random()))
   with open(fname + '.py', 'w') as f:
-    f.write(
-      "from random import random\n\ndef sample(*args, **kwargs):\n\treturn random() < {}".format(p)
-    )
+    f.write("""from random import random
+from toybox.interventions.sampling import Bernoulli
+
+model = Bernoulli({0})
+
+def sample(*args, **kwargs):
+  return random() < {0}
+
+def sample_batch(n, rng=None):
+  return model.sample(n, rng)
+""".format(p))
   
 
 def inf_support(fname, data):
+  from sklearn.neighbors import KernelDensity
   # select bandwidth according to scotts rule
   # https://docs.scipy.org/doc/scipy/reference/generated/scipy.stats.gaussian_kde.html
   bandwidth = len(data)**(-1./5)
@@ -64,11 +73,18 @@ def inf_support(fname, data):
 except:
   import pickle
 
+from toybox.interventions.sampling import GaussianKDE
+
 with open('{0}', 'rb') as f:
   kde = pickle.load(f)
 
+model = GaussianKDE.from_sklearn(kde)
+
 def sample(*args, **kwargs):
   return float(kde.sample()[0][0])
+
+def sample_batch(n, rng=None):
+  return model.sample(n, rng)
       """.format(fname + '.pck'))
 
 
@@ -115,11 +131,12 @@ class Game(BaseMixin):
         outf.write(inf.read().format(game=game_name, intervention=intervention_name))
 
 
-class Direction(BaseMixin):
+class Direction(CompactMixin):
 
   expected_keys = []
   eq_keys = ['direction']
   immutable_fields = BaseMixin.immutable_fields
+  __slots__ = ['direction']
 
   Up    = 'Up'
   Down  = 'Down'
@@ -146,11 +163,12 @@ class Direction(BaseMixin):
   def make_models(self, data): assert False
 
 
-class Vec2D(BaseMixin):
+class Vec2D(CompactMixin):
 
   expected_keys = ['y', 'x']
   eq_keys = expected_keys
   immutable_fields = BaseMixin.immutable_fields
+  __slots__ = expected_keys
   coersions = {
     'x' : lambda x: float(x),
     'y' : lambda y: float(y)
@@ -173,11 +191,12 @@ class Vec2D(BaseMixin):
         outf.write(inf.read())
 
   
-class Color(BaseMixin):
+class Color(CompactMixin):
 
   expected_keys = ['r', 'g', 'b', 'a']
   eq_keys = expected_keys
   immutable_fields = BaseMixin.immutable_fields
+  __slots__ = expected_keys
   coersions = {
     'r': lambda x : max(0, min(255, int(x))),
     'g': lambda x : max(0, min(255, int(x))),
@@ -240,23 +259,49 @@ class ColorCollectionCollection(BaseMixin):
   expected_keys = []
   immutable_fields = BaseMixin.immutable_fields + ['coll']
   eq_keys = []
+  hash_keys = ['coll']
 
   def __init__(self, intervention, sprites):
     super().__init__(intervention)
-    self.coll = []
-    for coll in sprites:
-      self.coll.append([Color.decode(intervention, datum, Color) for datum in coll])
+    self.coll = [[Color.decode(intervention, datum, Color) for datum in coll] for coll in sprites]
     self._in_init = False
 
   def __eq__(self, other):
-    result = Result(None)
-    for i in range(len(self.coll)):
-      row = self[i]
-      for j in range(len(row)):
-        result = eq(row[j], other[i][j], '{}[{}][{}]'.format(ColorCollectionCollection.__name__, i, j))
-        if isinstance(result, Error):
+    # Compares the colors pairwise under the intervention's eq_mode, and
+    # returns that mode's result for the whole grid, as for a Collection.
+    mode = self.eq_mode
+    shape = [len(row) for row in self.coll]
+    other_shape = [len(row) for row in other.coll]
+    pairs = (('coll[{}][{}]'.format(i, j), c1, c2)
+             for i, (row1, row2) in enumerate(zip(self.coll, other.coll))
+             for j, (c1, c2) in enumerate(zip(row1, row2)))
+
+    if issubclass(mode, SetEq):
+      result = SetEq(self)
+      if result.same_content(SetEq(other)): return result
+      if shape != other_shape:
+        result.differs.append(('len(coll)', shape, other_shape))
+        return result
+      for path, c1, c2 in pairs:
+        for key, v1, v2 in (c1 == c2).differs:
+          result.differs.append(('{}.{}'.format(path, key), v1, v2))
+      return result
+
+    if issubclass(mode, ProbEq):
+      result = ProbEq(self)
+      if result.same_content(ProbEq(other), cached_only=True): return result
+      if shape != other_shape:
+        result.differ = ('len(coll)', shape, other_shape)
+        return result
+      for path, c1, c2 in pairs:
+        cmp = c1 == c2
+        if cmp.differ:
+          result.differ = ('{}.{}'.format(path, cmp.differ[0]), cmp.differ[1], cmp.differ[2])
           return result
-    return result
+      return result
+
+    if StandardEq(self).same_content(StandardEq(other), cached_only=True): return True
+    return shape == other_shape and all(c1 == c2 for _, c1, c2 in pairs)
 
   def decode(intervention, coll, clz):
     return ColorCollectionCollection(intervention, coll)
@@ -280,24 +325,116 @@ def parse_property_access(query: str) -> List[Union[str,int]]:
       output.append(word_pat)
   return output
 
+
+def _step(obj, step):
+  return obj[step] if type(step) is int else getattr(obj, step)
+
+
+class PropertyPath(object):
+  """A property path parsed once, for repeated gets and sets.
+
+  Use `compile_property` rather than the constructor; it caches paths."""
+
+  __slots__ = ['path', 'steps']
+
+  def __init__(self, path: str):
+    self.path = path
+    self.steps = tuple(parse_property_access(path))
+
+  def __repr__(self):
+    return 'PropertyPath({!r})'.format(self.path)
+
+  def get(self, obj):
+    for step in self.steps:
+      obj = _step(obj, step)
+    return obj
+
+  def container(self, obj):
+    for step in self.steps[:-1]:
+      obj = _step(obj, step)
+    return obj
+
+  def set(self, obj, value):
+    _set_step(self.container(obj), self.steps[-1], value)
+
+
+def _set_step(container, step, value):
+  if type(step) is int:
+    container.__setitem__(step, value)
+  else:
+    container.__setattr__(step, value)
+
+
+@functools.lru_cache(maxsize=4096)
+def compile_property(path: str) -> PropertyPath:
+  """The PropertyPath for `path`, parsed on first use."""
+  return PropertyPath(path)
+
+
+class _PathTrie(object):
+  # The steps of several paths merged on their common prefixes; `ends` holds
+  # the indices of the paths ending at each node.
+
+  __slots__ = ['children', 'ends']
+
+  def __init__(self):
+    self.children = {}
+    self.ends = []
+
+  def add(self, steps, index):
+    node = self
+    for step in steps:
+      child = node.children.get(step)
+      if child is None:
+        child = node.children[step] = _PathTrie()
+      node = child
+    node.ends.append(index)
+
+  def resolve(self, obj, out):
+    for i in self.ends:
+      out[i] = obj
+    for step, child in self.children.items():
+      child.resolve(_step(obj, step), out)
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_trie(paths, containers=False) -> _PathTrie:
+  trie = _PathTrie()
+  for i, path in enumerate(paths):
+    steps = compile_property(path).steps
+    trie.add(steps[:-1] if containers else steps, i)
+  return trie
+
+
+def get_properties(s: Game, paths) -> List[Any]:
+  """The values of several properties of `s`, in the order of `paths`.
+
+  Each object on a path is looked up once, however many paths share it."""
+  paths = tuple(paths)
+  out = [None] * len(paths)
+  _compile_trie(paths).resolve(s, out)
+  return out
+
+
+def set_properties(s: Game, values: dict):
+  """Sets several properties of `s` at once from a dict of path to value.
+
+  The objects holding the properties are all looked up before any value is
+  set, so do not set both an object and a property inside it in one call."""
+  paths = tuple(values)
+  containers = [None] * len(paths)
+  _compile_trie(paths, containers=True).resolve(s, containers)
+  for path, container in zip(paths, containers):
+    _set_step(container, compile_property(path).steps[-1], values[path])
+
+
 def get_property(s: Game, prop: str, setval=None, get_container=False) -> Any:
   """Gets or sets object property expressed as a string in the format
   that is returned by the generate_mutation_points function."""
-  levels = parse_property_access(prop)
-  
-  parent = None
-  obj = s
-  set_index = len(levels) - 1 # the index of the containing object of the property
-  for level, prop in enumerate(levels):
-    if setval is not None and level == set_index:
-      if type(prop) is int:
-        obj.__setitem__(prop, setval)
-      else:
-        obj.__setattr__(prop, setval)
-    parent = obj
-    if type(prop) is int:
-      obj = obj.__getitem__(prop)
-    else:
-      obj = obj.__getattribute__(prop)
-
-  return parent if get_container else obj
+  path = compile_property(prop)
+  if not path.steps:
+    return None if get_container else s
+  parent = path.container(s)
+  if setval is not None:
+    _set_step(parent, path.steps[-1], setval)
+  return parent if get_container else _step(parent, path.steps[-1])
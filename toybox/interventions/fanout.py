@@ -0,0 +1,72 @@
+"""Applying one intervention to many simulators.
+
+The edit is made once, on the first simulator, with the usual decode/encode
+cycle. Its result is then copied to the other simulators without going back
+through the intervention objects: states as native copies (see Snapshot), and
+configs as one JSON string that each simulator parses."""
+from ctoybox import Toybox
+from toybox.snapshot import Snapshot
+try:
+  import ujson as json
+except:
+  import json
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AbstractContextManager
+import os
+
+
+def _run(fn, items, workers):
+  # ctoybox releases the GIL in native calls, so threads overlap the copies.
+  items = list(items)
+  workers = min(len(items), workers or os.cpu_count() or 1)
+  if workers <= 1:
+    for item in items: fn(item)
+    return
+  with ThreadPoolExecutor(max_workers=workers) as executor:
+    # list() re-raises the first exception from a worker.
+    list(executor.map(fn, items))
+
+
+def broadcast(source: Toybox, toyboxes, config=False, workers=None):
+  """Makes every simulator in `toyboxes` a copy of `source`: its state and, if `config`, its config."""
+  toyboxes = [tb for tb in toyboxes if tb is not source]
+  for tb in toyboxes:
+    assert tb.game_name == source.game_name, 'Cannot copy %s into %s' % (source.game_name, tb.game_name)
+  if config:
+    config_js = json.dumps(source.config_to_json())
+    _run(lambda tb: tb.rsimulator.from_json(config_js), toyboxes, workers)
+  _run(Snapshot.take(source).restore, toyboxes, workers)
+
+
+class FanOutIntervention(AbstractContextManager):
+  """Context manager that applies an intervention to many simulators of the same game.
+
+  Entering returns an intervention of class `clz` on the first simulator, so
+  the body is the same as for a single one::
+
+      with FanOutIntervention(toyboxes, BreakoutIntervention) as intervention:
+        intervention.game.bricks[0].alive = False
+
+  On exit the edited state (or the new config, and the new game started
+  from it) is written to the first simulator, then copied to the others in
+  `workers` threads, so they all end up in the same state. Nothing is copied
+  if the body changed nothing, leaving each simulator in the state it was
+  in, or if the body raised; in that case only the first simulator gets
+  whatever the intervention writes back on exit."""
+
+  def __init__(self, toyboxes, clz, workers=None, **kwargs):
+    self.toyboxes = list(toyboxes)
+    assert self.toyboxes, 'need at least one simulator'
+    self.workers = workers
+    self.intervention = clz(self.toyboxes[0], **kwargs)
+
+  def __enter__(self):
+    return self.intervention.__enter__()
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    dirty_config = self.intervention.dirty_config
+    dirty_state = self.intervention.dirty_state
+    self.intervention.__exit__(exc_type, exc_value, traceback)
+    if exc_type is None and (dirty_config or dirty_state):
+      broadcast(self.toyboxes[0], self.toyboxes, config=dirty_config, workers=self.workers)
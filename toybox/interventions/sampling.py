@@ -0,0 +1,347 @@
+"""Batched sampling of game attributes from fitted models.
+
+Each model is a distribution over one scalar attribute of a game, addressed
+by its property path (as in `get_property`). `StateSampler` draws n values of
+every attribute at once, as arrays, so building many randomized start states
+costs a few NumPy calls per attribute rather than a model call per value.
+
+`ModelStore` fits the models for a set of games and keeps all of them in a
+single memory-mapped file."""
+from toybox.interventions.base import BaseMixin, Collection
+from toybox.interventions.core import get_property, set_properties
+try:
+  import ujson as json
+except:
+  import json
+
+from concurrent.futures import ProcessPoolExecutor
+import importlib
+import logging
+import numpy as np
+import os
+import struct
+import tempfile
+
+
+def _rng(seed):
+  return seed if isinstance(seed, np.random.Generator) else np.random.default_rng(seed)
+
+
+class Bernoulli(object):
+  """Distribution over booleans that are true with probability `p`."""
+
+  def __init__(self, p):
+    self.p = float(p)
+
+  @staticmethod
+  def fit(data):
+    return Bernoulli(np.mean(np.asarray(data, dtype=bool)))
+
+  def sample(self, n, rng=None):
+    return _rng(rng).random(n) < self.p
+
+  def encode(self):
+    return {'p': self.p}, None
+
+  @staticmethod
+  def decode(params, array):
+    return Bernoulli(params['p'])
+
+
+class GaussianKDE(object):
+  """Gaussian kernel density estimate over `data`.
+
+  Sampling picks data points uniformly and adds kernel noise, exactly as
+  sklearn's KernelDensity.sample does, but in two vectorized draws."""
+
+  def __init__(self, data, bandwidth):
+    self.data = np.asarray(data, dtype=float).ravel()
+    self.bandwidth = float(bandwidth)
+
+  @staticmethod
+  def fit(data):
+    # Same bandwidth rule as inf_support.
+    return GaussianKDE(data, len(data)**(-1./5))
+
+  @staticmethod
+  def from_sklearn(kde):
+    """Wraps a fitted sklearn KernelDensity with a gaussian kernel over one feature."""
+    assert kde.kernel == 'gaussian', 'only gaussian kernels can be sampled'
+    return GaussianKDE(np.asarray(kde.tree_.data), kde.bandwidth)
+
+  def sample(self, n, rng=None):
+    rng = _rng(rng)
+    return self.data[rng.integers(0, len(self.data), n)] + rng.normal(0., self.bandwidth, n)
+
+  def inverse_cdf(self, resolution=1024, nsamples=100000, rng=None):
+    """An InverseCDF table approximating this density."""
+    return InverseCDF.fit(self.sample(nsamples, rng), resolution)
+
+  def encode(self):
+    return {'bandwidth': self.bandwidth}, self.data
+
+  @staticmethod
+  def decode(params, array):
+    return GaussianKDE(array, params['bandwidth'])
+
+
+class InverseCDF(object):
+  """Distribution given by its quantiles at evenly spaced probabilities from 0 to 1.
+
+  Sampling interpolates between the quantiles at uniform draws, so its cost
+  does not depend on the size of the data the table was built from."""
+
+  def __init__(self, quantiles):
+    self.quantiles = np.asarray(quantiles, dtype=float)
+    assert len(self.quantiles) > 1, 'need at least two quantiles'
+    self._probs = np.linspace(0., 1., len(self.quantiles))
+
+  @staticmethod
+  def fit(data, resolution=1024):
+    return InverseCDF(np.quantile(np.asarray(data, dtype=float), np.linspace(0., 1., resolution)))
+
+  def sample(self, n, rng=None):
+    return np.interp(_rng(rng).random(n), self._probs, self.quantiles)
+
+  def encode(self):
+    return {}, self.quantiles
+
+  @staticmethod
+  def decode(params, array):
+    return InverseCDF(array)
+
+
+class Rounded(object):
+  """Rounds the draws of `model` to integers, for integer-valued fields."""
+
+  def __init__(self, model):
+    self.model = model
+
+  def sample(self, n, rng=None):
+    return np.rint(self.model.sample(n, rng)).astype(int)
+
+  def encode(self):
+    params, array = self.model.encode()
+    return {'kind': type(self.model).__name__, 'params': params}, array
+
+  @staticmethod
+  def decode(params, array):
+    return Rounded(_KINDS[params['kind']].decode(params['params'], array))
+
+
+_KINDS = {clz.__name__: clz for clz in [Bernoulli, GaussianKDE, InverseCDF, Rounded]}
+
+
+class _Unbatched(object):
+  # Models generated before sample_batch existed only draw one value per call.
+
+  def __init__(self, mod):
+    self.mod = mod
+
+  def sample(self, n, rng=None):
+    return np.array([self.mod.sample() for _ in range(n)])
+
+
+class StateSampler(object):
+  """Draws values for many game attributes at once.
+
+  `models` maps property paths, e.g. `paddle.position.x` or `bricks[3].alive`,
+  to distributions with a `sample(n, rng)` method. `sample` returns one array
+  of n draws per path; `apply` writes the i-th draw of each into a game."""
+
+  def __init__(self, models=None):
+    self.models = dict(models) if models else {}
+
+  def __len__(self):
+    return len(self.models)
+
+  def __setitem__(self, path, model):
+    self.models[path] = model
+
+  def __getitem__(self, path):
+    return self.models[path]
+
+  @staticmethod
+  def from_modelmod(modelmod, paths, module_name=lambda path: path):
+    """Loads the models generated by `make_models` under `modelmod` for each of `paths`.
+
+    `module_name` maps a property path to its module, relative to modelmod."""
+    sampler = StateSampler()
+    for path in paths:
+      mod = importlib.import_module(modelmod + '.' + module_name(path))
+      sampler[path] = getattr(mod, 'model', None) or _Unbatched(mod)
+    return sampler
+
+  def sample(self, n, seed=None) -> dict:
+    """Draws n values for every path; `seed` is an int, None, or a numpy Generator."""
+    rng = _rng(seed)
+    return {path: model.sample(n, rng) for path, model in self.models.items()}
+
+  def apply(self, game, draws, i):
+    """Sets every sampled property of `game` to its i-th draw in `draws`."""
+    set_properties(game, {path: values[i].item() for path, values in draws.items()})
+    return game
+
+
+def _join(prefix, key):
+  return key if not prefix else prefix + '.' + key
+
+
+def scalar_paths(obj, prefix=''):
+  """The property paths of the numeric and boolean fields under `obj` that can be set.
+
+  Collections are expanded element by element, e.g. `bricks[3].alive`."""
+  paths = []
+  for key in obj.eq_keys:
+    val = getattr(obj, key)
+    path = _join(prefix, key)
+    if isinstance(val, Collection):
+      for i, elt in enumerate(val):
+        if isinstance(elt, BaseMixin):
+          paths.extend(scalar_paths(elt, '{}[{}]'.format(path, i)))
+    elif isinstance(val, BaseMixin):
+      paths.extend(scalar_paths(val, path))
+    elif type(val) in (bool, int, float) and key not in obj.immutable_fields:
+      paths.append(path)
+  return paths
+
+
+def collect(games, paths):
+  """The values of each path across `games`; games without a path (e.g. fewer balls) are skipped."""
+  data = {}
+  for path in paths:
+    values = []
+    for game in games:
+      try:
+        values.append(get_property(game, path))
+      except (IndexError, AttributeError):
+        continue
+    data[path] = values
+  return data
+
+
+def fit_model(values, inverse_cdf=False):
+  """Fits a distribution to the values of one attribute; None if they are not numbers."""
+  if not values: return None
+  types = set(type(v) for v in values)
+  if types == {bool}:
+    return Bernoulli.fit(values)
+  if not types <= {int, float}:
+    return None
+  model = InverseCDF.fit(values) if inverse_cdf else GaussianKDE.fit(values)
+  return Rounded(model) if types == {int} else model
+
+
+def _fit_item(item):
+  path, values, inverse_cdf = item
+  return path, fit_model(values, inverse_cdf)
+
+
+class ModelStore(object):
+  """The fitted models of a game's attributes, keyed by property path.
+
+  A store is saved as a single file: a JSON index followed by one float64
+  array holding the data of every model. `load` memory-maps the array, so
+  opening a store is cheap however large it is, and sampling needs no
+  generated modules."""
+
+  suffix = '.models'
+  _MAGIC = b'TBMODEL1'
+  _ALIGN = 64
+
+  def __init__(self, models=None):
+    self.models = dict(models) if models else {}
+
+  def __len__(self):
+    return len(self.models)
+
+  def __contains__(self, path):
+    return path in self.models
+
+  def __getitem__(self, path):
+    return self.models[path]
+
+  @property
+  def paths(self):
+    return list(self.models)
+
+  def sampler(self, paths=None) -> StateSampler:
+    """A StateSampler over `paths`, or over every model in the store."""
+    if paths is None: return StateSampler(self.models)
+    return StateSampler({path: self.models[path] for path in paths})
+
+  @staticmethod
+  def fit(data, inverse_cdf=False, processes=None):
+    """Fits a model to each path in `data` (a dict from path to values), in `processes` worker processes.
+
+    Paths whose values are not numbers or booleans are left out."""
+    items = [(path, values, inverse_cdf) for path, values in data.items()]
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or len(items) < 2:
+      fitted = map(_fit_item, items)
+    else:
+      with ProcessPoolExecutor(max_workers=processes) as executor:
+        fitted = list(executor.map(_fit_item, items, chunksize=max(1, len(items) // (4 * processes))))
+    store = ModelStore()
+    for path, model in fitted:
+      if model is None:
+        logging.debug('No model for %s' % path)
+        continue
+      store.models[path] = model
+    return store
+
+  @staticmethod
+  def from_games(games, paths=None, inverse_cdf=False, processes=None):
+    """Fits models to the attributes of decoded `games`; by default, every path in scalar_paths of the first."""
+    if paths is None: paths = scalar_paths(games[0])
+    return ModelStore.fit(collect(games, paths), inverse_cdf=inverse_cdf, processes=processes)
+
+  def save(self, fname):
+    index = {}
+    arrays = []
+    offset = 0
+    for path, model in self.models.items():
+      params, array = model.encode()
+      length = 0 if array is None else len(array)
+      index[path] = {'kind': type(model).__name__, 'params': params, 'offset': offset, 'length': length}
+      if length:
+        arrays.append(np.asarray(array, dtype='<f8'))
+        offset += length
+    header = json.dumps(index).encode()
+    start = len(self._MAGIC) + 8 + len(header)
+    padding = -start % self._ALIGN
+
+    # Write to a temporary file first so readers never map a partial store.
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(fname)))
+    try:
+      with os.fdopen(fd, 'wb') as f:
+        f.write(self._MAGIC)
+        f.write(struct.pack('<Q', len(header) + padding))
+        f.write(header + b' ' * padding)
+        for array in arrays:
+          f.write(array.tobytes())
+      os.chmod(tmp, 0o644)
+      os.replace(tmp, fname)
+      tmp = None
+    finally:
+      if tmp is not None:
+        try:
+          os.unlink(tmp)
+        except OSError:
+          pass
+
+  @staticmethod
+  def load(fname):
+    with open(fname, 'rb') as f:
+      magic = f.read(len(ModelStore._MAGIC))
+      assert magic == ModelStore._MAGIC, '%s is not a model store' % fname
+      (size,) = struct.unpack('<Q', f.read(8))
+      index = json.loads(f.read(size).decode())
+      start = f.tell()
+    total = sum(entry['length'] for entry in index.values())
+    blob = np.memmap(fname, dtype='<f8', mode='r', offset=start, shape=(total,)) if total else np.zeros(0)
+    store = ModelStore()
+    for path, entry in index.items():
+      array = blob[entry['offset']:entry['offset'] + entry['length']] if entry['length'] else None
+      store.models[path] = _KINDS[entry['kind']].decode(entry['params'], array)
+    return store
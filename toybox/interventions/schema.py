@@ -0,0 +1,108 @@
+"""Cache of the JSON schemas of Toybox game states.
+
+Reading a schema requires a live simulator, so schemas are saved in
+`defaults/`, one file per ctoybox version, and only generated for games
+missing from that file. Game classes refer to their schema through
+`StateSchema` and `RequiredKeys`, which read it on first access."""
+from ctoybox import Toybox
+try:
+  import ujson as json
+except:
+  import json
+
+import os
+import tempfile
+
+SCHEMA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'defaults')
+
+_schemas = None
+_version = None
+
+
+def ctoybox_version():
+  global _version
+  if _version is None:
+    from importlib.metadata import version, PackageNotFoundError
+    try:
+      _version = version('ctoybox')
+    except PackageNotFoundError:
+      _version = 'unknown'
+  return _version
+
+
+def schema_path(version=None):
+  return os.path.join(SCHEMA_DIR, 'state_schemas_%s.json' % (version or ctoybox_version()))
+
+
+def _load():
+  try:
+    with open(schema_path()) as f:
+      return json.load(f)
+  except (OSError, ValueError):
+    return {}
+
+
+def _save(schemas):
+  # Write to a temporary file of this process first, so that concurrent
+  # workers never read a partial file. Workers generating different games at
+  # the same time can still replace the file without each other's games
+  # (merging with the file as it is now only narrows the window); that is
+  # acceptable, since a game missing from the file is just generated again.
+  tmp = None
+  try:
+    merged = _load()
+    merged.update(schemas)
+    fd, tmp = tempfile.mkstemp(dir=SCHEMA_DIR, suffix='.json')
+    with os.fdopen(fd, 'w') as f:
+      json.dump(merged, f, indent=2, sort_keys=True)
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, schema_path())
+    tmp = None
+  except OSError:
+    # Read-only installs just regenerate missing schemas in every process.
+    pass
+  finally:
+    if tmp is not None:
+      try:
+        os.unlink(tmp)
+      except OSError:
+        pass
+
+
+def state_schema(game_name):
+  """Returns the schema of game_name's state, as returned by `Toybox.schema_for_state`."""
+  global _schemas
+  if _schemas is None:
+    _schemas = _load()
+  if game_name not in _schemas:
+    with Toybox(game_name) as tb:
+      _schemas[game_name] = tb.schema_for_state()
+    _save(_schemas)
+  return _schemas[game_name]
+
+
+class StateSchema(object):
+  """Class attribute for a game's state schema, loaded the first time it is read."""
+
+  def __init__(self, game_name):
+    self.game_name = game_name
+    self.value = None
+
+  def select(self, schema):
+    return schema
+
+  def __get__(self, obj, owner):
+    if self.value is None:
+      self.value = self.select(state_schema(self.game_name))
+    return self.value
+
+
+class RequiredKeys(StateSchema):
+  """Class attribute for the required keys of a game's state, less any in exclude."""
+
+  def __init__(self, game_name, exclude=()):
+    super().__init__(game_name)
+    self.exclude = exclude
+
+  def select(self, schema):
+    return [k for k in schema['required'] if k not in self.exclude]
@@ -1,5 +1,6 @@
 from toybox.interventions.base import *
 from toybox.interventions.core import *
+from toybox.interventions.schema import RequiredKeys
 try:
     import ujson as json
 except:
@@ -8,9 +9,8 @@ except:
 
 class SpaceInvaders(Game):
 
-    with Toybox('space_invaders') as tb:
-        expected_keys = tb.schema_for_state()['required']
-        eq_keys = [k for k in expected_keys if k != 'rand']
+    expected_keys = RequiredKeys('space_invaders')
+    eq_keys = RequiredKeys('space_invaders', exclude=['rand'])
     immutable_fields = Game.immutable_fields
 
     def __init__(self, intervention,
@@ -21,10 +21,10 @@ class SpaceInvaders(Game):
         super().__init__(intervention, score, lives, rand, level)
         self.ship               =               Player.decode(intervention, ship,             Player)
         self.ship_laser         =                Laser.decode(intervention, ship_laser,       Laser) if ship_laser else None
-        self.shields            = SpriteDataCollection.decode(intervention, shields,          SpriteDataCollection)
-        self.enemies            =      EnemyCollection.decode(intervention, enemies,          EnemyCollection)
+        self.decode_lazily('shields', shields, SpriteDataCollection)
+        self.decode_lazily('enemies', enemies, EnemyCollection)
         self.enemies_movement   = EnemiesMovementState.decode(intervention, enemies_movement, EnemiesMovementState)
-        self.enemy_lasers       =      LaserCollection.decode(intervention, enemy_lasers,     LaserCollection)
+        self.decode_lazily('enemy_lasers', enemy_lasers, LaserCollection)
         self.ufo                =                  Ufo.decode(intervention, ufo,              Ufo)
 
         self.life_display_timer = life_display_timer
@@ -111,11 +111,12 @@ class Ufo(BaseMixin):
         self.death_counter      = death_counter
         self._in_init = False
 
-class Enemy(BaseMixin):
+class Enemy(CompactMixin):
 
     expected_keys = ['x', 'y', 'row', 'col', 'id', 'alive', 'points', 'death_counter']
     immutable_fields = ['intervention']
     eq_keys = [k for k in expected_keys if k != 'id']
+    __slots__ = expected_keys
 
     def __init__(self, intervention, x=None, y=None, row=None, col=None, id=None, alive=None, points=None, death_counter=None):
 
@@ -158,9 +159,9 @@ class EnemiesMovementState(BaseMixin):
 
 class SpaceInvadersIntervention(Intervention):
 
-    def __init__(self, tb, game_name='space_invaders'):
+    def __init__(self, tb, game_name='space_invaders', lazy=False):
         # check that the simulation in tb matches the game name.
-        Intervention.__init__(self, tb, game_name, SpaceInvaders)
+        Intervention.__init__(self, tb, game_name, SpaceInvaders, lazy=lazy)
 
     def get_jitter(self): 
         return self.config['jitter']
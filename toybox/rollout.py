@@ -0,0 +1,206 @@
+"""Counterfactual rollouts: fork a state into intervened variants and run them side by side.
+
+`RolloutEngine.run` restores a base Snapshot once per variant, applies the
+variant's intervention, then steps all variants together for a number of
+steps, in worker processes. Each step, the policy picks actions for every
+variant from one batch of frames, and the engine yields one record per
+variant with its score, lives and the requested features."""
+from ctoybox import Toybox
+from toybox.snapshot import Snapshot
+
+import multiprocessing as mp
+import numpy as np
+import os
+import traceback
+
+
+class oracle(object):
+  """A feature computed by an intervention method, e.g. `oracle(BreakoutIntervention, 'channel_count')`.
+
+  The state is decoded lazily, so the method only pays for what it reads."""
+
+  def __init__(self, clz, method, *args, **kwargs):
+    self.clz = clz
+    self.method = method
+    self.args = args
+    self.kwargs = kwargs
+
+  def __call__(self, toybox):
+    with self.clz(toybox, lazy=True) as intervention:
+      return getattr(intervention, self.method)(*self.args, **self.kwargs)
+
+
+class _Shard(object):
+  # The simulators of some of the variants. Runs in a worker process, or in
+  # the calling process when the engine has no workers. Frames are rendered
+  # into the shared `frames` buffer, at the variants' slots.
+
+  def __init__(self, game_name, grayscale, clz, base, variants, features, frames, shape, slots):
+    self.names = [name for name, _ in variants]
+    self.features = features
+    self.renderers = None
+    if frames is not None:
+      # Only imported when rendering; the envs package pulls in gym.
+      from toybox.envs.atari.render import FrameRenderer
+      frames = np.frombuffer(frames, dtype=np.uint8).reshape(shape)
+      self.renderers = [FrameRenderer(frames[slot]) for slot in slots]
+    self.toyboxes = []
+    for name, intervene in variants:
+      tb = Toybox(game_name, grayscale)
+      base.restore(tb)
+      if intervene is not None:
+        with clz(tb) as intervention:
+          intervene(intervention)
+      self.toyboxes.append(tb)
+    self.done = [False] * len(self.toyboxes)
+
+  def record(self, i, step, action):
+    tb = self.toyboxes[i]
+    record = {'variant': self.names[i], 'step': step, 'action': action,
+              'score': tb.get_score(), 'lives': tb.get_lives(), 'done': self.done[i]}
+    for key, feature in self.features.items():
+      record[key] = feature(tb)
+    if self.renderers is not None:
+      self.renderers[i].render(tb)
+    return record
+
+  def start(self):
+    return [self.record(i, 0, None) for i in range(len(self.toyboxes))]
+
+  def step(self, step, actions):
+    records = []
+    for i, tb in enumerate(self.toyboxes):
+      if self.done[i]: continue
+      tb.apply_ale_action(actions[i])
+      # ALE semantics, as in MockALE.game_over.
+      self.done[i] = tb.get_lives() <= 0
+      records.append(self.record(i, step, actions[i]))
+    return records
+
+
+def _worker(remote, parent_remote, args):
+  # Replies are ('ok', records), or ('error', traceback) before exiting.
+  parent_remote.close()
+  try:
+    shard = _Shard(*args)
+    remote.send(('ok', shard.start()))
+    while True:
+      cmd, data = remote.recv()
+      if cmd == 'step':
+        remote.send(('ok', shard.step(*data)))
+      elif cmd == 'close':
+        break
+  except KeyboardInterrupt:
+    pass
+  except Exception:
+    try:
+      remote.send(('error', traceback.format_exc()))
+    except (BrokenPipeError, EOFError):
+      pass
+  finally:
+    remote.close()
+
+
+def _recv(remote):
+  status, result = remote.recv()
+  if status == 'error':
+    raise RuntimeError('Rollout worker failed:\n' + result)
+  return result
+
+
+class RolloutEngine(object):
+  """Runs intervened variants of a game state forward under a batched policy.
+
+  `clz` is the intervention class for the game, e.g. BreakoutIntervention.
+  `features` maps record keys to functions of a Toybox (see `oracle`).
+  Variants are split among `processes` worker processes (default: one per
+  CPU, at most one per variant); with `processes=0` everything runs in the
+  calling process.
+
+  Workers are started with the default multiprocessing start method; where
+  that is not fork, the variants' interventions and the features have to be
+  picklable."""
+
+  def __init__(self, game_name, clz, features=None, processes=None, grayscale=True):
+    self.game_name = game_name
+    self.clz = clz
+    self.features = dict(features) if features else {}
+    self.processes = processes
+    self.grayscale = grayscale
+
+  def run(self, base: Snapshot, variants: dict, steps: int, policy=None):
+    """Yields per-step records for each variant of `base`.
+
+    `variants` maps a name to a function applying an intervention to an open
+    intervention of class `clz` (or None for the unmodified state). Step 0
+    records the variants right after the interventions. At each later step,
+    `policy(frames)` gets a (variants, height, width, channels) uint8 array of
+    the current frames, in the order of `variants`, and returns one ALE action
+    per variant; without a policy, every variant takes NOOP and no frames are
+    rendered. A variant stops once its game is over. The records of a step
+    come in the order of `variants`, however the variants are split among
+    the workers. An exception in a worker process is raised here as a
+    RuntimeError with its traceback."""
+    assert base.game_name == self.game_name, 'Cannot run a %s state as %s' % (base.game_name, self.game_name)
+    items = list(variants.items())
+    nprocs = self.processes if self.processes is not None else os.cpu_count() or 1
+    nprocs = min(nprocs, len(items))
+    shards = [list(range(len(items)))[p::max(nprocs, 1)] for p in range(max(nprocs, 1))]
+
+    shared, frames, shape = None, None, None
+    if policy is not None:
+      with Toybox(self.game_name, self.grayscale) as tb:
+        shape = (len(items), tb.get_height(), tb.get_width(), 1 if self.grayscale else 4)
+      shared = mp.RawArray('B', int(np.prod(shape)))
+      frames = np.frombuffer(shared, dtype=np.uint8).reshape(shape)
+
+    def shard_args(slots):
+      return (self.game_name, self.grayscale, self.clz, base, [items[i] for i in slots],
+              self.features, shared, shape, slots)
+
+    def actions():
+      if policy is None: return [0] * len(items)
+      actions = list(policy(frames))
+      assert len(actions) == len(items), 'expected {} actions, got {}'.format(len(items), len(actions))
+      return actions
+
+    if nprocs == 0:
+      local = _Shard(*shard_args(shards[0]))
+      yield from local.start()
+      for step in range(1, steps + 1):
+        if all(local.done): return
+        yield from local.step(step, actions())
+      return
+
+    order = {name: i for i, (name, _) in enumerate(items)}
+    def gather():
+      records = [record for remote in remotes for record in _recv(remote)]
+      return sorted(records, key=lambda record: order[record['variant']])
+
+    remotes, processes = [], []
+    for slots in shards:
+      remote, work_remote = mp.Pipe()
+      process = mp.Process(target=_worker, args=(work_remote, remote, shard_args(slots)), daemon=True)
+      process.start()
+      work_remote.close()
+      remotes.append(remote)
+      processes.append(process)
+    try:
+      done = set()
+      yield from gather()
+      for step in range(1, steps + 1):
+        if len(done) == len(items): return
+        chosen = actions()
+        for remote, slots in zip(remotes, shards):
+          remote.send(('step', (step, [chosen[i] for i in slots])))
+        for record in gather():
+          if record['done']: done.add(record['variant'])
+          yield record
+    finally:
+      for remote in remotes:
+        try:
+          remote.send(('close', None))
+        except (BrokenPipeError, EOFError):
+          pass
+      for process in processes:
+        process.join()
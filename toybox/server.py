@@ -0,0 +1,416 @@
+"""A local server hosting Toybox simulators for many client processes.
+
+Trainers and evaluators on one machine connect to a `SimulationServer` over
+a Unix socket instead of each running their own simulators. The server keeps
+a pool of simulators keyed by game, config and frame format; a client borrows
+some with `make`, steps them in batches, and hands them back when it closes
+(or disconnects), so they can be reused by the next client.
+
+Frames are not sent over the socket: each `make` allocates a memory-mapped
+frame file, preferably in /dev/shm, that the server renders into and the
+client maps read-only. A batched step costs one round trip of actions and
+rewards, whatever the frame size. The client removes the file as soon as it
+has mapped it, and a starting server removes any left by servers that died.
+
+Requests are pickled, so connections are authenticated. Unless given an
+authkey, the server makes a random one and writes it to a key file next to
+the socket (see `key_path`), readable only by its owner, as is the socket;
+clients started by the same user read it from there.
+
+    python -m toybox.server /tmp/toybox.sock
+
+    client = SimulationClient('/tmp/toybox.sock')
+    envs = client.make('breakout', 8)
+    obs, rewards, dones, infos = client.step(envs, [1] * 8)"""
+from ctoybox import Toybox
+from toybox.snapshot import Snapshot
+try:
+  import ujson as json
+except:
+  import json
+
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+import argparse
+import glob
+import logging
+import numpy as np
+import os
+import tempfile
+import threading
+
+
+FRAMES_PREFIX = 'toybox-frames-'
+
+
+def key_path(address):
+  """The file holding the authkey of a server at `address` that generated its own."""
+  return address + '.key'
+
+
+def _frames_dir():
+  return '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+
+def _remove_stale_frames():
+  # Frame files are named after the server's pid; remove those of servers
+  # that are no longer running.
+  for path in glob.glob(os.path.join(_frames_dir(), FRAMES_PREFIX + '*')):
+    try:
+      pid = int(os.path.basename(path)[len(FRAMES_PREFIX):].split('-')[0])
+      os.kill(pid, 0)
+    except ValueError:
+      continue
+    except ProcessLookupError:
+      try:
+        os.unlink(path)
+      except OSError:
+        pass
+    except OSError:
+      # Running, as another user.
+      pass
+
+
+def _pool_key(game_name, config, grayscale):
+  return (game_name, None if config is None else json.dumps(config, sort_keys=True), grayscale)
+
+
+class _Frames(object):
+  # A frame file shared by the simulators of one `make`. The client removes
+  # it once mapped; failing that, it is removed when the last of them is
+  # released.
+
+  def __init__(self, shape):
+    prefix = '%s%d-' % (FRAMES_PREFIX, os.getpid())
+    fd, self.path = tempfile.mkstemp(prefix=prefix, dir=_frames_dir())
+    os.close(fd)
+    self.array = np.memmap(self.path, dtype=np.uint8, mode='w+', shape=shape)
+    self.users = shape[0]
+
+  def release(self):
+    self.users -= 1
+    if self.users == 0:
+      self.array = None
+      try:
+        os.unlink(self.path)
+      except FileNotFoundError:
+        pass
+
+
+class _Sim(object):
+  # A simulator lent to a client, and the frame slot it renders into.
+
+  def __init__(self, key, toybox, frames, slot):
+    from toybox.envs.atari.render import FrameRenderer
+    self.key = key
+    self.toybox = toybox
+    self.frames = frames
+    self.renderer = FrameRenderer(frames.array[slot])
+    self.score = toybox.get_score()
+
+  def render(self):
+    self.renderer.render(self.toybox)
+    self.score = self.toybox.get_score()
+    return self.toybox.get_lives(), self.score
+
+
+class SimulationServer(object):
+  """Serves pooled simulators to SimulationClients connecting at `address`, a Unix socket path.
+
+  Each connection is handled in its own thread; the simulators release the
+  GIL while stepping, so clients run concurrently. Up to `max_idle`
+  released simulators are kept per game and config for reuse.
+
+  Clients must present `authkey` (bytes). Without one, a random key is
+  generated and written to `key_path(address)`, which is removed on close."""
+
+  def __init__(self, address, authkey=None, max_idle=64):
+    self.address = address
+    self.key_file = None
+    if authkey is None:
+      authkey = os.urandom(32)
+      self.key_file = key_path(address)
+      fd = os.open(self.key_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+      with os.fdopen(fd, 'wb') as f:
+        os.fchmod(f.fileno(), 0o600)
+        f.write(authkey)
+    self.authkey = authkey
+    self.max_idle = max_idle
+    _remove_stale_frames()
+    self.listener = Listener(address, family='AF_UNIX', authkey=authkey)
+    os.chmod(address, 0o600)
+    self.closed = False
+    self._lock = threading.Lock()
+    self._idle = {}
+    self._sims = {}
+    self._next_id = 0
+    self._thread = None
+
+  def start(self):
+    """Serves from a background thread; returns the server."""
+    self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+    self._thread.start()
+    return self
+
+  def serve_forever(self):
+    try:
+      while not self.closed:
+        try:
+          conn = self.listener.accept()
+        except AuthenticationError:
+          logging.warning('Rejected a connection with the wrong authkey')
+          continue
+        except OSError:
+          if self.closed: break
+          logging.exception('Failed to accept a connection')
+          continue
+        if self.closed:
+          conn.close()
+          break
+        threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+    finally:
+      self.listener.close()
+
+  def close(self):
+    if self.closed: return
+    self.closed = True
+    if self._thread is not None:
+      # accept() is not interrupted by closing the socket; wake it instead.
+      try:
+        Client(self.address, family='AF_UNIX', authkey=self.authkey).close()
+      except OSError:
+        pass
+      self._thread.join()
+    else:
+      self.listener.close()
+    if self.key_file is not None:
+      try:
+        os.unlink(self.key_file)
+      except FileNotFoundError:
+        pass
+
+  def stats(self) -> dict:
+    """The number of simulators lent out and kept idle."""
+    with self._lock:
+      return {'active': len(self._sims), 'idle': sum(len(tbs) for tbs in self._idle.values())}
+
+  def _serve(self, conn):
+    owned = set()
+    handlers = {
+      'make': self._make,
+      'step': self._step,
+      'reset': self._reset,
+      'seed': self._seed,
+      'snapshot': self._snapshot,
+      'restore': self._restore,
+      'release': self._release,
+      'stats': lambda owned: self.stats(),
+    }
+    try:
+      while True:
+        try:
+          cmd, args = conn.recv()
+        except (EOFError, OSError):
+          break
+        try:
+          assert cmd in handlers, 'Unknown command %s' % cmd
+          reply = ('ok', handlers[cmd](owned, *args))
+        except Exception as e:
+          reply = ('error', e)
+        try:
+          conn.send(reply)
+        except (EOFError, OSError):
+          break
+    finally:
+      # Simulators of clients that went away go back to the pool.
+      self._release(owned, list(owned))
+      conn.close()
+
+  def _owned(self, owned, ids):
+    for i in ids:
+      if i not in owned:
+        raise ValueError('Unknown simulator %s' % i)
+    return [self._sims[i] for i in ids]
+
+  def _make(self, owned, game_name, n, config=None, grayscale=True):
+    key = _pool_key(game_name, config, grayscale)
+    with self._lock:
+      idle = self._idle.get(key, [])
+      reused = [idle.pop() for _ in range(min(n, len(idle)))]
+    toyboxes = []
+    for _ in range(n):
+      if reused:
+        tb = reused.pop()
+        # Start it over as a new Toybox would, so that the seed and RNG
+        # position of the previous client do not carry over.
+        tb.__init__(game_name, grayscale)
+      else:
+        tb = Toybox(game_name, grayscale)
+      if config is not None:
+        tb.write_config_json(config)
+        tb.new_game()
+      toyboxes.append(tb)
+
+    tb = toyboxes[0]
+    frames = _Frames((n, tb.get_height(), tb.get_width(), 1 if grayscale else 4))
+    sims = [_Sim(key, tb, frames, slot) for slot, tb in enumerate(toyboxes)]
+    with self._lock:
+      ids = list(range(self._next_id, self._next_id + n))
+      self._next_id += n
+      self._sims.update(zip(ids, sims))
+    owned.update(ids)
+    for sim in sims:
+      sim.render()
+    return {'ids': ids, 'path': frames.path, 'shape': frames.array.shape,
+            'actions': tb.get_legal_action_set()}
+
+  def _step(self, owned, ids, actions):
+    results = []
+    for sim, action in zip(self._owned(owned, ids), actions):
+      sim.toybox.apply_ale_action(action)
+      before = sim.score
+      lives, score = sim.render()
+      # ALE semantics, as in MockALE.game_over.
+      done = lives <= 0
+      results.append((max(score - before, 0), done, lives, score))
+    return results
+
+  def _reset(self, owned, ids):
+    sims = self._owned(owned, ids)
+    for sim in sims:
+      sim.toybox.new_game()
+    return [sim.render() for sim in sims]
+
+  def _seed(self, owned, ids, seeds):
+    sims = self._owned(owned, ids)
+    for sim, seed in zip(sims, seeds):
+      sim.toybox.set_seed(seed)
+      sim.toybox.new_game()
+    return [sim.render() for sim in sims]
+
+  def _snapshot(self, owned, ids):
+    return [Snapshot.take(sim.toybox) for sim in self._owned(owned, ids)]
+
+  def _restore(self, owned, ids, snapshots):
+    sims = self._owned(owned, ids)
+    for sim, snapshot in zip(sims, snapshots):
+      snapshot.restore(sim.toybox)
+    return [sim.render() for sim in sims]
+
+  def _release(self, owned, ids):
+    sims = self._owned(owned, ids)
+    owned.difference_update(ids)
+    with self._lock:
+      for i, sim in zip(ids, sims):
+        del self._sims[i]
+        sim.frames.release()
+        idle = self._idle.setdefault(sim.key, [])
+        if len(idle) < self.max_idle:
+          idle.append(sim.toybox)
+
+
+class SimulationClient(object):
+  """A connection to a SimulationServer.
+
+  `make` borrows simulators from the server as envs (see RemoteToyboxEnv);
+  `step`, `reset`, `snapshot` and `restore` act on a batch of them in one
+  request. Requests from different threads are serialized. Without an
+  `authkey`, the one the server wrote to `key_path(address)` is used."""
+
+  def __init__(self, address, authkey=None):
+    if authkey is None:
+      with open(key_path(address), 'rb') as f:
+        authkey = f.read()
+    self.conn = Client(address, family='AF_UNIX', authkey=authkey)
+    self._lock = threading.Lock()
+
+  def call(self, cmd, *args):
+    with self._lock:
+      self.conn.send((cmd, args))
+      status, result = self.conn.recv()
+    if status == 'error':
+      raise result
+    return result
+
+  def make(self, game_name, n=1, config=None, grayscale=True) -> list:
+    """Borrows n simulators of `game_name`, with `config` (a config JSON dict) if given, as RemoteToyboxEnvs."""
+    from toybox.envs.atari.remote import RemoteToyboxEnv
+    reply = self.call('make', game_name, n, config, grayscale)
+    frames = np.memmap(reply['path'], dtype=np.uint8, mode='r', shape=tuple(reply['shape']))
+    # The mapping outlives the file; removing it now means nothing is left
+    # behind if either side crashes.
+    try:
+      os.unlink(reply['path'])
+    except OSError:
+      pass
+    return [RemoteToyboxEnv(self, sim_id, game_name, frames[slot], reply['actions'])
+            for slot, sim_id in enumerate(reply['ids'])]
+
+  def step(self, envs, actions):
+    """Steps every env with the action at the same index; returns stacked observations, rewards, dones and infos."""
+    assert len(envs) == len(actions), 'expected {} actions, got {}'.format(len(envs), len(actions))
+    ale_actions = [env._action_set[a] for env, a in zip(envs, actions)]
+    results = self.call('step', [env.sim_id for env in envs], ale_actions)
+    rewards, dones, infos = [], [], []
+    for env, (reward, done, lives, score) in zip(envs, results):
+      env._lives = lives
+      rewards.append(reward)
+      dones.append(done)
+      infos.append({'lives': lives, 'score': 0 if done else score})
+    return np.stack([env._frame for env in envs]), np.array(rewards), np.array(dones), infos
+
+  def _update(self, envs, results):
+    for env, (lives, _) in zip(envs, results):
+      env._lives = lives
+    return np.stack([env._frame for env in envs])
+
+  def reset(self, envs):
+    """Starts a new game in every env; returns the stacked first observations."""
+    return self._update(envs, self.call('reset', [env.sim_id for env in envs]))
+
+  def seed(self, envs, seeds):
+    return self._update(envs, self.call('seed', [env.sim_id for env in envs], list(seeds)))
+
+  def snapshot(self, envs) -> list:
+    return self.call('snapshot', [env.sim_id for env in envs])
+
+  def restore(self, envs, snapshots):
+    """Returns every env to the Snapshot at the same index; returns the stacked observations."""
+    return self._update(envs, self.call('restore', [env.sim_id for env in envs], list(snapshots)))
+
+  def release(self, envs):
+    """Hands the envs' simulators back to the server."""
+    ids = [env.sim_id for env in envs if env.sim_id is not None]
+    for env in envs:
+      env.sim_id = None
+    if ids and not self.conn.closed:
+      self.call('release', ids)
+
+  def stats(self) -> dict:
+    return self.call('stats')
+
+  def close(self):
+    # The server releases everything this client still holds.
+    self.conn.close()
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Serve Toybox simulators to local clients')
+  parser.add_argument('address', help='path of the Unix socket to listen on')
+  parser.add_argument('--max-idle', type=int, default=64,
+                      help='released simulators to keep per game and config')
+  parser.add_argument('--authkey',
+                      help='key clients must present; by default a random one is written to ADDRESS.key')
+  args = parser.parse_args(argv)
+  authkey = args.authkey.encode() if args.authkey is not None else None
+  server = SimulationServer(args.address, authkey=authkey, max_idle=args.max_idle)
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.close()
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,55 @@
+"""Cheap copies of Toybox game states, for search and counterfactual rollouts."""
+from ctoybox import Toybox, State
+from ctoybox.ffi import lib
+try:
+  import ujson as json
+except:
+  import json
+
+
+class Snapshot(object):
+  """A copy of a game state that can be restored into any Toybox running the same game.
+
+  Snapshots hold the simulator's native state, so taking and restoring them never
+  goes through JSON. Pickling a snapshot (e.g. to hand it to another process)
+  falls back on the state JSON, the only serialized form ctoybox offers; JSON is
+  also produced on demand by ``to_json`` and cached.
+  """
+
+  __slots__ = ['game_name', '_state', '_json']
+
+  def __init__(self, game_name: str, state: State = None, js: dict = None):
+    assert state is not None or js is not None
+    self.game_name = game_name
+    self._state = state
+    self._json = js
+
+  @staticmethod
+  def take(toybox: Toybox) -> 'Snapshot':
+    """Copies the current state of toybox."""
+    return Snapshot(toybox.game_name, toybox.rstate.clone())
+
+  def restore(self, toybox: Toybox):
+    """Replaces the current state of toybox with a copy of this snapshot."""
+    assert toybox.game_name == self.game_name, 'Cannot restore a %s snapshot into %s' % (self.game_name, toybox.game_name)
+    if self._state is None:
+      toybox.write_state_json(self._json)
+      # Keep the native state around so later restores are cheap.
+      self._state = toybox.rstate.clone()
+    else:
+      toybox.rstate = State(toybox.rsimulator, state=lib.state_clone(self._state.get_state()))
+
+  def to_json(self) -> dict:
+    """The JSON representation of the snapshot, as returned by ``Toybox.state_to_json``."""
+    if self._json is None:
+      self._json = self._state.to_json()
+    return self._json
+
+  def __getstate__(self):
+    return (self.game_name, json.dumps(self.to_json()))
+
+  def __setstate__(self, state):
+    game_name, js = state
+    self.game_name = game_name
+    self._state = None
+    self._json = json.loads(js)